@@ -0,0 +1,190 @@
+"""Local stand-in for the OpenAI Responses API, for load tests.
+
+    python bench/fake_responses_api.py --port 8765 --latency 2 --jitter 0.5 --error-rate 0.02
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 and any
+OPENAI_API_KEY. Structured grading requests get full points for every rubric
+line in the prompt (like GRADER_BACKEND=fake); rubric requests get three equal
+criteria. A share of requests fail with 429 (with Retry-After) or 500 so the
+retry and circuit-breaker paths are exercised. GET /stats returns counters.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.graders import RUBRIC_LINE, RUBRIC_TOTAL, _request_text  # noqa: E402
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def enter(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self, error: bool):
+        with self.lock:
+            self.in_flight -= 1
+            self.errors += int(error)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+            }
+
+
+def structured_output(request: dict) -> dict:
+    schema = request.get('text', {}).get('format', {}).get('schema', {})
+    text = _request_text(request)
+    if 'rubric_scores' in schema.get('properties', {}):
+        scores = [
+            {'label': match['label'], 'score': float(match['points']), 'status': 'correct'}
+            for match in RUBRIC_LINE.finditer(text)
+        ]
+        return {
+            'total_score': sum(score['score'] for score in scores),
+            'rubric_scores': scores,
+            'feedback': 'Graded by the load-test stand-in.',
+        }
+    match = RUBRIC_TOTAL.search(text)
+    total = float(match['total']) if match else 10.0
+    return {'items': [{'label': f'Criterion {idx}', 'points': total / 3} for idx in range(1, 4)]}
+
+
+def response_body(request: dict) -> dict:
+    text = json.dumps(structured_output(request))
+    images = sum(
+        1
+        for message in request.get('input', [])
+        if isinstance(message.get('content'), list)
+        for item in message['content']
+        if item.get('type') == 'input_image'
+    )
+    # Roughly what the real API bills: ~4 characters per token, 765 tokens per high-detail image.
+    input_tokens = len(_request_text(request)) // 4 + 765 * images
+    return {
+        'id': f'resp_{uuid.uuid4().hex}',
+        'object': 'response',
+        'created_at': int(time.time()),
+        'status': 'completed',
+        'model': request.get('model', 'fake'),
+        'output': [
+            {
+                'id': f'msg_{uuid.uuid4().hex}',
+                'type': 'message',
+                'role': 'assistant',
+                'status': 'completed',
+                'content': [{'type': 'output_text', 'text': text, 'annotations': []}],
+            }
+        ],
+        'parallel_tool_calls': False,
+        'tool_choice': 'auto',
+        'tools': [],
+        'usage': {
+            'input_tokens': input_tokens,
+            'input_tokens_details': {'cached_tokens': 0},
+            'output_tokens': len(text) // 4,
+            'output_tokens_details': {'reasoning_tokens': 0},
+            'total_tokens': input_tokens + len(text) // 4,
+        },
+    }
+
+
+def make_handler(options, stats: Stats):
+    rnd = random.Random(options.seed)
+    rnd_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            if options.verbose:
+                super().log_message(format, *args)
+
+        def send_json(self, status: int, body: dict, headers: dict | None = None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                self.send_json(200, stats.as_dict())
+            else:
+                self.send_json(404, {'error': {'message': 'Not found'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.rstrip('/').endswith('/responses'):
+                self.send_json(404, {'error': {'message': f'{self.path} is not served by the stand-in'}})
+                return
+            with rnd_lock:
+                delay = max(0.0, rnd.gauss(options.latency, options.jitter))
+                roll = rnd.random()
+            stats.enter()
+            failed = roll < options.error_rate
+            try:
+                time.sleep(delay)
+                if failed and roll < options.error_rate / 2:
+                    self.send_json(
+                        429,
+                        {'error': {'message': 'Rate limit reached (stand-in).', 'type': 'rate_limit_exceeded'}},
+                        {'retry-after': str(options.retry_after)},
+                    )
+                elif failed:
+                    self.send_json(500, {'error': {'message': 'Internal error (stand-in).', 'type': 'server_error'}})
+                else:
+                    self.send_json(200, response_body(request))
+            finally:
+                stats.leave(failed)
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=2.0, help='Mean seconds per response.')
+    parser.add_argument('--jitter', type=float, default=0.5, help='Standard deviation of the latency.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 429/500.')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true')
+    options = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(options, Stats()))
+    server.daemon_threads = True
+    print(f'Fake Responses API on http://{options.host}:{options.port}/v1', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
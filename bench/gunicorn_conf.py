@@ -0,0 +1,48 @@
+"""gunicorn settings for load tests that also record worker saturation.
+
+Workers count requests in flight in a counter shared through the master (set up
+before forking); the master samples it every BENCH_SAMPLE_SECONDS and appends
+"unix_time busy capacity" lines to BENCH_SATURATION_FILE.
+
+    BENCH_WORKERS=4 BENCH_THREADS=4 gunicorn config.wsgi:application -c bench/gunicorn_conf.py
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+bind = os.getenv('BENCH_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('BENCH_WORKERS', '4'))
+threads = int(os.getenv('BENCH_THREADS', '1'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('BENCH_TIMEOUT', '120'))
+backlog = 2048
+
+_busy = multiprocessing.Value('i', 0)
+
+
+def pre_request(worker, req):
+    with _busy.get_lock():
+        _busy.value += 1
+
+
+def post_request(worker, req, environ, resp):
+    with _busy.get_lock():
+        _busy.value -= 1
+
+
+def when_ready(server):
+    path = os.getenv('BENCH_SATURATION_FILE')
+    if not path:
+        return
+    interval = float(os.getenv('BENCH_SAMPLE_SECONDS', '0.1'))
+    capacity = workers * threads
+
+    def sample():
+        with open(path, 'a') as out:
+            while True:
+                out.write(f'{time.time():.3f} {_busy.value} {capacity}\n')
+                out.flush()
+                time.sleep(interval)
+
+    threading.Thread(target=sample, name='saturation-sampler', daemon=True).start()
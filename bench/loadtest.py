@@ -0,0 +1,558 @@
+"""Deadline-surge load test: the app under gunicorn, grade workers and a fake Responses API.
+
+    python manage.py seed_scale          # once
+    python bench/loadtest.py --duration 120 --students 80 --professors 5
+
+Starts bench/fake_responses_api.py, gunicorn (with bench/gunicorn_conf.py) and
+`manage.py grade_worker` processes against the configured database, then replays
+traffic as seeded users:
+
+- students browse, then upload and finalize the problems of the problem set due
+  next in their class, arriving faster towards the end of the run as they would
+  before a deadline;
+- professors open their dashboard, submission lists, grading stats and appeals;
+- a burst of students request regrades at the same moment.
+
+Reports throughput and p50/p95/p99 latency per URL name, gunicorn worker
+saturation, and how long the grading queue took to drain afterwards.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from functools import lru_cache
+from http.cookies import SimpleCookie
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import close_old_connections  # noqa: E402
+from django.urls import Resolver404, resolve  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+from core import models  # noqa: E402
+
+FINALIZE_LINK = re.compile(r'/student/submissions/(\d+)/finalize/')
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+@lru_cache(maxsize=None)
+def route_name(path: str) -> str:
+    try:
+        return resolve(urlsplit(path).path).url_name or path
+    except Resolver404:
+        return path
+
+
+def multipart(fields: dict, files: list[tuple[str, str, str, bytes]]) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, content_type, content in files:
+        body.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode()
+        )
+        body.write(content + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (route, method, status, elapsed_ms, started_at)
+
+    def record(self, *sample):
+        self.samples.append(sample)
+
+
+class Session:
+    """One simulated browser: its own keep-alive connection and cookies; redirects are not followed."""
+
+    def __init__(self, base_url: str, recorder: Recorder, timeout: float):
+        parts = urlsplit(base_url)
+        self.base_url = base_url.rstrip('/')
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        self.recorder = recorder
+        self.cookies: dict[str, str] = {}
+
+    def request(self, method: str, path: str, fields: dict | None = None, files=None) -> tuple[int, str, str]:
+        headers = {}
+        body = None
+        if method == 'POST':
+            fields = {'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''), **(fields or {})}
+            if files:
+                body, headers['Content-Type'] = multipart(fields, files)
+            else:
+                body, headers['Content-Type'] = urlencode(fields).encode(), 'application/x-www-form-urlencoded'
+            headers['Referer'] = self.base_url + path
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        started_at = time.time()
+        started = time.perf_counter()
+        status, location, text = 0, '', ''
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            text = response.read().decode('utf-8', 'replace')
+            status = response.status
+            location = response.getheader('Location', '')
+            for header in response.headers.get_all('Set-Cookie') or []:
+                for name, morsel in SimpleCookie(header).items():
+                    self.cookies[name] = morsel.value
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+        self.recorder.record(route_name(path), method, status, (time.perf_counter() - started) * 1000, started_at)
+        return status, location, text
+
+    def login(self, username: str, password: str) -> bool:
+        self.request('GET', '/login/')
+        status, _, _ = self.request('POST', '/login/', {'username': username, 'password': password})
+        return status == 302
+
+    def close(self):
+        self.connection.close()
+
+
+def upload_image(seed: int) -> bytes:
+    rnd = random.Random(seed)
+    image = Image.new('RGB', (850, 1100), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rnd.randrange(50, 750), rnd.randrange(50, 1000)
+        draw.line((x, y, x + rnd.randrange(10, 90), y + rnd.randrange(-15, 15)), fill=(20, 20, 120), width=3)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def build_workload(options) -> dict:
+    """Seeded users to play, with the problems each student still has to submit."""
+    rnd = random.Random(options.seed)
+    now = timezone.now()
+    next_due: dict[int, models.ProblemSet] = {}
+    for problem_set in models.ProblemSet.objects.filter(due_at__gt=now).order_by('course_id', 'due_at'):
+        next_due.setdefault(problem_set.course_id, problem_set)
+    enrollments = list(
+        models.Enrollment.objects.filter(course_id__in=next_due)
+        .values_list('user_id', 'user__username', 'course_id')
+        .order_by('id')
+    )
+    if not enrollments:
+        raise SystemExit('No enrolled students with upcoming problem sets; run `manage.py seed_scale` first.')
+    picked, seen = [], set()
+    for user_id, username, course_id in rnd.sample(enrollments, len(enrollments)):
+        if user_id not in seen:
+            seen.add(user_id)
+            picked.append((user_id, username, next_due[course_id]))
+        if len(picked) >= options.students:
+            break
+    problems = defaultdict(list)
+    for problem_id, problem_set_id in models.Problem.objects.filter(
+        problem_set__in=[problem_set for _, _, problem_set in picked]
+    ).values_list('id', 'problem_set_id'):
+        problems[problem_set_id].append(problem_id)
+    finalized = set(
+        models.Submission.objects.filter(student_id__in=seen, problem__problem_set__in=[ps for _, _, ps in picked])
+        .exclude(status=models.Submission.STATUS_DRAFT)
+        .values_list('student_id', 'problem_id')
+    )
+    graded = defaultdict(list)
+    for student_id, submission_id in models.Submission.objects.filter(
+        student_id__in=seen, status=models.Submission.STATUS_GRADED
+    ).values_list('student_id', 'id'):
+        graded[student_id].append(submission_id)
+    students = [
+        {
+            'username': username,
+            'problem_set_id': problem_set.id,
+            'problems': problems[problem_set.id],
+            'pending': [pid for pid in problems[problem_set.id] if (user_id, pid) not in finalized],
+            'graded': graded[user_id],
+        }
+        for user_id, username, problem_set in picked
+    ]
+
+    professors = []
+    for professor in models.Class.objects.values_list('professor__username', flat=True).distinct().order_by(
+        'professor__username'
+    )[: options.professors]:
+        professors.append(
+            {
+                'username': professor,
+                'problem_sets': list(
+                    models.ProblemSet.objects.filter(course__professor__username=professor).values_list('id', flat=True)
+                ),
+            }
+        )
+    close_old_connections()
+    return {'students': students, 'professors': professors}
+
+
+class LoadTest:
+    def __init__(self, options, workload):
+        self.options = options
+        self.workload = workload
+        self.recorder = Recorder()
+        self.started = 0.0
+        self.stop_at = 0.0
+        self.image = upload_image(options.seed)
+        self.failed_logins = 0
+
+    def session(self) -> Session:
+        return Session(self.options.base_url, self.recorder, timeout=self.options.request_timeout)
+
+    def progress(self) -> float:
+        return min(1.0, (time.time() - self.started) / self.options.duration)
+
+    def think(self, rnd: random.Random, scale: float = 1.0):
+        # Students arrive faster as the deadline (the end of the run) approaches.
+        mean = self.options.think * scale * (1 - 0.75 * self.progress())
+        time.sleep(min(rnd.expovariate(1 / mean), max(0.0, self.stop_at - time.time())) if mean > 0 else 0)
+
+    def student(self, index: int, student: dict):
+        rnd = random.Random(self.options.seed * 7919 + index)
+        session = self.session()
+        # Stagger logins over the first tenth of the run.
+        time.sleep(rnd.uniform(0, self.options.duration / 10))
+        if not session.login(student['username'], self.options.password):
+            self.failed_logins += 1
+            return
+        pending = list(student['pending'])
+        while time.time() < self.stop_at:
+            session.request('GET', '/')
+            session.request('GET', f"/student/problem-sets/{student['problem_set_id']}/")
+            if pending and rnd.random() < 0.3 + 0.6 * self.progress():
+                problem_id = pending.pop(rnd.randrange(len(pending)))
+                session.request('GET', f'/student/problems/{problem_id}/submit/')
+                self.think(rnd, 0.5)
+                session.request(
+                    'POST',
+                    f'/student/problems/{problem_id}/submit/',
+                    files=[('files', 'work.png', 'image/png', self.image)],
+                )
+                _, _, page = session.request('GET', f'/student/problems/{problem_id}/')
+                match = FINALIZE_LINK.search(page)
+                if match:
+                    session.request('GET', f'/student/submissions/{match[1]}/finalize/')
+            elif student['problems']:
+                session.request('GET', f"/student/problems/{rnd.choice(student['problems'])}/")
+            self.think(rnd)
+        session.close()
+
+    def professor(self, index: int, professor: dict):
+        rnd = random.Random(self.options.seed * 104729 + index)
+        session = self.session()
+        if not session.login(professor['username'], self.options.password):
+            self.failed_logins += 1
+            return
+        while time.time() < self.stop_at:
+            session.request('GET', '/')
+            if professor['problem_sets']:
+                session.request('GET', f"/prof/problem-sets/{rnd.choice(professor['problem_sets'])}/submissions/")
+            roll = rnd.random()
+            if roll < 0.2:
+                session.request('GET', '/prof/grading-stats/')
+            elif roll < 0.4:
+                session.request('GET', '/prof/appeals/')
+            self.think(rnd, 2.0)
+        session.close()
+
+    def regrade_burst(self):
+        burst = [student for student in self.workload['students'] if student['graded']][: self.options.regrade_burst]
+        if not burst:
+            return
+        sessions = []
+        for student in burst:
+            session = self.session()
+            if session.login(student['username'], self.options.password):
+                sessions.append((session, student))
+        delay = self.started + self.options.duration * self.options.burst_at - time.time()
+        time.sleep(max(0.0, delay))
+        barrier = threading.Barrier(len(sessions))
+
+        def fire(session, student):
+            barrier.wait()
+            session.request('POST', f"/student/submissions/{student['graded'][0]}/regrade/")
+            session.close()
+
+        threads = [threading.Thread(target=fire, args=pair) for pair in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run(self):
+        self.started = time.time()
+        self.stop_at = self.started + self.options.duration
+        threads = [
+            threading.Thread(target=self.student, args=(idx, student), daemon=True)
+            for idx, student in enumerate(self.workload['students'])
+        ]
+        threads += [
+            threading.Thread(target=self.professor, args=(idx, professor), daemon=True)
+            for idx, professor in enumerate(self.workload['professors'])
+        ]
+        threads.append(threading.Thread(target=self.regrade_burst, daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=max(0.0, self.stop_at - time.time()) + self.options.request_timeout * 3)
+        return time.time() - self.started
+
+
+class QueueSampler(threading.Thread):
+    def __init__(self, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []  # (time, active jobs)
+        self.stopped = threading.Event()
+
+    def depth(self) -> int:
+        return models.GradingJob.objects.filter(
+            status__in=[models.GradingJob.STATUS_QUEUED, models.GradingJob.STATUS_RUNNING]
+        ).count()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.samples.append((time.time(), self.depth()))
+            except Exception:
+                pass
+            self.stopped.wait(self.interval)
+        close_old_connections()
+
+
+def start_process(command: list[str], env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, 'ab')
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def stop_process(process: subprocess.Popen):
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def wait_until_up(host: str, port: int, path: str, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request('GET', path)
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.25)
+    raise SystemExit(f'http://{host}:{port}{path} did not come up within {timeout:.0f}s.')
+
+
+def saturation(path: Path, start: float, end: float) -> dict | None:
+    if not path.exists():
+        return None
+    busy, capacity = [], 0
+    for line in path.read_text().splitlines():
+        stamp, in_flight, capacity = line.split()
+        if start <= float(stamp) <= end:
+            busy.append(int(in_flight))
+    capacity = int(capacity)
+    if not busy or not capacity:
+        return None
+    return {
+        'capacity': capacity,
+        'mean_busy': round(sum(busy) / len(busy), 2),
+        'p95_busy': percentile(busy, 0.95),
+        'max_busy': max(busy),
+        'mean_utilization_percent': round(100 * sum(busy) / len(busy) / capacity, 1),
+        'saturated_percent': round(100 * sum(1 for value in busy if value >= capacity) / len(busy), 1),
+    }
+
+
+def summarize(samples, elapsed: float) -> dict:
+    by_route = defaultdict(list)
+    for sample in samples:
+        by_route[sample[0]].append(sample)
+    by_route['ALL'] = list(samples)
+    routes = {}
+    for route, route_samples in sorted(by_route.items(), key=lambda item: -len(item[1])):
+        timings = [sample[3] for sample in route_samples]
+        routes[route] = {
+            'requests': len(route_samples),
+            'errors': sum(1 for sample in route_samples if sample[2] == 0 or sample[2] >= 400),
+            'rps': round(len(route_samples) / elapsed, 2) if elapsed else 0,
+            'p50_ms': round(percentile(timings, 0.50), 1),
+            'p95_ms': round(percentile(timings, 0.95), 1),
+            'p99_ms': round(percentile(timings, 0.99), 1),
+        }
+    return routes
+
+
+def print_report(report: dict):
+    print(f"\nLoad: {report['elapsed_seconds']:.0f}s, {report['students']} students, "
+          f"{report['professors']} professors, {report['failed_logins']} failed logins")
+    print(f"{'route':<30} {'reqs':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, row in report['routes'].items():
+        print(f"{route:<30} {row['requests']:>7} {row['errors']:>7} {row['rps']:>8} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+    if report['saturation']:
+        sat = report['saturation']
+        print(f"\nWorkers: capacity {sat['capacity']}, busy mean {sat['mean_busy']} / p95 {sat['p95_busy']} / "
+              f"max {sat['max_busy']} ({sat['mean_utilization_percent']}% utilized, "
+              f"saturated {sat['saturated_percent']}% of the time)")
+    grading = report['grading']
+    print(f"Grading queue: peak {grading['peak_active_jobs']} active job(s); "
+          + (f"drained {grading['drain_seconds']:.0f}s after the load stopped"
+             if grading['drain_seconds'] is not None else 'not drained before --drain-timeout'))
+    if report['llm']:
+        print(f"Fake LLM: {report['llm']['requests']} request(s), {report['llm']['errors']} injected error(s), "
+              f"peak {report['llm']['max_in_flight']} in flight")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of traffic.')
+    parser.add_argument('--students', type=int, default=50, help='Simulated students.')
+    parser.add_argument('--professors', type=int, default=5, help='Simulated professors.')
+    parser.add_argument('--regrade-burst', type=int, default=20, help='Students requesting a regrade at once.')
+    parser.add_argument('--burst-at', type=float, default=0.5, help='When the burst fires, as a share of --duration.')
+    parser.add_argument('--think', type=float, default=3.0, help='Mean seconds between page views at the start.')
+    parser.add_argument('--password', default='seed', help='Password of the seeded users.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes.')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker.')
+    parser.add_argument('--grade-workers', type=int, default=2, help='`manage.py grade_worker` processes.')
+    parser.add_argument('--grade-concurrency', type=int, default=4, help='Grading requests in flight per worker.')
+    parser.add_argument('--llm-port', type=int, default=8765)
+    parser.add_argument('--llm-latency', type=float, default=2.0)
+    parser.add_argument('--llm-jitter', type=float, default=0.5)
+    parser.add_argument('--llm-error-rate', type=float, default=0.02)
+    parser.add_argument('--base-url', default='', help='Load an already running server instead of starting one.')
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--drain-timeout', type=float, default=300, help='Seconds to wait for the grading queue.')
+    parser.add_argument('--log-dir', default='', help='Where process logs go (default: a temp dir).')
+    parser.add_argument('--json', default='', help='Also write the report to this file.')
+    options = parser.parse_args(argv)
+
+    log_dir = Path(options.log_dir or tempfile.mkdtemp(prefix='dydx-bench-'))
+    log_dir.mkdir(parents=True, exist_ok=True)
+    saturation_file = log_dir / 'saturation.log'
+    workload = build_workload(options)
+    processes = []
+    llm_url = f'http://127.0.0.1:{options.llm_port}'
+    env = {
+        **os.environ,
+        'OPENAI_BASE_URL': f'{llm_url}/v1',
+        'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'bench'),
+        'GRADER_BACKEND': 'openai',
+        'DJANGO_DEBUG': os.getenv('DJANGO_DEBUG', 'False'),
+        'BENCH_BIND': f'127.0.0.1:{options.port}',
+        'BENCH_WORKERS': str(options.workers),
+        'BENCH_THREADS': str(options.threads),
+        'BENCH_SATURATION_FILE': str(saturation_file),
+    }
+    sampler = QueueSampler()
+    try:
+        if not options.base_url:
+            options.base_url = f'http://127.0.0.1:{options.port}'
+            processes.append(start_process(
+                [sys.executable, 'bench/fake_responses_api.py', '--port', str(options.llm_port),
+                 '--latency', str(options.llm_latency), '--jitter', str(options.llm_jitter),
+                 '--error-rate', str(options.llm_error_rate), '--seed', str(options.seed)],
+                env, log_dir / 'llm.log',
+            ))
+            processes.append(start_process(
+                [sys.executable, '-m', 'gunicorn', 'config.wsgi:application', '-c', 'bench/gunicorn_conf.py'],
+                env, log_dir / 'gunicorn.log',
+            ))
+            for idx in range(options.grade_workers):
+                processes.append(start_process(
+                    [sys.executable, 'manage.py', 'grade_worker', '--worker-id', f'bench-{idx}',
+                     '--concurrency', str(options.grade_concurrency), '--poll-interval', '0.5'],
+                    env, log_dir / f'grade_worker_{idx}.log',
+                ))
+            wait_until_up('127.0.0.1', options.llm_port, '/stats')
+            wait_until_up('127.0.0.1', options.port, '/login/')
+        print(f"Replaying {len(workload['students'])} students and {len(workload['professors'])} professors "
+              f"for {options.duration:.0f}s against {options.base_url} (logs in {log_dir})", flush=True)
+
+        sampler.start()
+        test = LoadTest(options, workload)
+        elapsed = test.run()
+        load_end = time.time()
+
+        drain_seconds = None
+        while time.time() - load_end < options.drain_timeout:
+            if sampler.depth() == 0:
+                drain_seconds = time.time() - load_end
+                break
+            time.sleep(1)
+        sampler.stopped.set()
+
+        llm = None
+        if not processes or processes[0].poll() is None:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', options.llm_port, timeout=5)
+                connection.request('GET', '/stats')
+                llm = json.loads(connection.getresponse().read())
+            except OSError:
+                pass
+        report = {
+            'elapsed_seconds': elapsed,
+            'students': len(workload['students']),
+            'professors': len(workload['professors']),
+            'failed_logins': test.failed_logins,
+            'routes': summarize(test.recorder.samples, elapsed),
+            'saturation': saturation(saturation_file, test.started, load_end),
+            'grading': {
+                'peak_active_jobs': max((depth for _, depth in sampler.samples), default=0),
+                'drain_seconds': drain_seconds,
+            },
+            'llm': llm,
+        }
+        print_report(report)
+        if options.json:
+            Path(options.json).write_text(json.dumps(report, indent=2))
+    finally:
+        sampler.stopped.set()
+        for process in reversed(processes):
+            stop_process(process)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,3 +5,5 @@ pip install -r requirements.txt
 python manage.py collectstatic --noinput
 python manage.py migrate
 python manage.py bootstrap_admin
+python manage.py render_prompts
+python manage.py rebuild_stats
@@ -146,6 +146,83 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4.1-2025-04-14')
 
+# Grader backend: "openai" or "fake" (offline, for load tests and development).
+GRADER_BACKEND = os.getenv('GRADER_BACKEND', 'openai')
+# Connection pool of the per-process OpenAI client.
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY_SECONDS', '60'))
+GRADER_FAKE_LATENCY_SECONDS = float(os.getenv('GRADER_FAKE_LATENCY_SECONDS', '0'))
+# Optional JSON file with a list of GradeResult objects for the fake backend to cycle through.
+GRADER_FAKE_RESULTS_FILE = os.getenv('GRADER_FAKE_RESULTS_FILE', '')
+# Per-operation limits for LLM calls: per-attempt timeout, retries on transient
+# errors (timeouts, 429, 5xx) and an overall deadline bounding worst-case latency.
+GRADER_GRADE_TIMEOUT_SECONDS = float(os.getenv('GRADER_GRADE_TIMEOUT_SECONDS', '60'))
+GRADER_GRADE_MAX_RETRIES = int(os.getenv('GRADER_GRADE_MAX_RETRIES', '3'))
+GRADER_GRADE_DEADLINE_SECONDS = float(os.getenv('GRADER_GRADE_DEADLINE_SECONDS', '180'))
+GRADER_RUBRIC_TIMEOUT_SECONDS = float(os.getenv('GRADER_RUBRIC_TIMEOUT_SECONDS', '90'))
+GRADER_RUBRIC_MAX_RETRIES = int(os.getenv('GRADER_RUBRIC_MAX_RETRIES', '2'))
+GRADER_RUBRIC_DEADLINE_SECONDS = float(os.getenv('GRADER_RUBRIC_DEADLINE_SECONDS', '240'))
+GRADER_RETRY_BASE_SECONDS = float(os.getenv('GRADER_RETRY_BASE_SECONDS', '1'))
+GRADER_RETRY_MAX_SECONDS = float(os.getenv('GRADER_RETRY_MAX_SECONDS', '30'))
+# Circuit breaker kept in the default cache (shared across workers when the cache
+# is). Opens after THRESHOLD transient failures within WINDOW; 0 disables it.
+GRADER_CIRCUIT_THRESHOLD = int(os.getenv('GRADER_CIRCUIT_THRESHOLD', '5'))
+GRADER_CIRCUIT_WINDOW_SECONDS = float(os.getenv('GRADER_CIRCUIT_WINDOW_SECONDS', '60'))
+GRADER_CIRCUIT_RESET_SECONDS = float(os.getenv('GRADER_CIRCUIT_RESET_SECONDS', '60'))
+
+# Background grading queue (see `manage.py grade_worker`).
+GRADING_JOB_LEASE_SECONDS = int(os.getenv('GRADING_JOB_LEASE_SECONDS', '600'))
+GRADING_JOB_MAX_ATTEMPTS = int(os.getenv('GRADING_JOB_MAX_ATTEMPTS', '3'))
+GRADING_JOB_RETRY_DELAY_SECONDS = int(os.getenv('GRADING_JOB_RETRY_DELAY_SECONDS', '60'))
+# Maximum grading API requests in flight per process for bulk grading.
+GRADING_BULK_CONCURRENCY = int(os.getenv('GRADING_BULK_CONCURRENCY', '4'))
+# Student-requested regrades: minimum gap per submission, and how many a student
+# may request across all submissions within the window (0 disables either).
+REGRADE_COOLDOWN_SECONDS = int(os.getenv('REGRADE_COOLDOWN_SECONDS', '300'))
+REGRADE_QUOTA = int(os.getenv('REGRADE_QUOTA', '10'))
+REGRADE_QUOTA_WINDOW_HOURS = int(os.getenv('REGRADE_QUOTA_WINDOW_HOURS', '24'))
+
+# Offline grading through the provider's Batch API ("openai") or a file-based
+# stand-in ("local") that completes batches on the next poll.
+GRADING_BATCH_BACKEND = os.getenv('GRADING_BATCH_BACKEND', 'openai')
+GRADING_BATCH_ROOT = Path(os.getenv('GRADING_BATCH_ROOT', BASE_DIR / 'cache' / 'batches'))
+GRADING_BATCH_MAX_REQUESTS = int(os.getenv('GRADING_BATCH_MAX_REQUESTS', '1000'))
+GRADING_BATCH_MAX_BYTES = int(os.getenv('GRADING_BATCH_MAX_BYTES', str(180 * 1024 * 1024)))
+# Jobs stay leased to a batch for the provider's 24h completion window plus slack.
+GRADING_BATCH_LEASE_SECONDS = int(os.getenv('GRADING_BATCH_LEASE_SECONDS', str(26 * 3600)))
+
+# Rows fetched per server-side cursor round trip (and written per output chunk)
+# by the gradebook export.
+GRADEBOOK_EXPORT_CHUNK_SIZE = int(os.getenv('GRADEBOOK_EXPORT_CHUNK_SIZE', '2000'))
+
+# Rasterized PDF page cache. Set PAGE_CACHE_STORAGE to a STORAGES alias to keep
+# it on a shared backend (e.g. S3) instead of local disk.
+PAGE_CACHE_STORAGE = os.getenv('PAGE_CACHE_STORAGE', '')
+PAGE_CACHE_ROOT = Path(os.getenv('PAGE_CACHE_ROOT', BASE_DIR / 'cache' / 'pages'))
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Reuse stored results for byte-identical grading inputs (same files, rubric,
+# model and prompt template). Individual jobs can opt out with use_cache=False.
+GRADING_RESULT_CACHE = os.getenv('GRADING_RESULT_CACHE', 'True').lower() == 'true'
+
+# Image preparation for LLM payloads: pages are downscaled to a pixel budget and
+# re-encoded with whichever of GRADING_IMAGE_FORMATS is smallest.
+GRADING_IMAGE_MAX_PIXELS = int(os.getenv('GRADING_IMAGE_MAX_PIXELS', str(1024 * 1024)))
+GRADING_IMAGE_FORMATS = [fmt for fmt in os.getenv('GRADING_IMAGE_FORMATS', 'webp,jpeg').split(',') if fmt]
+GRADING_IMAGE_QUALITY = int(os.getenv('GRADING_IMAGE_QUALITY', '85'))
+GRADING_IMAGE_PHOTO_QUALITY = int(os.getenv('GRADING_IMAGE_PHOTO_QUALITY', '70'))
+GRADING_IMAGE_DETAIL = os.getenv('GRADING_IMAGE_DETAIL', 'auto')
+# Hard caps per grading job: rendered page size and total inlined payload.
+GRADING_RENDER_MAX_PIXELS = int(os.getenv('GRADING_RENDER_MAX_PIXELS', str(8 * 1024 * 1024)))
+GRADING_MAX_PAYLOAD_BYTES = int(os.getenv('GRADING_MAX_PAYLOAD_BYTES', str(24 * 1024 * 1024)))
+
+# PDF rendering pool. RENDER_POOL_WORKERS=0 renders inline in the calling process.
+RENDER_POOL_WORKERS = int(os.getenv('RENDER_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+RENDER_TIMEOUT_SECONDS = float(os.getenv('RENDER_TIMEOUT_SECONDS', '60'))
+RENDER_MAX_RSS_BYTES = int(os.getenv('RENDER_MAX_RSS_BYTES', str(1024 * 1024 * 1024)))
+RENDER_TASKS_PER_CHILD = int(os.getenv('RENDER_TASKS_PER_CHILD', '100'))
+
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 CSRF_TRUSTED_ORIGINS = [origin for origin in os.getenv('CSRF_TRUSTED_ORIGINS', '').split(',') if origin]
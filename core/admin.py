@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from . import models
+from . import models, services
 
 
 @admin.register(models.Class)
@@ -21,10 +21,36 @@ class ProblemSetAdmin(admin.ModelAdmin):
     search_fields = ('title', 'course__title')
 
 
+@admin.register(models.ProblemSetStats)
+class ProblemSetStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'problem_set',
+        'submission_count',
+        'graded_count',
+        'completion_percent',
+        'mean_score',
+        'open_appeals',
+        'updated_at',
+    )
+    search_fields = ('problem_set__title', 'problem_set__course__title')
+    raw_id_fields = ('problem_set',)
+
+
 @admin.register(models.Problem)
 class ProblemAdmin(admin.ModelAdmin):
     list_display = ('title', 'problem_set', 'max_score', 'order', 'created_at')
     search_fields = ('title', 'problem_set__title')
+    readonly_fields = ('prompt_sha256', 'prompt_preview')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'prompt_pdf' in form.changed_data:
+            services.render_prompt_pages(obj)
+
+
+@admin.register(models.ProblemPromptPage)
+class ProblemPromptPageAdmin(admin.ModelAdmin):
+    list_display = ('problem', 'page_number', 'width', 'height')
 
 
 @admin.register(models.Rubric)
@@ -41,6 +67,7 @@ class RubricItemAdmin(admin.ModelAdmin):
 class SubmissionAdmin(admin.ModelAdmin):
     list_display = ('problem', 'student', 'submitted_at', 'status', 'final_score')
     search_fields = ('problem__title', 'student__username', 'student__email')
+    raw_id_fields = ('best_grade', 'latest_autograde')
 
 
 @admin.register(models.SubmissionFile)
@@ -50,7 +77,41 @@ class SubmissionFileAdmin(admin.ModelAdmin):
 
 @admin.register(models.AutoGradeRun)
 class AutoGradeRunAdmin(admin.ModelAdmin):
-    list_display = ('submission', 'model', 'score', 'created_at')
+    list_display = (
+        'submission',
+        'model',
+        'score',
+        'cache_hit',
+        'input_tokens',
+        'cached_input_tokens',
+        'render_ms',
+        'encode_ms',
+        'api_ms',
+        'persist_ms',
+        'retries',
+        'created_at',
+    )
+    list_filter = ('cache_hit', 'model')
+
+
+@admin.register(models.GradeResultCacheEntry)
+class GradeResultCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'model', 'hits', 'created_at', 'last_hit_at')
+    search_fields = ('key',)
+
+
+@admin.register(models.GradingJob)
+class GradingJobAdmin(admin.ModelAdmin):
+    list_display = ('submission', 'reason', 'status', 'use_cache', 'attempts', 'leased_by', 'run_after', 'created_at')
+    list_filter = ('status', 'reason')
+    raw_id_fields = ('batch',)
+
+
+@admin.register(models.GradingBatch)
+class GradingBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'backend', 'status', 'request_count', 'graded_count', 'failed_count', 'submitted_at', 'finished_at')
+    list_filter = ('status', 'backend')
+    exclude = ('manifest',)
 
 
 @admin.register(models.Grade)
@@ -66,3 +127,14 @@ class AppealAdmin(admin.ModelAdmin):
 @admin.register(models.AppealMessage)
 class AppealMessageAdmin(admin.ModelAdmin):
     list_display = ('appeal', 'author', 'created_at')
+
+
+@admin.register(models.PageCacheEntry)
+class PageCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'page_index', 'page_count', 'scale', 'encoding', 'size_bytes', 'hits', 'last_used_at')
+    search_fields = ('content_hash',)
+
+
+@admin.register(models.PageCacheCounter)
+class PageCacheCounterAdmin(admin.ModelAdmin):
+    list_display = ('hits', 'misses', 'reset_at')
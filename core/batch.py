@@ -0,0 +1,390 @@
+"""Offline grading through the provider's asynchronous Batch API.
+
+Queued grading jobs are leased to a GradingBatch, their requests are written to
+a JSONL file with the same payload builder the synchronous path uses, and the
+file is handed to a batch backend. Polling maps the results back onto
+AutoGradeRun/Grade rows; anything missing or errored is requeued for the
+regular workers.
+"""
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.utils import timezone
+
+from . import graders, models, services
+
+APPLY_BATCH_SIZE = 100
+
+
+@dataclass
+class BatchState:
+    status: str  # 'in_progress', 'completed' or 'failed'
+    lines: list[str] = field(default_factory=list)
+    error: str = ''
+
+
+def grading_text_format() -> dict:
+    # The JSON schema `responses.parse(text_format=GradeResult)` would send.
+    from openai.lib._parsing._responses import type_to_text_format_param
+
+    return {'format': type_to_text_format_param(services.GradeResult)}
+
+
+def _response_text(body: dict) -> str:
+    if body.get('output_text'):
+        return body['output_text']
+    parts = []
+    for item in body.get('output') or []:
+        for content in item.get('content') or []:
+            if content.get('type') == 'output_text':
+                parts.append(content.get('text', ''))
+    return ''.join(parts)
+
+
+def _usage_counts(body: dict) -> dict:
+    usage = body.get('usage') or {}
+    counts = {
+        'input_tokens': usage.get('input_tokens'),
+        'cached_input_tokens': (usage.get('input_tokens_details') or {}).get('cached_tokens'),
+        'output_tokens': usage.get('output_tokens'),
+    }
+    return {name: value for name, value in counts.items() if isinstance(value, int)}
+
+
+class OpenAIBatchBackend:
+    name = 'openai'
+
+    def submit(self, batch: models.GradingBatch, input_path: str) -> str:
+        client = graders.openai_client()
+        with open(input_path, 'rb') as input_file:
+            uploaded = client.files.create(file=input_file, purpose='batch')
+        created = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint='/v1/responses',
+            completion_window='24h',
+            metadata={'grading_batch': str(batch.id)},
+        )
+        return created.id
+
+    def retrieve(self, batch: models.GradingBatch) -> BatchState:
+        client = graders.openai_client()
+        remote = client.batches.retrieve(batch.provider_batch_id)
+        if remote.status == 'failed':
+            errors = getattr(remote.errors, 'data', None) or []
+            return BatchState('failed', error='; '.join(error.message or '' for error in errors) or 'Batch failed.')
+        if remote.status not in {'completed', 'expired', 'cancelled'}:
+            return BatchState('in_progress')
+        # Expired and cancelled batches still return whatever finished.
+        lines = []
+        for file_id in (remote.output_file_id, remote.error_file_id):
+            if file_id:
+                lines.extend(client.files.content(file_id).text.splitlines())
+        return BatchState('completed', lines)
+
+
+def canned_response(body: dict) -> dict:
+    # The same answer the fake grader gives: full points for every rubric item in the request.
+    response = graders.FakeGrader(latency=0).parse(body, services.GradeResult)
+    return {
+        'status': 'completed',
+        'model': body.get('model', ''),
+        'output': [
+            {
+                'type': 'message',
+                'role': 'assistant',
+                'content': [{'type': 'output_text', 'text': response.text}],
+            }
+        ],
+        'usage': {
+            'input_tokens': response.usage['input_tokens'],
+            'input_tokens_details': {'cached_tokens': 0},
+            'output_tokens': response.usage['output_tokens'],
+        },
+    }
+
+
+class LocalBatchBackend:
+    """File-based stand-in for the Batch API, for development and tests.
+
+    Submitted files are kept under `root/<batch id>/`; the first poll "runs" the
+    batch by passing each request body to `responder` and writing output.jsonl
+    in the provider's format. Dropping a hand-written output.jsonl into the
+    directory before polling works too.
+    """
+
+    name = 'local'
+
+    def __init__(self, root=None, responder=None):
+        self.root = Path(root or settings.GRADING_BATCH_ROOT)
+        self.responder = responder or canned_response
+
+    def _directory(self, batch: models.GradingBatch) -> Path:
+        return self.root / str(batch.id)
+
+    def submit(self, batch: models.GradingBatch, input_path: str) -> str:
+        directory = self._directory(batch)
+        directory.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(input_path, directory / 'input.jsonl')
+        return f'local-{batch.id}'
+
+    def _process(self, directory: Path) -> None:
+        partial = directory / 'output.jsonl.partial'
+        with open(directory / 'input.jsonl') as source, open(partial, 'w') as output:
+            for number, line in enumerate(source):
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                record = {
+                    'id': f'local-request-{number}',
+                    'custom_id': request['custom_id'],
+                    'response': {'status_code': 200, 'body': self.responder(request['body'])},
+                    'error': None,
+                }
+                output.write(json.dumps(record) + '\n')
+        os.replace(partial, directory / 'output.jsonl')
+
+    def retrieve(self, batch: models.GradingBatch) -> BatchState:
+        directory = self._directory(batch)
+        if not (directory / 'input.jsonl').exists():
+            return BatchState('failed', error=f'No local batch at {directory}.')
+        if not (directory / 'output.jsonl').exists():
+            self._process(directory)
+        return BatchState('completed', (directory / 'output.jsonl').read_text().splitlines())
+
+
+BATCH_BACKENDS = {
+    OpenAIBatchBackend.name: OpenAIBatchBackend,
+    LocalBatchBackend.name: LocalBatchBackend,
+}
+
+
+def get_batch_backend(name: str | None = None):
+    name = name or settings.GRADING_BATCH_BACKEND
+    try:
+        return BATCH_BACKENDS[name]()
+    except KeyError as exc:
+        raise ImproperlyConfigured(f'Unknown grading batch backend {name!r}.') from exc
+
+
+def _release_jobs(jobs: list[models.GradingJob]) -> None:
+    # Hand back jobs that did not fit in the batch without counting an attempt.
+    if jobs:
+        models.GradingJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=models.GradingJob.STATUS_QUEUED,
+            batch=None,
+            leased_by='',
+            lease_expires_at=None,
+            attempts=F('attempts') - 1,
+        )
+
+
+def submit_grading_batch(
+    backend=None,
+    problem_set: models.ProblemSet | None = None,
+    limit: int | None = None,
+) -> models.GradingBatch | None:
+    """Lease queued bulk jobs into one batch and submit it; returns None if there are none.
+
+    Only bulk jobs are batched: finalize and regrade jobs stay with the regular
+    workers, since a batch can take up to a day. Jobs that need no API call (cache
+    hits, unusable payloads) are graded right away instead of being sent.
+    """
+    backend = backend or get_batch_backend()
+    limit = min(limit or settings.GRADING_BATCH_MAX_REQUESTS, settings.GRADING_BATCH_MAX_REQUESTS)
+    batch = models.GradingBatch.objects.create(
+        backend=backend.name,
+        model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini-2024-07-18'),
+    )
+    jobs = services.claim_grading_jobs(
+        batch.worker_id,
+        limit=limit,
+        lease_seconds=settings.GRADING_BATCH_LEASE_SECONDS,
+        problem_set=problem_set,
+        reasons=[models.GradingJob.REASON_BULK],
+    )
+    if not jobs:
+        batch.delete()
+        return None
+    models.GradingJob.objects.filter(id__in=[job.id for job in jobs]).update(batch=batch)
+    # Payloads are built one job at a time below; render their PDFs on every worker first.
+    services.prerender_submission_pages([job.submission for job in jobs])
+
+    root = Path(settings.GRADING_BATCH_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    immediate, skipped, released = [], [], []
+    size = 0
+    with tempfile.NamedTemporaryFile('w', dir=root, suffix='.jsonl', delete=False) as input_file:
+        input_path = input_file.name
+        for job in jobs:
+            try:
+                rubric = job.rubric or services.get_active_rubric(job.submission.problem)
+                if rubric is None:
+                    skipped.append(job)
+                    continue
+                plan = services.plan_autograde(job.submission, rubric, use_cache=job.use_cache, backend=backend.name)
+            except Exception as exc:
+                services.fail_grading_job(job, exc)
+                batch.failed_count += 1
+                continue
+            if plan.outcome is not None:
+                immediate.append((job, plan.outcome))
+                continue
+            line = json.dumps(
+                {
+                    'custom_id': f'job-{job.id}',
+                    'method': 'POST',
+                    'url': '/v1/responses',
+                    'body': {**plan.request(), 'text': grading_text_format()},
+                }
+            ) + '\n'
+            if manifest and size + len(line) > settings.GRADING_BATCH_MAX_BYTES:
+                released.append(job)
+                continue
+            input_file.write(line)
+            size += len(line)
+            manifest[str(job.id)] = {'rubric_id': rubric.id, 'cache_key': plan.cache_key, 'payload': plan.payload.stats}
+
+    try:
+        services.persist_autograde_outcomes([outcome for _, outcome in immediate])
+        services.complete_grading_jobs([job for job, _ in immediate] + skipped)
+        _release_jobs(released)
+        batch.manifest = manifest
+        batch.request_count = len(manifest)
+        batch.graded_count = len(immediate)
+        if not manifest:
+            batch.status = models.GradingBatch.STATUS_COMPLETED
+            batch.finished_at = timezone.now()
+            batch.save()
+            return batch
+        try:
+            batch.provider_batch_id = backend.submit(batch, input_path)
+        except Exception as exc:
+            for job in jobs:
+                if str(job.id) in manifest:
+                    services.fail_grading_job(job, exc)
+            batch.status = models.GradingBatch.STATUS_FAILED
+            batch.failed_count += len(manifest)
+            batch.last_error = str(exc)
+            batch.finished_at = timezone.now()
+            batch.save()
+            return batch
+        batch.status = models.GradingBatch.STATUS_SUBMITTED
+        batch.submitted_at = timezone.now()
+        batch.save()
+        return batch
+    finally:
+        os.remove(input_path)
+
+
+def apply_batch_results(batch: models.GradingBatch, state: BatchState) -> None:
+    # Only jobs still leased to this batch; an expired lease means a worker took over.
+    jobs = {
+        job.id: job
+        for job in batch.jobs.filter(
+            status=models.GradingJob.STATUS_RUNNING,
+            leased_by=batch.worker_id,
+        ).select_related('submission__problem', 'rubric')
+    }
+    rubric_ids = {entry['rubric_id'] for entry in batch.manifest.values()}
+    rubrics = models.Rubric.objects.in_bulk(rubric_ids)
+
+    if state.status == 'failed':
+        for job in jobs.values():
+            services.fail_grading_job(job, RuntimeError(state.error))
+        batch.status = models.GradingBatch.STATUS_FAILED
+        batch.failed_count += len(jobs)
+        batch.last_error = state.error
+        batch.finished_at = timezone.now()
+        batch.save()
+        return
+
+    finished: list[tuple[models.GradingJob, services.AutoGradeOutcome]] = []
+
+    def flush():
+        services.persist_autograde_outcomes([outcome for _, outcome in finished])
+        services.complete_grading_jobs([job for job, _ in finished])
+        batch.graded_count += len(finished)
+        finished.clear()
+
+    for line in state.lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get('custom_id') or ''
+        job = jobs.pop(int(custom_id.removeprefix('job-')), None) if custom_id.startswith('job-') else None
+        if job is None:
+            continue
+        response = record.get('response') or {}
+        if record.get('error') or response.get('status_code') != 200:
+            error = record.get('error') or (response.get('body') or {}).get('error') or response.get('status_code')
+            services.fail_grading_job(job, RuntimeError(f'Batch request failed: {error}'))
+            batch.failed_count += 1
+            continue
+
+        entry = batch.manifest[str(job.id)]
+        rubric = rubrics.get(entry['rubric_id'])
+        if rubric is None:
+            services.complete_grading_jobs([job])
+            continue
+        plan = services.GradingPlan(
+            submission=job.submission,
+            rubric=rubric,
+            model=batch.model,
+            backend=batch.backend,
+            cache_key=entry['cache_key'],
+        )
+        body = response.get('body') or {}
+        raw_text = _response_text(body)
+        try:
+            result = services.GradeResult.model_validate_json(raw_text)
+        except ValueError as exc:
+            # Retried by the regular workers like any failed request; no zero grade is written.
+            services.fail_grading_job(job, RuntimeError(f'Unusable batch response: {exc}'))
+            batch.failed_count += 1
+            continue
+        services.store_grade_result(plan, result, raw_text)
+        outcome = services.grade_outcome(plan, result, raw_text, payload_stats=entry['payload'], usage=_usage_counts(body))
+        finished.append((job, outcome))
+        if len(finished) >= APPLY_BATCH_SIZE:
+            flush()
+    flush()
+
+    for job in jobs.values():
+        services.fail_grading_job(job, RuntimeError('Missing from batch output.'))
+    batch.failed_count += len(jobs)
+    batch.status = models.GradingBatch.STATUS_COMPLETED
+    batch.finished_at = timezone.now()
+    batch.save()
+
+
+def poll_grading_batches(backend=None) -> tuple[list[models.GradingBatch], list[models.GradingBatch]]:
+    """Check submitted batches and apply any that finished; returns (finished, pending).
+
+    `backend` overrides the configured instance for batches submitted through it.
+    """
+    finished, pending = [], []
+    for batch in models.GradingBatch.objects.filter(status=models.GradingBatch.STATUS_SUBMITTED).order_by('id'):
+        try:
+            if backend is not None and backend.name == batch.backend:
+                state = backend.retrieve(batch)
+            else:
+                state = get_batch_backend(batch.backend).retrieve(batch)
+        except Exception as exc:
+            batch.last_error = str(exc)
+            batch.save(update_fields=['last_error'])
+            pending.append(batch)
+            continue
+        if state.status == 'in_progress':
+            pending.append(batch)
+            continue
+        apply_batch_results(batch, state)
+        finished.append(batch)
+    return finished, pending
@@ -77,6 +77,12 @@ class AppealMessageForm(forms.ModelForm):
         fields = ['message']
 
 
+class RosterUploadForm(forms.Form):
+    roster = forms.FileField(help_text='CSV with an "email" column (optional "first_name", "last_name"), or one email per line.')
+    create_missing = forms.BooleanField(required=False, label='Create accounts for unknown emails')
+    drop_unlisted = forms.BooleanField(required=False, label='Drop enrolled students not on the roster')
+
+
 class StudentSignUpForm(forms.Form):
     email = forms.EmailField()
     username = forms.CharField(max_length=150, required=False)
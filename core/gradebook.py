@@ -0,0 +1,241 @@
+"""Class gradebook export (one row per enrolled student x problem) as CSV or XLSX.
+
+Rows are produced from two server-side cursors, enrollments and submissions, both
+ordered by student and merged as they stream. Memory stays flat whatever the
+class size: one student's submissions and one chunk of output at a time. The XLSX
+writer emits a minimal single-sheet workbook with inline strings. zipfile writes
+it into a non-seekable sink that is drained after every chunk.
+"""
+import csv
+import io
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery
+from django.utils.text import slugify
+
+from . import models
+
+COLUMNS = [
+    'student_id',
+    'student_email',
+    'student_name',
+    'problem_set',
+    'problem_id',
+    'problem',
+    'max_score',
+    'status',
+    'final_score',
+    'grader_type',
+    'submitted_at',
+    'appeal_status',
+]
+
+STATUS_MISSING = 'missing'
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+FORMATS = tuple(CONTENT_TYPES)
+
+
+def filename(course: models.Class, fmt: str) -> str:
+    return f"gradebook-{slugify(course.title) or course.id}.{fmt}"
+
+
+def course_problems(course: models.Class) -> list[models.Problem]:
+    return list(
+        models.Problem.objects.filter(problem_set__course=course)
+        .select_related('problem_set')
+        .order_by(F('problem_set__due_at').asc(nulls_last=True), 'problem_set_id', 'order', 'id')
+    )
+
+
+def gradebook_rows(course: models.Class, chunk_size: int | None = None):
+    """Yield one list of COLUMNS values per active student and problem, students by id."""
+    chunk_size = chunk_size or settings.GRADEBOOK_EXPORT_CHUNK_SIZE
+    problems = course_problems(course)
+    enrollments = (
+        models.Enrollment.objects.filter(course=course, status=models.Enrollment.STATUS_ACTIVE)
+        .order_by('user_id')
+        .values_list('user_id', 'user__email', 'user__first_name', 'user__last_name')
+        .iterator(chunk_size=chunk_size)
+    )
+    latest_appeal = models.Appeal.objects.filter(submission=OuterRef('pk')).order_by('-created_at', '-id').values('status')[:1]
+    submissions = (
+        models.Submission.objects.filter(problem__problem_set__course=course)
+        .order_by('student_id')
+        .values('student_id', 'problem_id', 'status', 'final_score', 'submitted_at')
+        .annotate(grader_type=F('best_grade__grader_type'), appeal_status=Subquery(latest_appeal))
+        .iterator(chunk_size=chunk_size)
+    )
+
+    pending = next(submissions, None)
+    for user_id, email, first_name, last_name in enrollments:
+        # Submissions from students no longer enrolled sort in between and are skipped.
+        mine = {}
+        while pending is not None and pending['student_id'] <= user_id:
+            if pending['student_id'] == user_id:
+                mine[pending['problem_id']] = pending
+            pending = next(submissions, None)
+        name = f"{first_name} {last_name}".strip()
+        for problem in problems:
+            cells = [user_id, email, name, problem.problem_set.title, problem.id, problem.title, problem.max_score]
+            submission = mine.get(problem.id)
+            if submission is None:
+                yield cells + [STATUS_MISSING, None, None, None, None]
+                continue
+            submitted_at = submission['submitted_at']
+            yield cells + [
+                submission['status'],
+                submission['final_score'],
+                submission['grader_type'],
+                submitted_at.isoformat() if submitted_at else None,
+                submission['appeal_status'],
+            ]
+
+
+def _chunks(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(rows, chunk_size: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for chunk in _chunks(rows, chunk_size):
+        writer.writerows(['' if value is None else value for value in row] for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable target; zipfile falls back to streaming mode."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Gradebook" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+# Characters XML 1.0 does not allow, even escaped.
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _column_letter(index: int) -> str:
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+_LETTERS = [_column_letter(index) for index in range(len(COLUMNS))]
+
+
+def _xlsx_row(number: int, values) -> str:
+    cells = []
+    for letter, value in zip(_LETTERS, values):
+        ref = f'{letter}{number}'
+        if value is None:
+            continue
+        if isinstance(value, (int, float, Decimal)):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            text = escape(_XML_ILLEGAL.sub('', str(value)))
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def stream_xlsx(rows, chunk_size: int):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(1, COLUMNS).encode())
+            number = 1
+            for chunk in _chunks(rows, chunk_size):
+                parts = []
+                for row in chunk:
+                    number += 1
+                    parts.append(_xlsx_row(number, row))
+                sheet.write(''.join(parts).encode())
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def stream(course: models.Class, fmt: str, chunk_size: int | None = None):
+    """Yield the encoded gradebook in `fmt` ('csv' or 'xlsx') as byte chunks."""
+    chunk_size = chunk_size or settings.GRADEBOOK_EXPORT_CHUNK_SIZE
+    rows = gradebook_rows(course, chunk_size)
+    if fmt == 'xlsx':
+        return stream_xlsx(rows, chunk_size)
+    return stream_csv(rows, chunk_size)
@@ -0,0 +1,267 @@
+"""Grader backends: where structured LLM requests for rubrics and grades are sent.
+
+`get_grader()` returns the per-process backend named by GRADER_BACKEND. The
+OpenAI backend shares one pooled, keep-alive client per process; the fake
+backend answers locally with configurable latency so the whole grading path
+can be exercised offline.
+"""
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from pydantic import BaseModel
+
+from .resilience import CircuitBreaker, ServiceUnavailable, backoff_delay, retry_after_seconds
+
+
+class GraderUnavailable(ServiceUnavailable):
+    """The grading provider is degraded; defer the work instead of recording a grade."""
+
+
+@dataclass
+class GraderResponse:
+    parsed: BaseModel | None
+    text: str
+    usage: dict = field(default_factory=dict)
+    elapsed_ms: int = 0
+    retries: int = 0
+
+
+def usage_counts(response) -> dict:
+    usage = getattr(response, 'usage', None)
+    details = getattr(usage, 'input_tokens_details', None)
+    counts = {
+        'input_tokens': getattr(usage, 'input_tokens', None),
+        'cached_input_tokens': getattr(details, 'cached_tokens', None),
+        'output_tokens': getattr(usage, 'output_tokens', None),
+    }
+    return {name: value for name, value in counts.items() if isinstance(value, int)}
+
+
+_openai_client = None
+_openai_client_pid = None
+_openai_client_lock = threading.Lock()
+
+
+def openai_client():
+    """The process-wide OpenAI client; its connection pool is reused across calls.
+
+    Rebuilt after a fork so pre-forking servers never share sockets between
+    processes.
+    """
+    global _openai_client, _openai_client_pid
+    with _openai_client_lock:
+        if _openai_client is None or _openai_client_pid != os.getpid():
+            import httpx
+            from openai import DefaultHttpxClient, OpenAI
+
+            # Retries are handled by OpenAIGrader so they share its deadline and breaker.
+            _openai_client = OpenAI(
+                max_retries=0,
+                http_client=DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+                    ),
+                ),
+            )
+            _openai_client_pid = os.getpid()
+        return _openai_client
+
+
+def operation_limits(operation: str) -> tuple[float, int, float]:
+    """(per-attempt timeout, max retries, overall deadline) for 'grade' or 'rubric'."""
+    prefix = f'GRADER_{operation.upper()}'
+    return (
+        getattr(settings, f'{prefix}_TIMEOUT_SECONDS'),
+        getattr(settings, f'{prefix}_MAX_RETRIES'),
+        getattr(settings, f'{prefix}_DEADLINE_SECONDS'),
+    )
+
+
+def _is_transient(exc: Exception) -> bool:
+    import openai
+
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in {408, 409, 429} or exc.status_code >= 500
+    return False
+
+
+def _is_misconfigured(exc: Exception) -> bool:
+    import openai
+
+    return isinstance(exc, openai.APIStatusError) and exc.status_code in {401, 403, 404}
+
+
+class OpenAIGrader:
+    name = 'openai'
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            'openai',
+            threshold=settings.GRADER_CIRCUIT_THRESHOLD,
+            window=settings.GRADER_CIRCUIT_WINDOW_SECONDS,
+            reset_seconds=settings.GRADER_CIRCUIT_RESET_SECONDS,
+        )
+
+    def available(self) -> bool:
+        return bool(os.getenv('OPENAI_API_KEY'))
+
+    def ensure_available(self, take_probe: bool = True) -> None:
+        wait = self.breaker.retry_after(take_probe=take_probe)
+        if wait:
+            raise GraderUnavailable('The grading service is unavailable (circuit open).', retry_after=wait)
+
+    def parse(self, request: dict, text_format: type[BaseModel], operation: str = 'grade') -> GraderResponse:
+        timeout, max_retries, deadline = operation_limits(operation)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            self.ensure_available()
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                raise GraderUnavailable(f'{operation} request ran past its {deadline:g}s deadline.')
+            client = openai_client().with_options(timeout=min(timeout, remaining))
+            try:
+                response = client.responses.parse(**request, text_format=text_format)
+            except Exception as exc:
+                if _is_misconfigured(exc):
+                    # A bad key or model fails every request alike; hold the work until it is fixed.
+                    raise GraderUnavailable(
+                        f'The grading service rejected the request: {exc}',
+                        retry_after=settings.GRADER_CIRCUIT_RESET_SECONDS,
+                    ) from exc
+                if not _is_transient(exc):
+                    raise
+                self.breaker.record_failure()
+                hint = retry_after_seconds(getattr(getattr(exc, 'response', None), 'headers', None))
+                delay = max(
+                    backoff_delay(attempt, settings.GRADER_RETRY_BASE_SECONDS, settings.GRADER_RETRY_MAX_SECONDS),
+                    hint or 0,
+                )
+                if attempt >= max_retries or time.monotonic() - started + delay >= deadline:
+                    raise GraderUnavailable(
+                        f'{operation} request failed after {attempt + 1} attempt(s): {exc}',
+                        retry_after=max(delay, settings.GRADER_RETRY_BASE_SECONDS),
+                    ) from exc
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return GraderResponse(
+                response.output_parsed,
+                response.output_text,
+                usage_counts(response),
+                elapsed_ms=round((time.monotonic() - started) * 1000),
+                retries=attempt,
+            )
+
+
+RUBRIC_LINE = re.compile(r'^- (?P<label>.+): (?P<points>\d+(?:\.\d+)?) pts$', re.MULTILINE)
+RUBRIC_TOTAL = re.compile(r'must sum to (?P<total>\d+)')
+
+
+def _request_text(request: dict) -> str:
+    parts = []
+    for message in request.get('input', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for item in content or []:
+            if item.get('type') == 'input_text':
+                parts.append(item['text'])
+    return '\n'.join(parts)
+
+
+class FakeGrader:
+    """Deterministic offline backend.
+
+    Grades award full points for every rubric item found in the request (or
+    cycle through GRADER_FAKE_RESULTS_FILE); rubric requests get three equal
+    criteria. Each call sleeps for `latency` seconds to stand in for the API.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency: float | None = None, results: list[dict] | None = None):
+        self.latency = settings.GRADER_FAKE_LATENCY_SECONDS if latency is None else latency
+        if results is None and settings.GRADER_FAKE_RESULTS_FILE:
+            with open(settings.GRADER_FAKE_RESULTS_FILE) as results_file:
+                results = json.load(results_file)
+        self._results = itertools.cycle(results) if results else None
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def available(self) -> bool:
+        return True
+
+    def ensure_available(self, take_probe: bool = True) -> None:
+        pass
+
+    def _grade(self, text: str) -> dict:
+        if self._results is not None:
+            with self._lock:
+                return next(self._results)
+        scores = [
+            {'label': match['label'], 'score': float(match['points']), 'status': 'correct'}
+            for match in RUBRIC_LINE.finditer(text)
+        ]
+        return {
+            'total_score': sum(score['score'] for score in scores),
+            'rubric_scores': scores,
+            'feedback': 'Graded by the fake backend.',
+        }
+
+    def _rubric(self, text: str) -> dict:
+        match = RUBRIC_TOTAL.search(text)
+        total = float(match['total']) if match else 10.0
+        return {'items': [{'label': f'Criterion {idx}', 'points': total / 3} for idx in range(1, 4)]}
+
+    def parse(self, request: dict, text_format: type[BaseModel], operation: str = 'grade') -> GraderResponse:
+        started = time.monotonic()
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        text = _request_text(request)
+        if 'rubric_scores' in text_format.model_fields:
+            data = self._grade(text)
+        else:
+            data = self._rubric(text)
+        parsed = text_format.model_validate(data)
+        return GraderResponse(
+            parsed,
+            parsed.model_dump_json(),
+            {'input_tokens': len(text) // 4, 'output_tokens': 0},
+            elapsed_ms=round((time.monotonic() - started) * 1000),
+        )
+
+
+GRADER_BACKENDS = {
+    OpenAIGrader.name: OpenAIGrader,
+    FakeGrader.name: FakeGrader,
+}
+
+_graders: dict[str, object] = {}
+_graders_lock = threading.Lock()
+
+
+def get_grader(name: str | None = None):
+    name = name or settings.GRADER_BACKEND
+    with _graders_lock:
+        if name not in _graders:
+            try:
+                _graders[name] = GRADER_BACKENDS[name]()
+            except KeyError as exc:
+                raise ImproperlyConfigured(f'Unknown grader backend {name!r}.') from exc
+        return _graders[name]
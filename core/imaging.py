@@ -0,0 +1,170 @@
+import base64
+import math
+import time
+from dataclasses import dataclass
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+
+FORMAT_MIME = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'png': 'image/png',
+}
+
+# Below this size a page is cheaper and just as legible at low detail.
+LOW_DETAIL_MAX_SIDE = 512
+# Pages where less than this fraction of pixels carries ink are treated as
+# documents (text, handwriting, diagrams) and encoded at the higher quality.
+DOCUMENT_INK_RATIO = 0.25
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime: str
+    width: int
+    height: int
+    detail: str
+
+    @property
+    def estimated_tokens(self) -> int:
+        return estimate_image_tokens(self.width, self.height, self.detail)
+
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    # OpenAI's tile accounting: fit in 2048x2048, shortest side to 768, 170 tokens per 512px tile.
+    if detail == 'low':
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 170 * tiles + 85
+
+
+def _flatten(pil_image: Image.Image) -> Image.Image:
+    if pil_image.mode in {'RGB', 'L'}:
+        return pil_image.copy()
+    rgba = pil_image.convert('RGBA')
+    background = Image.new('RGB', rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def _ink_ratio(pil_image: Image.Image) -> float:
+    sample = pil_image.convert('L')
+    sample.thumbnail((256, 256))
+    histogram = sample.histogram()
+    total = sum(histogram) or 1
+    return sum(histogram[:200]) / total
+
+
+def _choose_detail(width: int, height: int) -> str:
+    detail = settings.GRADING_IMAGE_DETAIL
+    if detail != 'auto':
+        return detail
+    return 'low' if max(width, height) <= LOW_DETAIL_MAX_SIDE else 'high'
+
+
+def prepare_image(image_bytes: bytes, mime: str) -> PreparedImage:
+    with Image.open(BytesIO(image_bytes)) as source:
+        pil_image = _flatten(source)
+
+    max_pixels = settings.GRADING_IMAGE_MAX_PIXELS
+    width, height = pil_image.size
+    if width * height > max_pixels:
+        factor = math.sqrt(max_pixels / (width * height))
+        width, height = max(1, int(width * factor)), max(1, int(height * factor))
+        pil_image = pil_image.resize((width, height), Image.LANCZOS)
+
+    if _ink_ratio(pil_image) < DOCUMENT_INK_RATIO:
+        quality = settings.GRADING_IMAGE_QUALITY
+    else:
+        quality = settings.GRADING_IMAGE_PHOTO_QUALITY
+
+    best_data, best_mime = image_bytes, mime
+    for image_format in settings.GRADING_IMAGE_FORMATS:
+        buffer = BytesIO()
+        if image_format == 'png':
+            pil_image.save(buffer, format='PNG', optimize=True)
+        else:
+            pil_image.save(buffer, format=image_format.upper(), quality=quality)
+        data = buffer.getvalue()
+        if best_data is image_bytes or len(data) < len(best_data):
+            best_data, best_mime = data, FORMAT_MIME[image_format]
+    pil_image.close()
+
+    return PreparedImage(
+        data=best_data,
+        mime=best_mime,
+        width=width,
+        height=height,
+        detail=_choose_detail(width, height),
+    )
+
+
+class PayloadTooLarge(RuntimeError):
+    pass
+
+
+class PayloadBuilder:
+    """Builds a Responses API `content` list one page at a time.
+
+    Each page is prepared and inlined as soon as it arrives, so only the encoded
+    payload plus the page in flight are held in memory; `max_bytes` bounds the
+    payload and therefore the peak memory of a grading job.
+    """
+
+    def __init__(self, max_bytes: int | None = None):
+        self.max_bytes = settings.GRADING_MAX_PAYLOAD_BYTES if max_bytes is None else max_bytes
+        self.content: list[dict] = []
+        self.size = 0
+        self.stats = {
+            'image_count': 0,
+            'source_bytes': 0,
+            'payload_bytes': 0,
+            'estimated_image_tokens': 0,
+            # Time waiting for page bytes (rendering, cache reads) vs. preparing them.
+            'render_ms': 0,
+            'encode_ms': 0,
+        }
+
+    def add_text(self, text: str) -> None:
+        self.content.append({'type': 'input_text', 'text': text})
+        self.size += len(text)
+
+    def add_image(self, image_bytes: bytes, mime: str) -> None:
+        started = time.perf_counter()
+        image = prepare_image(image_bytes, mime)
+        self.stats['encode_ms'] += round((time.perf_counter() - started) * 1000)
+        self.add_prepared(image, len(image_bytes))
+
+    def add_prepared(self, image: PreparedImage, source_bytes: int) -> None:
+        data_url = image.data_url()
+        if self.size + len(data_url) > self.max_bytes:
+            raise PayloadTooLarge(
+                f'Images exceed the {self.max_bytes // (1024 * 1024)} MB grading payload limit '
+                f'after {self.stats["image_count"]} page(s).'
+            )
+        self.content.append({'type': 'input_image', 'image_url': data_url, 'detail': image.detail})
+        self.size += len(data_url)
+        self.stats['image_count'] += 1
+        self.stats['source_bytes'] += source_bytes
+        self.stats['payload_bytes'] += len(image.data)
+        self.stats['estimated_image_tokens'] += image.estimated_tokens
+
+    def add_images(self, images) -> None:
+        images = iter(images)
+        while True:
+            started = time.perf_counter()
+            item = next(images, None)
+            self.stats['render_ms'] += round((time.perf_counter() - started) * 1000)
+            if item is None:
+                break
+            self.add_image(*item)
@@ -0,0 +1,138 @@
+import statistics
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core import models, services
+
+# Indexes that serve the hot queries (migrations 0014 and 0016); --compare plans each query without them.
+HOT_PATH_INDEXES = {
+    'appeal_created_idx',
+    'appeal_open_idx',
+    'autograderun_latest_idx',
+    'grade_best_idx',
+    'problemset_course_due_idx',
+    'submission_draft_idx',
+}
+
+
+def hot_queries() -> dict:
+    """The hot read paths, bound to representative rows of the current database."""
+    # Ordered by the selected column so DISTINCT applies to submission ids alone.
+    submission_ids = list(
+        models.Grade.objects.values_list('submission_id', flat=True).order_by('-submission_id').distinct()[:50]
+    )
+    submission_id = submission_ids[0] if submission_ids else 0
+    problem_set = models.ProblemSet.objects.order_by('-id').select_related('course').first()
+    if problem_set is None:
+        raise CommandError("No data to benchmark; seed the database first (manage.py seed_scale).")
+    course_ids = list(models.Class.objects.filter(professor_id=problem_set.course.professor_id).values_list('id', flat=True))
+    return {
+        'best_grades': models.Grade.objects.filter(submission_id__in=submission_ids)
+        .order_by('submission_id', *services.best_grade_order())
+        .only('id', 'submission_id', 'score'),
+        'latest_autograde': models.AutoGradeRun.objects.filter(submission_id=submission_id)
+        .order_by('-created_at', '-id')[:1],
+        'appeals_list': models.Appeal.objects.filter(
+            submission__problem__problem_set__course__professor_id=problem_set.course.professor_id
+        ).order_by('-created_at')[:50],
+        'open_appeals_per_set': models.Appeal.objects.filter(
+            submission__problem__problem_set_id=problem_set.id,
+            status=models.Appeal.STATUS_OPEN,
+        )
+        .values_list('submission__problem__problem_set_id')
+        .annotate(count=Count('id')),
+        'upcoming_problem_sets': models.ProblemSet.objects.filter(course_id__in=course_ids, due_at__isnull=False)
+        .order_by('due_at'),
+        'overdue_drafts': services.overdue_drafts().order_by('id').values_list('id', flat=True)[:500],
+        'claimable_jobs': models.GradingJob.objects.filter(services._claimable_jobs(timezone.now()))
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:8],
+    }
+
+
+def measure(queryset, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def without_hot_path_indexes(func):
+    """Run `func()` with HOT_PATH_INDEXES dropped, in a transaction that is rolled back afterwards."""
+    editor = connection.schema_editor()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for model in apps.get_app_config('core').get_models():
+                for index in model._meta.indexes:
+                    if index.name in HOT_PATH_INDEXES:
+                        cursor.execute(
+                            editor.sql_delete_index
+                            % {'name': editor.quote_name(index.name), 'table': editor.quote_name(model._meta.db_table)}
+                        )
+        result = func()
+        transaction.set_rollback(True)
+    return result
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN and time the hot queries; run before and after a migration to compare plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Only these queries (default: all).')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed executions per query.')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (Postgres).')
+        parser.add_argument('--no-plan', action='store_true', help='Print timings only.')
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            help='Also time and EXPLAIN each query with the hot-path indexes dropped (rolled back afterwards; '
+            'this locks the tables, so use a benchmark database).',
+        )
+
+    def handle(self, *args, **options):
+        queries = hot_queries()
+        unknown = set(options['names']) - set(queries)
+        if unknown:
+            raise CommandError(f"Unknown queries: {', '.join(sorted(unknown))}. Choose from {', '.join(queries)}.")
+        queries = {name: queryset for name, queryset in queries.items() if not options['names'] or name in options['names']}
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+
+        def run():
+            return {
+                name: (
+                    measure(queryset, options['repeat']),
+                    None if options['no_plan'] else queryset.explain(**explain_options),
+                )
+                for name, queryset in queries.items()
+            }
+
+        before = without_hot_path_indexes(run) if options['compare'] else {}
+        for name, (timings, plan) in run().items():
+            self.stdout.write(
+                f"{name}: median {statistics.median(timings):.2f} ms, max {max(timings):.2f} ms "
+                f"over {len(timings)} run(s)"
+            )
+            if name in before:
+                before_timings, before_plan = before[name]
+                self.stdout.write(
+                    f"  without indexes: median {statistics.median(before_timings):.2f} ms, "
+                    f"max {max(before_timings):.2f} ms"
+                )
+                if before_plan is not None:
+                    self.write_plan('plan without indexes', before_plan)
+                    self.write_plan('plan with indexes', plan)
+            elif plan is not None:
+                self.write_plan(None, plan)
+
+    def write_plan(self, title, plan):
+        if title:
+            self.stdout.write(f"  {title}:")
+        for line in plan.splitlines():
+            self.stdout.write(f"    {line}")
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import gradebook, models
+
+
+class Command(BaseCommand):
+    help = "Write a class gradebook (one row per enrolled student and problem) as CSV or XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_id', type=int)
+        parser.add_argument('--format', choices=gradebook.FORMATS, default='csv')
+        parser.add_argument('--output', default='-', help="File to write; '-' (default) for stdout.")
+        parser.add_argument('--chunk-size', type=int, help='Rows per cursor fetch and per write.')
+
+    def handle(self, *args, **options):
+        try:
+            course = models.Class.objects.get(id=options['class_id'])
+        except models.Class.DoesNotExist:
+            raise CommandError(f"Class {options['class_id']} does not exist.")
+        chunks = gradebook.stream(course, options['format'], options['chunk_size'])
+        if options['output'] == '-':
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            return
+        size = 0
+        with open(options['output'], 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+                size += len(chunk)
+        self.stdout.write(f"Wrote {size} bytes to {options['output']}.")
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import batch, models, services
+
+
+class Command(BaseCommand):
+    help = "Submit queued bulk grading jobs through the Batch API and apply finished batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--problem-set', type=int, help='Queue every finalized submission in this problem set first.')
+        parser.add_argument('--no-cache', action='store_true', help='Ignore cached grading results.')
+        parser.add_argument('--backend', default='', help='Batch backend (default: GRADING_BATCH_BACKEND).')
+        parser.add_argument('--limit', type=int, default=0, help='Maximum requests per batch.')
+        parser.add_argument('--poll-only', action='store_true', help='Only check batches that were already submitted.')
+        parser.add_argument('--wait', action='store_true', help='Keep polling until every batch has finished.')
+        parser.add_argument('--poll-interval', type=float, default=60.0, help='Seconds between polls with --wait.')
+
+    def handle(self, *args, **options):
+        problem_set = None
+        if options['problem_set']:
+            try:
+                problem_set = models.ProblemSet.objects.get(id=options['problem_set'])
+            except models.ProblemSet.DoesNotExist as exc:
+                raise CommandError(f"Problem set {options['problem_set']} does not exist.") from exc
+            queued = services.enqueue_problem_set_grading(problem_set, use_cache=not options['no_cache'])
+            self.stdout.write(f"Queued {queued} submission(s) in {problem_set}.")
+
+        backend = batch.get_batch_backend(options['backend'] or None)
+        if not options['poll_only']:
+            while True:
+                submitted = batch.submit_grading_batch(backend, problem_set=problem_set, limit=options['limit'] or None)
+                if submitted is None:
+                    break
+                self.stdout.write(
+                    f"Batch {submitted.id}: {submitted.status}, {submitted.request_count} request(s), "
+                    f"{submitted.graded_count} graded from cache."
+                )
+
+        while True:
+            finished, pending = batch.poll_grading_batches(backend)
+            for item in finished:
+                self.stdout.write(
+                    f"Batch {item.id}: {item.status}, {item.graded_count} graded, {item.failed_count} failed."
+                )
+            self.stdout.write(f"{len(pending)} batch(es) still in progress.")
+            if not pending or not options['wait']:
+                break
+            time.sleep(options['poll_interval'])
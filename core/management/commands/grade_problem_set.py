@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import models, services
+
+
+class Command(BaseCommand):
+    help = "Grade (or regrade) every finalized submission in a problem set. Safe to re-run after a crash."
+
+    def add_arguments(self, parser):
+        parser.add_argument('problem_set_id', type=int)
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.GRADING_BULK_CONCURRENCY,
+            help='Maximum grading API requests in flight.',
+        )
+        parser.add_argument('--no-cache', action='store_true', help='Ignore cached grading results.')
+        parser.add_argument('--batch-size', type=int, default=25, help='Results written per bulk insert.')
+
+    def handle(self, *args, **options):
+        try:
+            problem_set = models.ProblemSet.objects.get(id=options['problem_set_id'])
+        except models.ProblemSet.DoesNotExist as exc:
+            raise CommandError(f"Problem set {options['problem_set_id']} does not exist.") from exc
+
+        # Enqueueing skips submissions that already have an active job, so a re-run
+        # after a crash resumes those and queues only the rest.
+        active = services.active_grading_jobs().filter(submission__problem__problem_set=problem_set)
+        resumed = active.count()
+        queued = services.enqueue_problem_set_grading(problem_set, use_cache=not options['no_cache'])
+        total = active.count()
+        if resumed:
+            self.stdout.write(f"Resuming {resumed} outstanding job(s) for {problem_set}.")
+        self.stdout.write(f"Queued {queued} submission(s) in {problem_set}.")
+        if not total:
+            return
+
+        def progress(done, failed):
+            self.stdout.write(f"  {done + failed}/{total} processed ({failed} failed)")
+
+        done, failed = services.run_grading_jobs(
+            f"{services.default_worker_id()}:bulk",
+            concurrency=options['concurrency'],
+            problem_set=problem_set,
+            persist_batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(f"Graded {done} submission(s); {failed} failed.")
+        outstanding = services.active_grading_jobs().filter(submission__problem__problem_set=problem_set).count()
+        if outstanding:
+            self.stdout.write(
+                f"{outstanding} job(s) deferred or awaiting retry (grading service unavailable?); re-run to resume."
+            )
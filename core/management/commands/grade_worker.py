@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import services
+
+
+class Command(BaseCommand):
+    help = "Claim and run queued grading jobs. Run several workers in parallel to scale out."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', default='', help='Lease owner name (default: host:pid).')
+        parser.add_argument('--concurrency', type=int, default=1, help='Grading requests in flight at once.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when idle.')
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            default=settings.GRADING_JOB_LEASE_SECONDS,
+            help='How long a claimed job stays leased before other workers may retry it.',
+        )
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+        parser.add_argument('--max-jobs', type=int, default=0, help='Exit after this many jobs (0 = no limit).')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or services.default_worker_id()
+        processed = 0
+        self.stdout.write(f"Grading worker {worker_id} started.")
+        try:
+            while True:
+                close_old_connections()
+                remaining = options['max_jobs'] - processed if options['max_jobs'] else 0
+                done, failed = services.run_grading_jobs(
+                    worker_id,
+                    concurrency=options['concurrency'],
+                    lease_seconds=options['lease_seconds'],
+                    persist_batch_size=1,
+                    max_jobs=remaining,
+                )
+                if done or failed:
+                    self.stdout.write(f"Graded {done} job(s), {failed} failed.")
+                processed += done + failed
+                if options['max_jobs'] and processed >= options['max_jobs']:
+                    break
+                if not done and not failed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Interrupted; leased jobs will be retried after their lease expires.")
+        finally:
+            self.stdout.write(f"Grading worker {worker_id} processed {processed} job(s).")
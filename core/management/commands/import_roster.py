@@ -0,0 +1,49 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import models, roster
+
+
+class Command(BaseCommand):
+    help = "Enroll the students listed in a roster CSV (an email column, or one email per line) in a class."
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_id', type=int)
+        parser.add_argument('roster', help="CSV file, or '-' for stdin.")
+        parser.add_argument('--create-missing', action='store_true', help='Create student accounts for unknown emails.')
+        parser.add_argument('--drop-unlisted', action='store_true', help='Unenroll students the roster no longer lists.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change and roll back.')
+
+    def handle(self, *args, **options):
+        try:
+            course = models.Class.objects.get(id=options['class_id'])
+        except models.Class.DoesNotExist:
+            raise CommandError(f"Class {options['class_id']} does not exist.")
+        if options['roster'] == '-':
+            text = sys.stdin.read()
+        else:
+            with open(options['roster'], encoding='utf-8-sig') as handle:
+                text = handle.read()
+
+        try:
+            with transaction.atomic():
+                report = roster.import_roster_csv(
+                    course,
+                    text,
+                    create_missing=options['create_missing'],
+                    drop_unlisted=options['drop_unlisted'],
+                )
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except roster.RosterError as exc:
+            raise CommandError(str(exc))
+
+        for label, emails in (('added', report.added), ('unknown', report.unknown), ('dropped', report.dropped)):
+            for email in emails:
+                self.stdout.write(f"{label}\t{email}")
+        for line, value, reason in report.skipped:
+            self.stdout.write(f"skipped\tline {line}\t{value}\t{reason}")
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(f"{prefix}{report.summary()}.")
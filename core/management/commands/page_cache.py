@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from core.page_cache import page_cache
+
+
+class Command(BaseCommand):
+    help = "Show rasterized page cache statistics, or evict/clear it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evict', action='store_true', help='Evict least recently used pages over the size limit.')
+        parser.add_argument('--clear', action='store_true', help='Remove every cached page.')
+        parser.add_argument('--reset-counts', action='store_true', help='Zero the hit and miss counters.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            page_cache.clear()
+            self.stdout.write("Page cache cleared.")
+        elif options['evict']:
+            evicted = page_cache.evict()
+            self.stdout.write(f"Evicted {evicted} page(s).")
+        if options['reset_counts']:
+            page_cache.reset_counts()
+            self.stdout.write("Hit and miss counters reset.")
+        stats = page_cache.stats()
+        self.stdout.write(f"Entries: {stats['entries']}, size: {stats['bytes']} / {stats['max_bytes']} bytes")
+        lookups = stats['total_hits'] + stats['total_misses']
+        hit_rate = f"{stats['total_hits'] / lookups:.1%}" if lookups else 'n/a'
+        since = f" since {stats['counted_since']:%Y-%m-%d %H:%M}" if stats['counted_since'] else ''
+        self.stdout.write(
+            f"Page hits: {stats['total_hits']}, misses: {stats['total_misses']} (hit rate {hit_rate}){since}"
+        )
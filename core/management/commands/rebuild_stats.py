@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed ProblemSetStats rows from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--problem-set', type=int, action='append', help='Only these problem set ids.')
+
+    def handle(self, *args, **options):
+        if options['problem_set']:
+            stats.refresh_problem_set_stats(options['problem_set'])
+            count = len(options['problem_set'])
+        else:
+            count = stats.rebuild_all()
+        self.stdout.write(f"Rebuilt stats for {count} problem set(s).")
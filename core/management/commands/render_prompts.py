@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core import models, services
+
+
+class Command(BaseCommand):
+    help = "Pre-render prompt PDF pages and previews for problems that are missing them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render every problem, even if up to date.')
+
+    def handle(self, *args, **options):
+        rendered = 0
+        failed = 0
+        for problem in models.Problem.objects.exclude(prompt_pdf='').iterator():
+            try:
+                before = problem.prompt_sha256
+                pages = services.render_prompt_pages(problem, force=options['force'])
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"Problem {problem.id}: {exc}")
+                continue
+            if options['force'] or problem.prompt_sha256 != before:
+                rendered += 1
+                self.stdout.write(f"Problem {problem.id}: {len(pages)} page(s).")
+        self.stdout.write(f"Rendered {rendered} problem(s); {failed} failed.")
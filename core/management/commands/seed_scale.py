@@ -0,0 +1,379 @@
+import hashlib
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from io import BytesIO
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from PIL import Image, ImageDraw
+
+from core import models, services, stats
+
+PAGE_SIZE = (850, 1100)
+PROMPTS = [
+    'Differentiate f(x) = x^3 sin(x).',
+    'Evaluate the integral of x e^x dx.',
+    'Find the limit of (1 + 1/n)^n as n -> infinity.',
+    'Solve dy/dx = 2y with y(0) = 3.',
+    'Find the Taylor series of cos(x) about 0.',
+    'Compute the area between y = x^2 and y = x.',
+]
+RUBRIC = [('Setup', 3), ('Method', 3), ('Final answer', 4)]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def page_image(lines: list[str], seed: int) -> Image.Image:
+    rnd = random.Random(seed)
+    image = Image.new('RGB', PAGE_SIZE, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    y = 60
+    for line in lines:
+        draw.text((60, y), line, fill=(0, 0, 0))
+        y += 40
+    # A few strokes so pages differ the way handwritten work does.
+    for _ in range(12):
+        x0, y0 = rnd.randrange(60, 700), rnd.randrange(y, 1000)
+        draw.line((x0, y0, x0 + rnd.randrange(20, 120), y0 + rnd.randrange(-20, 20)), fill=(20, 20, 120), width=3)
+    return image
+
+
+def png_bytes(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a deterministic synthetic dataset (professors, classes, problem sets, "
+        "problems with prompt PDFs, enrollments, submissions with page images, grade histories, appeals). "
+        "The defaults produce about 1M rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='seed', help='Username prefix; must not already be in use.')
+        parser.add_argument('--professors', type=int, default=5)
+        parser.add_argument('--classes-per-professor', type=int, default=4)
+        parser.add_argument('--problem-sets-per-class', type=int, default=6)
+        parser.add_argument('--problems-per-set', type=int, default=4)
+        parser.add_argument('--students', type=int, default=2000, help='Size of the student pool.')
+        parser.add_argument('--students-per-class', type=int, default=250)
+        parser.add_argument('--prompt-pages', type=int, default=2)
+        parser.add_argument('--submission-pages', type=int, default=2)
+        parser.add_argument('--submit-rate', type=float, default=0.9, help='Share of problems each student attempts.')
+        parser.add_argument('--draft-rate', type=float, default=0.05, help='Share of attempts left as drafts.')
+        parser.add_argument(
+            '--grades-per-submission',
+            type=int,
+            default=3,
+            help='AI grades (with runs) per submission; 10 reaches about 1M grades at the default sizes.',
+        )
+        parser.add_argument('--appeal-rate', type=float, default=0.02)
+        parser.add_argument('--pool-size', type=int, default=8, help='Distinct generated PDFs and page images.')
+        parser.add_argument('--password', default='seed', help='Password for every seeded user.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--epoch', type=date.fromisoformat, default=date(2026, 1, 5),
+            help='Date the schedule is built around (half the problem sets fall due before it).',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.counts: dict[str, int] = {}
+        # Every date is relative to a fixed epoch and every pick comes from self.rnd, so the
+        # same options always produce the same dataset. Pass --epoch with today's date to
+        # have half the problem sets past due now.
+        self.base = datetime.combine(options['epoch'], dt_time(), tzinfo=dt_timezone.utc)
+        User = get_user_model()
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Users prefixed {options['prefix']!r} already exist; pass another --prefix.")
+
+        self.stdout.write("Generating file pools...")
+        prompt_pool, submission_pool = self.make_pools(options)
+
+        with transaction.atomic():
+            password = make_password(options['password'])
+            professors = self.create(
+                User,
+                (
+                    User(username=f"{options['prefix']}-prof{idx}", email=f"{options['prefix']}-prof{idx}@example.edu",
+                         password=password, is_staff=True)
+                    for idx in range(options['professors'])
+                ),
+            )
+            students = self.create(
+                User,
+                (
+                    User(username=f"{options['prefix']}-student{idx}",
+                         email=f"{options['prefix']}-student{idx}@example.edu", password=password)
+                    for idx in range(options['students'])
+                ),
+            )
+            courses = self.create(
+                models.Class,
+                (
+                    models.Class(title=f'Calculus {professor_idx}.{idx}', term='Synthetic', professor=professor)
+                    for professor_idx, professor in enumerate(professors)
+                    for idx in range(options['classes_per_professor'])
+                ),
+            )
+            roster: dict[int, list] = {}
+            enrollments = []
+            for course in courses:
+                roster[course.id] = self.rnd.sample(students, min(options['students_per_class'], len(students)))
+                enrollments.extend(models.Enrollment(course=course, user=student) for student in roster[course.id])
+            self.create(models.Enrollment, enrollments)
+
+            span = options['problem_sets_per_class']
+            problem_sets = self.create(
+                models.ProblemSet,
+                (
+                    models.ProblemSet(
+                        course=course,
+                        title=f'Problem Set {idx + 1}',
+                        release_at=self.base + timedelta(days=7 * (idx - span)),
+                        due_at=self.base + timedelta(days=7 * (idx - span // 2)),
+                    )
+                    for course in courses
+                    for idx in range(span)
+                ),
+            )
+            prompts = [
+                (problem_set, idx, self.rnd.choice(prompt_pool))
+                for problem_set in problem_sets
+                for idx in range(options['problems_per_set'])
+            ]
+            problems = self.create(
+                models.Problem,
+                (
+                    models.Problem(
+                        problem_set=problem_set,
+                        title=f'Problem {idx + 1}',
+                        prompt_pdf=entry['pdf'],
+                        prompt_sha256=entry['sha256'],
+                        order=idx + 1,
+                    )
+                    for problem_set, idx, entry in prompts
+                ),
+            )
+            self.create_prompt_pages(problems, prompt_pool)
+            rubrics = self.create(models.Rubric, (models.Rubric(problem=problem) for problem in problems))
+            self.create(
+                models.RubricItem,
+                (
+                    models.RubricItem(rubric=rubric, label=label, points=points, order=order)
+                    for rubric in rubrics
+                    for order, (label, points) in enumerate(RUBRIC, start=1)
+                ),
+            )
+
+        rubric_by_problem = {rubric.problem_id: rubric for rubric in rubrics}
+        course_by_set = {problem_set.id: problem_set.course_id for problem_set in problem_sets}
+        due_by_set = {problem_set.id: problem_set.due_at for problem_set in problem_sets}
+        for number, problem in enumerate(problems, start=1):
+            with transaction.atomic():
+                self.seed_problem(
+                    problem,
+                    roster[course_by_set[problem.problem_set_id]],
+                    rubric_by_problem[problem.id],
+                    due_by_set[problem.problem_set_id],
+                    submission_pool,
+                    options,
+                )
+            if number % 50 == 0:
+                self.stdout.write(f"  {number}/{len(problems)} problems seeded ({self.total()} rows so far)")
+
+        self.stdout.write("Pointing submissions at their current grade and latest run...")
+        seeded = models.Submission.objects.filter(problem__in=problems)
+        seeded.update(
+            best_grade=Subquery(
+                models.Grade.objects.filter(submission=OuterRef('pk'))
+                .order_by(*services.best_grade_order())
+                .values('id')[:1]
+            ),
+            latest_autograde=Subquery(
+                models.AutoGradeRun.objects.filter(submission=OuterRef('pk'))
+                .order_by('-created_at', '-id')
+                .values('id')[:1]
+            ),
+        )
+        self.stdout.write("Computing problem-set stats...")
+        stats.refresh_problem_set_stats([problem_set.id for problem_set in problem_sets])
+
+        for name, count in self.counts.items():
+            self.stdout.write(f"  {name}: {count}")
+        self.stdout.write(
+            f"Seeded {self.total()} rows in {time.monotonic() - started:.0f}s "
+            f"(seed {options['seed']}; log in as {options['prefix']}-prof0 / {options['password']})."
+        )
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def create(self, model, objects) -> list:
+        created = []
+        for chunk in batched(objects, self.batch_size):
+            created.extend(model.objects.bulk_create(chunk))
+        name = model.__name__
+        self.counts[name] = self.counts.get(name, 0) + len(created)
+        return created
+
+    def make_pools(self, options) -> tuple[list[dict], list[str]]:
+        """A few generated prompt PDFs and submission pages, stored once and shared by every row."""
+        prompt_pool = []
+        for idx in range(options['pool_size']):
+            prompt = PROMPTS[idx % len(PROMPTS)]
+            pages = [
+                page_image([f'Problem: {prompt}', f'Page {number} of {options["prompt_pages"]}'], options['seed'] * 1000 + idx * 10 + number)
+                for number in range(1, options['prompt_pages'] + 1)
+            ]
+            buffer = BytesIO()
+            # PIL stamps the PDF with the current time unless given dates; pin them so the hash is stable.
+            pages[0].save(
+                buffer, format='PDF', save_all=True, append_images=pages[1:],
+                creationDate=self.base.timetuple(), modDate=self.base.timetuple(),
+            )
+            pdf = buffer.getvalue()
+            preview = pages[0].copy()
+            preview.thumbnail((1000, 4000))
+            prompt_pool.append(
+                {
+                    'pdf': default_storage.save(f'problem_prompts/seed-{options["seed"]}-{idx}.pdf', ContentFile(pdf)),
+                    'sha256': hashlib.sha256(pdf).hexdigest(),
+                    'pages': [png_bytes(page) for page in pages],
+                    'preview': png_bytes(preview),
+                }
+            )
+        submission_pool = [
+            default_storage.save(
+                f'submissions/seed-{options["seed"]}-{idx}.png',
+                ContentFile(png_bytes(page_image(['Student work', f'Sample {idx}'], options['seed'] * 7919 + idx))),
+            )
+            for idx in range(options['pool_size'])
+        ]
+        return prompt_pool, submission_pool
+
+    def create_prompt_pages(self, problems, prompt_pool) -> None:
+        # Page images are written per problem: re-rendering a prompt deletes its old page files.
+        pages = []
+        for problem in problems:
+            entry = next(item for item in prompt_pool if item['sha256'] == problem.prompt_sha256)
+            problem.prompt_preview.save(f'{problem.id}-{entry["sha256"][:12]}.png', ContentFile(entry['preview']), save=False)
+            for number, image_bytes in enumerate(entry['pages'], start=1):
+                page = models.ProblemPromptPage(
+                    problem=problem,
+                    page_number=number,
+                    width=PAGE_SIZE[0],
+                    height=PAGE_SIZE[1],
+                )
+                page.image.save(f'{problem.id}-{entry["sha256"][:12]}-{number}.png', ContentFile(image_bytes), save=False)
+                pages.append(page)
+        models.Problem.objects.bulk_update(problems, ['prompt_preview'], batch_size=self.batch_size)
+        self.create(models.ProblemPromptPage, pages)
+
+    def seed_problem(self, problem, students, rubric, due_at, submission_pool, options) -> None:
+        rnd = self.rnd
+        submissions = []
+        for student in students:
+            if rnd.random() >= options['submit_rate']:
+                continue
+            draft = rnd.random() < options['draft_rate']
+            submissions.append(
+                models.Submission(
+                    problem=problem,
+                    student=student,
+                    status=models.Submission.STATUS_DRAFT if draft else models.Submission.STATUS_SUBMITTED,
+                    submitted_at=None if draft else min(due_at, self.base) - timedelta(minutes=rnd.randrange(1, 7 * 24 * 60)),
+                )
+            )
+        # Scores are drawn first so final_score and status go in with the insert.
+        histories = {}
+        for submission in submissions:
+            if submission.status == models.Submission.STATUS_DRAFT:
+                continue
+            skill = rnd.betavariate(5, 2)
+            scores = [round(min(10, max(0, rnd.gauss(skill * 10, 1.5))), 2) for _ in range(options['grades_per_submission'])]
+            if scores:
+                submission.final_score = scores[-1]
+                submission.status = models.Submission.STATUS_GRADED
+            histories[id(submission)] = scores
+        submissions = self.create(models.Submission, submissions)
+
+        self.create(
+            models.SubmissionFile,
+            (
+                models.SubmissionFile(
+                    submission=submission,
+                    file=rnd.choice(submission_pool),
+                    mime_type='image/png',
+                    page_number=page,
+                )
+                for submission in submissions
+                for page in range(1, options['submission_pages'] + 1)
+            ),
+        )
+
+        runs, grades, appeals = [], [], []
+        for submission in submissions:
+            scores = histories.get(id(submission), [])
+            for attempt, score in enumerate(scores):
+                finalized_at = submission.submitted_at + timedelta(minutes=5 + attempt * 90)
+                rubric_scores = [
+                    {'label': label, 'score': round(score * points / 10, 2), 'status': 'partial'}
+                    for label, points in RUBRIC
+                ]
+                runs.append(
+                    models.AutoGradeRun(
+                        submission=submission,
+                        rubric=rubric,
+                        model='seed',
+                        raw_output_json={'parsed': {'total_score': score, 'rubric_scores': rubric_scores, 'feedback': 'Seeded.'}},
+                        score=score,
+                        input_tokens=rnd.randrange(1500, 4000),
+                        output_tokens=rnd.randrange(150, 400),
+                        render_ms=rnd.randrange(50, 400),
+                        encode_ms=rnd.randrange(10, 80),
+                        api_ms=rnd.randrange(2000, 12000),
+                        persist_ms=rnd.randrange(2, 30),
+                        image_count=options['submission_pages'] + options['prompt_pages'],
+                        created_at=finalized_at,
+                    )
+                )
+                grades.append(
+                    models.Grade(
+                        submission=submission,
+                        rubric=rubric,
+                        score=score,
+                        feedback='Seeded.',
+                        grader_type=models.Grade.GRADER_AUTO,
+                        finalized_at=finalized_at,
+                    )
+                )
+            if scores and rnd.random() < options['appeal_rate']:
+                appeals.append(
+                    models.Appeal(
+                        submission=submission,
+                        student_id=submission.student_id,
+                        reason='Please take another look at my method.',
+                        status=models.Appeal.STATUS_OPEN if rnd.random() < 0.3 else models.Appeal.STATUS_CLOSED,
+                        created_at=submission.submitted_at + timedelta(days=2),
+                    )
+                )
+        self.create(models.AutoGradeRun, runs)
+        self.create(models.Grade, grades)
+        self.create(models.Appeal, appeals)
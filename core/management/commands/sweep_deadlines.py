@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import services
+
+
+class Command(BaseCommand):
+    help = "Finalize draft submissions left at the deadline and queue their grading."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between sweeps.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Drafts finalized per transaction.')
+        parser.add_argument('--once', action='store_true', help='Sweep once and exit (for cron).')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()
+                finalized = services.sweep_overdue_drafts(batch_size=options['batch_size'])
+                if finalized or options['once']:
+                    self.stdout.write(f"Finalized {finalized} overdue draft(s).")
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_gradingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('page_index', models.PositiveIntegerField()),
+                ('page_count', models.PositiveIntegerField()),
+                ('scale', models.FloatField()),
+                ('encoding', models.CharField(max_length=20)),
+                ('storage_name', models.CharField(max_length=255)),
+                ('size_bytes', models.PositiveIntegerField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['content_hash', 'scale', 'encoding'], name='pagecache_doc_idx'), models.Index(fields=['last_used_at'], name='pagecache_lru_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_pagecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='prompt_preview',
+            field=models.FileField(blank=True, upload_to='problem_prompt_previews/'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='prompt_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ProblemPromptPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('image', models.FileField(upload_to='problem_prompt_pages/')),
+                ('mime_type', models.CharField(default='image/png', max_length=100)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prompt_pages', to='core.problem')),
+            ],
+            options={
+                'ordering': ['page_number', 'id'],
+                'constraints': [models.UniqueConstraint(fields=('problem', 'page_number'), name='uniq_prompt_page')],
+            },
+        ),
+    ]
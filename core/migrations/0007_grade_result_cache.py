@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_problem_prompt_artifacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeResultCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model', models.CharField(max_length=100)),
+                ('result_json', models.JSONField()),
+                ('raw_text', models.TextField(blank=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='cache_hit',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='cache_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='gradingjob',
+            name='use_cache',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_grade_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autograderun',
+            name='cached_input_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='input_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='output_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
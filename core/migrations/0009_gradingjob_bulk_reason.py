@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_autograderun_token_usage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gradingjob',
+            name='reason',
+            field=models.CharField(choices=[('finalize', 'Finalize'), ('regrade', 'Regrade'), ('bulk', 'Bulk')], default='finalize', max_length=20),
+        ),
+    ]
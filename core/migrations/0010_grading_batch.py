@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_gradingjob_bulk_reason'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend', models.CharField(max_length=20)),
+                ('provider_batch_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('building', 'Building'), ('submitted', 'Submitted'), ('completed', 'Completed'), ('failed', 'Failed')], default='building', max_length=20)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('graded_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('manifest', models.JSONField(blank=True, default=dict)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('submitted_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='gradingjob',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='core.gradingbatch'),
+        ),
+    ]
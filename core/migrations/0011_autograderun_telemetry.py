@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_grading_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autograderun',
+            name='api_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='encode_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='image_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='payload_bytes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='persist_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='render_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='autograderun',
+            name='retries',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='autograderun',
+            index=models.Index(fields=['created_at'], name='autograderun_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autograderun',
+            index=models.Index(fields=['model', 'created_at'], name='autograderun_model_idx'),
+        ),
+    ]
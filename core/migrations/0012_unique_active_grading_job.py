@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:55
+
+from django.db import migrations, models
+
+
+def merge_duplicate_active_jobs(apps, schema_editor):
+    GradingJob = apps.get_model('core', 'GradingJob')
+    active = GradingJob.objects.filter(status__in=['queued', 'running']).order_by('submission_id', 'id')
+    kept = {}
+    duplicates = []
+    for job in active.only('id', 'submission_id'):
+        if job.submission_id in kept:
+            duplicates.append(job.id)
+        else:
+            kept[job.submission_id] = job.id
+    for start in range(0, len(duplicates), 500):
+        GradingJob.objects.filter(id__in=duplicates[start:start + 500]).update(
+            status='done',
+            last_error='Merged into an earlier job for the same submission.',
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_autograderun_telemetry'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='gradingjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('submission',), name='uniq_active_grading_job'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_unique_active_grading_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemSetStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('problem_count', models.PositiveIntegerField(default=0)),
+                ('enrollment_count', models.PositiveIntegerField(default=0)),
+                ('submission_count', models.PositiveIntegerField(default=0)),
+                ('graded_count', models.PositiveIntegerField(default=0)),
+                ('completion_percent', models.FloatField(default=0)),
+                ('mean_score', models.FloatField(blank=True, null=True)),
+                ('median_score', models.FloatField(blank=True, null=True)),
+                ('stddev_score', models.FloatField(blank=True, null=True)),
+                ('open_appeals', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('problem_set', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='core.problemset')),
+            ],
+        ),
+    ]
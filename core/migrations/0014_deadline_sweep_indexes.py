@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_problem_set_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='problemset',
+            index=models.Index(fields=['due_at'], name='problemset_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('status', 'draft')), fields=['problem'], name='submission_draft_idx'),
+        ),
+    ]
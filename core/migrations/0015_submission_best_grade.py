@@ -0,0 +1,52 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_pointers(apps, schema_editor):
+    Submission = apps.get_model('core', 'Submission')
+    Grade = apps.get_model('core', 'Grade')
+    AutoGradeRun = apps.get_model('core', 'AutoGradeRun')
+    ids = list(Submission.objects.filter(grades__isnull=False).distinct().values_list('id', flat=True).order_by('id'))
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        best = {}
+        for grade in Grade.objects.filter(submission_id__in=chunk).order_by(
+            'submission_id', '-score', '-finalized_at', '-id'
+        ).only('id', 'submission_id', 'score'):
+            best.setdefault(grade.submission_id, grade)
+        latest = {}
+        for run in AutoGradeRun.objects.filter(submission_id__in=chunk).order_by(
+            'submission_id', '-created_at', '-id'
+        ).only('id', 'submission_id'):
+            latest.setdefault(run.submission_id, run.id)
+        submissions = list(Submission.objects.filter(id__in=chunk))
+        for submission in submissions:
+            grade = best[submission.id]
+            submission.best_grade_id = grade.id
+            submission.final_score = grade.score
+            submission.status = 'graded'
+            submission.latest_autograde_id = latest.get(submission.id)
+        Submission.objects.bulk_update(submissions, ['best_grade', 'latest_autograde', 'final_score', 'status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_deadline_sweep_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='best_grade',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.grade'),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='latest_autograde',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.autograderun'),
+        ),
+        migrations.RunPython(backfill_pointers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_submission_best_grade'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appeal',
+            index=models.Index(fields=['-created_at'], name='appeal_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appeal',
+            index=models.Index(condition=models.Q(('status', 'open')), fields=['submission'], name='appeal_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autograderun',
+            index=models.Index(fields=['submission', '-created_at', '-id'], name='autograderun_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['submission', '-score', '-finalized_at', '-id'], name='grade_best_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='problemset',
+            index=models.Index(fields=['course', 'due_at'], name='problemset_course_due_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:40
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    ProblemSetStats = apps.get_model('core', 'ProblemSetStats')
+    Submission = apps.get_model('core', 'Submission')
+    totals = (
+        Submission.objects.exclude(status='draft')
+        .filter(final_score__isnull=False)
+        .values('problem__problem_set_id')
+        .annotate(count=Count('id'), total=Sum('final_score'), squares=Sum(F('final_score') * F('final_score')))
+    )
+    for row in totals:
+        ProblemSetStats.objects.filter(problem_set_id=row['problem__problem_set_id']).update(
+            score_count=row['count'],
+            score_sum=float(row['total']),
+            score_sum_squares=float(row['squares']),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='problemsetstats',
+            name='completion_percent',
+        ),
+        migrations.RemoveField(
+            model_name='problemsetstats',
+            name='mean_score',
+        ),
+        migrations.RemoveField(
+            model_name='problemsetstats',
+            name='stddev_score',
+        ),
+        migrations.AddField(
+            model_name='problemsetstats',
+            name='median_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='problemsetstats',
+            name='score_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='problemsetstats',
+            name='score_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='problemsetstats',
+            name='score_sum_squares',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:42
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Sum, When
+
+
+def point_at_current_grades(apps, schema_editor):
+    # The pointer and final_score followed the highest grade; the latest professor
+    # grade (else the latest grade) is the authoritative one.
+    Submission = apps.get_model('core', 'Submission')
+    Grade = apps.get_model('core', 'Grade')
+    ProblemSetStats = apps.get_model('core', 'ProblemSetStats')
+    ids = list(Submission.objects.filter(grades__isnull=False).distinct().values_list('id', flat=True).order_by('id'))
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        current = {}
+        for grade in Grade.objects.filter(submission_id__in=chunk).order_by(
+            'submission_id', Case(When(grader_type='professor', then=0), default=1), '-finalized_at', '-id'
+        ).only('id', 'submission_id', 'score'):
+            current.setdefault(grade.submission_id, grade)
+        submissions = list(Submission.objects.filter(id__in=chunk).only('id', 'current_grade', 'final_score'))
+        for submission in submissions:
+            submission.current_grade_id = current[submission.id].id
+            submission.final_score = current[submission.id].score
+        Submission.objects.bulk_update(submissions, ['current_grade', 'final_score'])
+
+    totals = (
+        Submission.objects.exclude(status='draft')
+        .filter(final_score__isnull=False)
+        .values('problem__problem_set_id')
+        .annotate(count=Count('id'), total=Sum('final_score'), squares=Sum(F('final_score') * F('final_score')))
+    )
+    for row in totals:
+        ProblemSetStats.objects.filter(problem_set_id=row['problem__problem_set_id']).update(
+            score_count=row['count'],
+            score_sum=float(row['total']),
+            score_sum_squares=float(row['squares']),
+            median_stale=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_problemsetstats_running_totals'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='submission',
+            old_name='best_grade',
+            new_name='current_grade',
+        ),
+        migrations.RemoveIndex(
+            model_name='grade',
+            name='grade_best_idx',
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['submission', '-finalized_at', '-id'], name='grade_latest_idx'),
+        ),
+        migrations.RunPython(point_at_current_grades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_submission_current_grade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCacheCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('misses', models.PositiveBigIntegerField(default=0)),
+                ('reset_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
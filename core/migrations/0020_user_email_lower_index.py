@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# The user model belongs to another app, so the index is added through the schema
+# editor rather than AddIndex. Roster imports look students up by lower-cased email.
+EMAIL_LOWER_INDEX = models.Index(Lower('email'), name='user_email_lower_idx')
+
+
+def add_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model(settings.AUTH_USER_MODEL), EMAIL_LOWER_INDEX)
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model(settings.AUTH_USER_MODEL), EMAIL_LOWER_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_pagecachecounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0.1 on 2026-10-17 00:20
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def point_at_best_grades(apps, schema_editor):
+    # 0018 pointed submissions at their latest (or professor) grade; the highest
+    # grade is the one that counts.
+    Submission = apps.get_model('core', 'Submission')
+    Grade = apps.get_model('core', 'Grade')
+    ProblemSetStats = apps.get_model('core', 'ProblemSetStats')
+    ids = list(Submission.objects.filter(grades__isnull=False).distinct().values_list('id', flat=True).order_by('id'))
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        best = {}
+        for grade in Grade.objects.filter(submission_id__in=chunk).order_by(
+            'submission_id', '-score', '-finalized_at', '-id'
+        ).only('id', 'submission_id', 'score'):
+            best.setdefault(grade.submission_id, grade)
+        submissions = list(Submission.objects.filter(id__in=chunk).only('id', 'best_grade', 'final_score'))
+        for submission in submissions:
+            submission.best_grade_id = best[submission.id].id
+            submission.final_score = best[submission.id].score
+        Submission.objects.bulk_update(submissions, ['best_grade', 'final_score'])
+
+    totals = (
+        Submission.objects.exclude(status='draft')
+        .filter(final_score__isnull=False)
+        .values('problem__problem_set_id')
+        .annotate(count=Count('id'), total=Sum('final_score'), squares=Sum(F('final_score') * F('final_score')))
+    )
+    for row in totals:
+        ProblemSetStats.objects.filter(problem_set_id=row['problem__problem_set_id']).update(
+            score_count=row['count'],
+            score_sum=float(row['total']),
+            score_sum_squares=float(row['squares']),
+            median_stale=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='submission',
+            old_name='current_grade',
+            new_name='best_grade',
+        ),
+        migrations.RemoveIndex(
+            model_name='grade',
+            name='grade_latest_idx',
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['submission', '-score', '-finalized_at', '-id'], name='grade_best_idx'),
+        ),
+        migrations.RunPython(point_at_best_grades, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import math
+
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
@@ -50,14 +52,61 @@ class ProblemSet(models.Model):
     due_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['due_at'], name='problemset_due_idx'),
+            models.Index(fields=['course', 'due_at'], name='problemset_course_due_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.title} ({self.course})"
 
 
+class ProblemSetStats(models.Model):
+    """Precomputed per-problem-set figures for dashboards; see core.stats."""
+
+    problem_set = models.OneToOneField(ProblemSet, on_delete=models.CASCADE, related_name='stats')
+    problem_count = models.PositiveIntegerField(default=0)
+    enrollment_count = models.PositiveIntegerField(default=0)
+    submission_count = models.PositiveIntegerField(default=0)
+    graded_count = models.PositiveIntegerField(default=0)
+    # Running totals over the final scores of submitted work; mean and stddev derive from them.
+    score_count = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_sum_squares = models.FloatField(default=0)
+    median_score = models.FloatField(null=True, blank=True)
+    # Set whenever a score changes; the median is recomputed when next displayed.
+    median_stale = models.BooleanField(default=False)
+    open_appeals = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @property
+    def completion_percent(self) -> float:
+        expected = self.enrollment_count * self.problem_count
+        return round(self.submission_count / expected * 100, 1) if expected else 0
+
+    @property
+    def mean_score(self) -> float | None:
+        return self.score_sum / self.score_count if self.score_count else None
+
+    @property
+    def stddev_score(self) -> float | None:
+        if not self.score_count:
+            return None
+        mean = self.score_sum / self.score_count
+        # Rounding in the running sums can leave a tiny negative variance.
+        return math.sqrt(max(self.score_sum_squares / self.score_count - mean * mean, 0))
+
+    def __str__(self) -> str:
+        return f"Stats for {self.problem_set_id}"
+
+
 class Problem(models.Model):
     problem_set = models.ForeignKey(ProblemSet, on_delete=models.CASCADE, related_name='problems')
     title = models.CharField(max_length=200)
     prompt_pdf = models.FileField(upload_to='problem_prompts/')
+    prompt_sha256 = models.CharField(max_length=64, blank=True)
+    prompt_preview = models.FileField(upload_to='problem_prompt_previews/', blank=True)
     max_score = models.PositiveIntegerField(default=10)
     order = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(default=timezone.now)
@@ -69,6 +118,24 @@ class Problem(models.Model):
         return f"{self.title} ({self.problem_set})"
 
 
+class ProblemPromptPage(models.Model):
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='prompt_pages')
+    page_number = models.PositiveIntegerField()
+    image = models.FileField(upload_to='problem_prompt_pages/')
+    mime_type = models.CharField(max_length=100, default='image/png')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['page_number', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['problem', 'page_number'], name='uniq_prompt_page'),
+        ]
+
+    def __str__(self) -> str:
+        return f"Prompt page {self.page_number} for {self.problem_id}"
+
+
 class Rubric(models.Model):
     problem = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='rubrics')
     version = models.PositiveIntegerField(default=1)
@@ -113,11 +180,26 @@ class Submission(models.Model):
     submitted_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_DRAFT)
     final_score = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    # Maintained by services.apply_best_grades / persist_autograde_outcomes so pages
+    # never have to sort a submission's grades or runs. The best grade is the highest
+    # scoring one (the latest among ties); final_score is its score.
+    best_grade = models.ForeignKey('Grade', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    latest_autograde = models.ForeignKey(
+        'AutoGradeRun',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['problem', 'student'], name='uniq_submission'),
         ]
+        indexes = [
+            # Only drafts are swept at the deadline, and they are a small share of the table.
+            models.Index(fields=['problem'], condition=models.Q(status='draft'), name='submission_draft_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"Submission for {self.problem} by {self.student}"
@@ -142,12 +224,132 @@ class AutoGradeRun(models.Model):
     model = models.CharField(max_length=100)
     raw_output_json = models.JSONField()
     score = models.DecimalField(max_digits=6, decimal_places=2)
+    cache_key = models.CharField(max_length=64, blank=True)
+    cache_hit = models.BooleanField(default=False)
+    input_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cached_input_tokens = models.PositiveIntegerField(null=True, blank=True)
+    output_tokens = models.PositiveIntegerField(null=True, blank=True)
+    # Per-stage timings in milliseconds; null for runs that skipped the stage.
+    render_ms = models.PositiveIntegerField(null=True, blank=True)
+    encode_ms = models.PositiveIntegerField(null=True, blank=True)
+    api_ms = models.PositiveIntegerField(null=True, blank=True)
+    persist_ms = models.PositiveIntegerField(null=True, blank=True)
+    image_count = models.PositiveIntegerField(null=True, blank=True)
+    payload_bytes = models.PositiveIntegerField(null=True, blank=True)
+    retries = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='autograderun_created_idx'),
+            models.Index(fields=['submission', '-created_at', '-id'], name='autograderun_latest_idx'),
+            models.Index(fields=['model', 'created_at'], name='autograderun_model_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"AutoGrade {self.submission_id} ({self.score})"
 
 
+class GradeResultCacheEntry(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    result_json = models.JSONField()
+    raw_text = models.TextField(blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Cached grade {self.key[:12]} ({self.model})"
+
+
+class GradingBatch(models.Model):
+    STATUS_BUILDING = 'building'
+    STATUS_SUBMITTED = 'submitted'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_BUILDING, 'Building'),
+        (STATUS_SUBMITTED, 'Submitted'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    backend = models.CharField(max_length=20)
+    provider_batch_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_BUILDING)
+    model = models.CharField(max_length=100, blank=True)
+    request_count = models.PositiveIntegerField(default=0)
+    graded_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    # Per-job details needed to map results back: {job id: {rubric_id, cache_key, payload}}.
+    manifest = models.JSONField(default=dict, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    submitted_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def worker_id(self) -> str:
+        return f"batch-{self.id}"
+
+    def __str__(self) -> str:
+        return f"Grading batch {self.id} ({self.backend}, {self.status})"
+
+
+class GradingJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    REASON_FINALIZE = 'finalize'
+    REASON_REGRADE = 'regrade'
+    REASON_BULK = 'bulk'
+    REASON_CHOICES = [
+        (REASON_FINALIZE, 'Finalize'),
+        (REASON_REGRADE, 'Regrade'),
+        (REASON_BULK, 'Bulk'),
+    ]
+
+    submission = models.ForeignKey(Submission, on_delete=models.CASCADE, related_name='grading_jobs')
+    rubric = models.ForeignKey(Rubric, on_delete=models.SET_NULL, null=True, blank=True)
+    batch = models.ForeignKey(GradingBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, default=REASON_FINALIZE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    use_cache = models.BooleanField(default=True)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    leased_by = models.CharField(max_length=200, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='gradingjob_claim_idx'),
+        ]
+        constraints = [
+            # At most one queued or running job per submission; new requests join it.
+            models.UniqueConstraint(
+                fields=['submission'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='uniq_active_grading_job',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Grading job {self.id} for {self.submission_id} ({self.status})"
+
+
 class Grade(models.Model):
     GRADER_AUTO = 'auto'
     GRADER_PROFESSOR = 'professor'
@@ -170,6 +372,12 @@ class Grade(models.Model):
     )
     finalized_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # apply_best_grades: per-submission grades in best-first order.
+            models.Index(fields=['submission', '-score', '-finalized_at', '-id'], name='grade_best_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.grader_type} grade {self.score} for {self.submission_id}"
 
@@ -188,6 +396,13 @@ class Appeal(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at'], name='appeal_created_idx'),
+            # Open appeals are few; stats and the dashboard only count those.
+            models.Index(fields=['submission'], condition=models.Q(status='open'), name='appeal_open_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"Appeal for {self.submission_id}"
 
@@ -203,3 +418,37 @@ class AppealMessage(models.Model):
 
     def __str__(self) -> str:
         return f"Message for appeal {self.appeal_id}"
+
+
+class PageCacheEntry(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=64)
+    page_index = models.PositiveIntegerField()
+    page_count = models.PositiveIntegerField()
+    scale = models.FloatField()
+    encoding = models.CharField(max_length=20)
+    storage_name = models.CharField(max_length=255)
+    size_bytes = models.PositiveIntegerField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_hash', 'scale', 'encoding'], name='pagecache_doc_idx'),
+            models.Index(fields=['last_used_at'], name='pagecache_lru_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"Page {self.page_index + 1}/{self.page_count} of {self.content_hash[:12]}"
+
+
+class PageCacheCounter(models.Model):
+    """Page cache lookups across all processes since the counters were last reset (a single row)."""
+
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    reset_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f"Page cache: {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,171 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import models
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_obj:
+        for chunk in iter(lambda: file_obj.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PageImageCache:
+    """Rendered page images keyed by (content hash, page, scale, encoding).
+
+    Bytes live in a Django storage backend; the PageCacheEntry table is the index
+    used for per-document lookups and LRU eviction, so the cache works the same
+    on local disk and on shared storage used by several hosts.
+    """
+
+    def __init__(self, storage=None, max_bytes: int | None = None):
+        self.storage = storage
+        self.max_bytes = settings.PAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        # This process's lookups, and those not yet added to the shared PageCacheCounter.
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = [0, 0]
+        self._lock = threading.Lock()
+
+    def _storage(self):
+        if self.storage is None:
+            if settings.PAGE_CACHE_STORAGE:
+                self.storage = storages[settings.PAGE_CACHE_STORAGE]
+            else:
+                self.storage = FileSystemStorage(location=settings.PAGE_CACHE_ROOT)
+        return self.storage
+
+    @staticmethod
+    def make_key(content_hash: str, page_index: int, scale: float, encoding: str) -> str:
+        return f"{content_hash}/{scale:g}-{encoding}/{page_index}"
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self._unsaved[0] += 1
+            else:
+                self.misses += 1
+                self._unsaved[1] += 1
+
+    def save_counts(self) -> None:
+        """Add this process's lookups since the last call to the shared counters (one UPDATE)."""
+        with self._lock:
+            (hits, misses), self._unsaved = self._unsaved, [0, 0]
+        if not hits and not misses:
+            return
+        counters = models.PageCacheCounter.objects.filter(pk=1)
+        if not counters.update(hits=F('hits') + hits, misses=F('misses') + misses):
+            models.PageCacheCounter.objects.get_or_create(pk=1)
+            counters.update(hits=F('hits') + hits, misses=F('misses') + misses)
+
+    def document_entries(self, content_hash: str, scale: float, encoding: str) -> dict[int, models.PageCacheEntry]:
+        entries = models.PageCacheEntry.objects.filter(content_hash=content_hash, scale=scale, encoding=encoding)
+        return {entry.page_index: entry for entry in entries}
+
+    def read(self, entry: models.PageCacheEntry | None) -> bytes | None:
+        if entry is None:
+            self._count(False)
+            return None
+        try:
+            with self._storage().open(entry.storage_name, 'rb') as file_obj:
+                data = file_obj.read()
+        except (FileNotFoundError, OSError):
+            # Bytes were removed behind our back; drop the stale index row.
+            entry.delete()
+            self._count(False)
+            return None
+        self._count(True)
+        return data
+
+    def touch(self, entries: list[models.PageCacheEntry]) -> None:
+        if entries:
+            models.PageCacheEntry.objects.filter(id__in=[entry.id for entry in entries]).update(
+                hits=F('hits') + 1,
+                last_used_at=timezone.now(),
+            )
+
+    def put(
+        self,
+        content_hash: str,
+        page_index: int,
+        page_count: int,
+        scale: float,
+        encoding: str,
+        data: bytes,
+    ) -> None:
+        storage = self._storage()
+        key = self.make_key(content_hash, page_index, scale, encoding)
+        if storage.exists(key):
+            storage.delete(key)
+        storage_name = storage.save(key, ContentFile(data))
+        models.PageCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'content_hash': content_hash,
+                'page_index': page_index,
+                'page_count': page_count,
+                'scale': scale,
+                'encoding': encoding,
+                'storage_name': storage_name,
+                'size_bytes': len(data),
+                'last_used_at': timezone.now(),
+            },
+        )
+
+    def total_bytes(self) -> int:
+        return models.PageCacheEntry.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+
+    def evict(self) -> int:
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+        storage = self._storage()
+        evicted = 0
+        for entry in models.PageCacheEntry.objects.order_by('last_used_at', 'id').iterator():
+            if total <= self.max_bytes:
+                break
+            storage.delete(entry.storage_name)
+            entry.delete()
+            total -= entry.size_bytes
+            evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        storage = self._storage()
+        for entry in models.PageCacheEntry.objects.iterator():
+            storage.delete(entry.storage_name)
+        models.PageCacheEntry.objects.all().delete()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.hits = self.misses = 0
+            self._unsaved = [0, 0]
+        models.PageCacheCounter.objects.update_or_create(pk=1, defaults={'hits': 0, 'misses': 0, 'reset_at': timezone.now()})
+
+    def stats(self) -> dict:
+        """Size figures, this process's hits/misses and the shared totals (including unsaved counts)."""
+        self.save_counts()
+        totals = models.PageCacheEntry.objects.aggregate(bytes=Sum('size_bytes'))
+        counter = models.PageCacheCounter.objects.filter(pk=1).first()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': models.PageCacheEntry.objects.count(),
+            'bytes': totals['bytes'] or 0,
+            'max_bytes': self.max_bytes,
+            'total_hits': counter.hits if counter else 0,
+            'total_misses': counter.misses if counter else 0,
+            'counted_since': counter.reset_at if counter else None,
+        }
+
+
+page_cache = PageImageCache()
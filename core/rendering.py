@@ -0,0 +1,384 @@
+"""PDF rasterization, optionally in a bounded pool of worker processes.
+
+Worker processes are started with `spawn`, so this module must stay importable
+without Django being set up: settings are only read in the parent.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Iterator
+
+from django.conf import settings
+
+POLL_SECONDS = 0.25
+
+
+class RenderError(RuntimeError):
+    pass
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+class RenderMemoryExceeded(RenderError):
+    pass
+
+
+# Per-process handle on the most recently opened document, so consecutive page
+# tasks for the same PDF do not re-parse it.
+_open_document_cache: dict[str, tuple[tuple, object]] = {}
+# pdfium is not thread-safe; inline rendering can be reached from grading threads.
+_pdfium_lock = threading.RLock()
+
+
+def _open_document(file_path: str):
+    import pypdfium2 as pdfium
+
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    cached = _open_document_cache.get('current')
+    if cached and cached[0] == key:
+        return cached[1]
+    if cached:
+        cached[1].close()
+    else:
+        # Registered after pypdfium2's own exit hook so ours runs first.
+        atexit.register(_close_cached_document)
+    pdf = pdfium.PdfDocument(file_path)
+    _open_document_cache['current'] = (key, pdf)
+    return pdf
+
+
+def _close_cached_document() -> None:
+    with _pdfium_lock:
+        cached = _open_document_cache.pop('current', None)
+        if cached:
+            cached[1].close()
+
+
+def page_count(file_path: str) -> int:
+    with _pdfium_lock:
+        return len(_open_document(file_path))
+
+
+def render_page(file_path: str, page_index: int, scale: float, max_pixels: int) -> bytes:
+    with _pdfium_lock:
+        return _render_page(file_path, page_index, scale, max_pixels)
+
+
+def _render_page(file_path: str, page_index: int, scale: float, max_pixels: int) -> bytes:
+    pdf = _open_document(file_path)
+    page = pdf[page_index]
+    try:
+        width, height = page.get_size()
+        if width * height * scale * scale > max_pixels:
+            scale = (max_pixels / (width * height)) ** 0.5
+        bitmap = page.render(scale=scale)
+        try:
+            pil_image = bitmap.to_pil()
+            buffer = BytesIO()
+            pil_image.save(buffer, format='PNG')
+            pil_image.close()
+        finally:
+            bitmap.close()
+    finally:
+        page.close()
+    return buffer.getvalue()
+
+
+def _process_rss(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _worker_main(conn) -> None:
+    """Run (function, args) tasks sent over `conn` until it closes, replying (ok, value)."""
+    conn.send((True, 'ready'))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        func, args = task
+        try:
+            reply = (True, func(*args))
+        except Exception as exc:
+            reply = (False, exc)
+        try:
+            conn.send(reply)
+        except Exception as exc:
+            # The result or the exception did not pickle.
+            conn.send((False, RenderError(f'{type(exc).__name__}: {exc}')))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        # Startup (interpreter and imports) must not count against the first task's deadline.
+        try:
+            self.conn.recv()
+        except EOFError as exc:
+            self.process.join()
+            raise RenderError('render worker failed to start') from exc
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class _Task:
+    """A task sent to a checked-out worker; `reply` is (ok, value) once it has settled."""
+
+    def __init__(self, worker: _Worker, description: str):
+        self.worker = worker
+        self.description = description
+        self.started = time.monotonic()
+        self.reply: tuple[bool, object] | None = None
+
+
+class RenderPool:
+    """Renders PDF pages in worker processes with a per-task deadline and RSS cap.
+
+    Each task runs on a worker of its own, checked out for the duration of the
+    task. A task that runs past `timeout`, or whose worker's RSS passes
+    `max_rss_bytes`, gets that worker killed and replaced; other callers' tasks
+    are unaffected, so one malformed PDF cannot hang or bloat anyone else. Every
+    task a caller has in flight (read-ahead included) is checked while it waits.
+    `render_many` is the entry point for bulk jobs. With `workers=0` rendering
+    happens inline (no limits).
+    """
+
+    def __init__(self, workers: int, timeout: float, max_rss_bytes: int, tasks_per_child: int | None = None):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_rss_bytes = max_rss_bytes
+        self.tasks_per_child = tasks_per_child
+        self._context = multiprocessing.get_context('spawn')
+        self._idle: list[_Worker] = []
+        self._started = 0
+        self._closed = False
+        self._available = threading.Condition()
+
+    def _checkout(self, block: bool = True) -> _Worker | None:
+        """An idle worker (starting one if under `workers`); None if none is free and not `block`."""
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RenderError('Render pool is shut down')
+                if self._idle:
+                    return self._idle.pop()
+                if self._started < self.workers:
+                    self._started += 1
+                    break
+                if not block:
+                    return None
+                # Queueing behind other callers is not part of any task's deadline.
+                self._available.wait()
+        try:
+            return _Worker(self._context)
+        except BaseException:
+            self._discard(None)
+            raise
+
+    def _checkin(self, worker: _Worker) -> None:
+        worker.tasks += 1
+        if self.tasks_per_child and worker.tasks >= self.tasks_per_child:
+            worker.stop()
+            self._discard(None)
+            return
+        with self._available:
+            if self._closed:
+                self._started -= 1
+                worker.stop()
+                return
+            self._idle.append(worker)
+            self._available.notify()
+
+    def _discard(self, worker: _Worker | None) -> None:
+        if worker is not None:
+            worker.kill()
+        with self._available:
+            self._started -= 1
+            self._available.notify()
+
+    def shutdown(self) -> None:
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for worker in idle:
+            worker.stop()
+        with self._available:
+            self._started -= len(idle)
+
+    def _submit(self, worker: _Worker, description: str, func, *args) -> _Task:
+        try:
+            worker.conn.send((func, args))
+        except OSError as exc:
+            self._discard(worker)
+            raise RenderError(f'{description} failed: render worker died') from exc
+        return _Task(worker, description)
+
+    def _poll(self, task: _Task, timeout: float) -> bool:
+        """Collect `task`'s reply if it arrives within `timeout`, else enforce its limits; True once settled.
+
+        The deadline and RSS cap apply to the task's own worker alone.
+        """
+        if task.reply is not None:
+            return True
+        worker = task.worker
+        try:
+            ready = worker.conn.poll(timeout)
+            reply = worker.conn.recv() if ready else None
+        except (EOFError, OSError):
+            self._discard(worker)
+            task.reply = (False, RenderError(f'{task.description} failed: render worker died'))
+            return True
+        if reply is not None:
+            self._checkin(worker)
+            task.reply = reply
+        elif self.max_rss_bytes and _process_rss(worker.process.pid) > self.max_rss_bytes:
+            self._discard(worker)
+            task.reply = (False, RenderMemoryExceeded(f'{task.description} exceeded {self.max_rss_bytes} bytes of memory'))
+        elif time.monotonic() - task.started > self.timeout:
+            self._discard(worker)
+            task.reply = (False, RenderTimeout(f'{task.description} took longer than {self.timeout:g}s'))
+        return task.reply is not None
+
+    def _result(self, task: _Task, others: list[_Task] = ()):
+        """Wait for `task`'s value; the limits of `others` (read-ahead) are enforced meanwhile."""
+        while not self._poll(task, POLL_SECONDS):
+            for other in others:
+                self._poll(other, 0)
+        ok, value = task.reply
+        if ok:
+            return value
+        raise value
+
+    def page_count(self, file_path: str) -> int:
+        if not self.workers:
+            return page_count(file_path)
+        task = self._submit(self._checkout(), f'Opening {os.path.basename(file_path)}', page_count, file_path)
+        return self._result(task)
+
+    def render_pages(
+        self,
+        file_path: str,
+        page_indices: list[int],
+        scale: float,
+        max_pixels: int,
+    ) -> Iterator[tuple[int, bytes]]:
+        """Yield (page_index, png_bytes) in order, rendering ahead on whichever workers are free."""
+        if not self.workers:
+            for page_index in page_indices:
+                yield page_index, render_page(file_path, page_index, scale, max_pixels)
+            return
+        name = os.path.basename(file_path)
+        pending: list[tuple[int, _Task]] = []
+        remaining = list(page_indices)
+        try:
+            while remaining or pending:
+                # Wait for a worker only when nothing is in flight; otherwise read ahead on idle ones.
+                while remaining and len(pending) < self.workers:
+                    worker = self._checkout(block=not pending)
+                    if worker is None:
+                        break
+                    page_index = remaining.pop(0)
+                    task = self._submit(
+                        worker, f'Rendering page {page_index + 1} of {name}',
+                        render_page, file_path, page_index, scale, max_pixels,
+                    )
+                    pending.append((page_index, task))
+                page_index, task = pending.pop(0)
+                yield page_index, self._result(task, [other for _, other in pending])
+        finally:
+            # Abandoned read-ahead finishes in the background and its workers go back to the pool.
+            for _, task in pending:
+                if task.reply is None:
+                    threading.Thread(target=self._drain, args=(task,), daemon=True).start()
+
+    def _drain(self, task: _Task) -> None:
+        while not self._poll(task, POLL_SECONDS):
+            pass
+
+    def render_document(self, file_path: str, scale: float, max_pixels: int) -> list[bytes]:
+        count = self.page_count(file_path)
+        return [data for _, data in self.render_pages(file_path, list(range(count)), scale, max_pixels)]
+
+    def _render_document_or_error(self, file_path: str, scale: float, max_pixels: int) -> list[bytes] | RenderError:
+        try:
+            return self.render_document(file_path, scale, max_pixels)
+        except RenderError as exc:
+            return exc
+        except Exception as exc:
+            return RenderError(f'Rendering {os.path.basename(file_path)} failed: {exc}')
+
+    def render_many(
+        self,
+        file_paths: list[str],
+        scale: float,
+        max_pixels: int,
+    ) -> Iterator[tuple[str, list[bytes] | RenderError]]:
+        """Render whole documents for bulk jobs, yielding (path, pages or error) in order.
+
+        Up to `workers` documents are in flight at once, so a run of short PDFs
+        keeps every worker busy. A failure is yielded for its document alone.
+        """
+        if not self.workers:
+            for file_path in file_paths:
+                yield file_path, self._render_document_or_error(file_path, scale, max_pixels)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight: deque = deque()
+            for file_path in file_paths:
+                in_flight.append((file_path, executor.submit(self._render_document_or_error, file_path, scale, max_pixels)))
+                if len(in_flight) >= self.workers:
+                    file_path, future = in_flight.popleft()
+                    yield file_path, future.result()
+            while in_flight:
+                file_path, future = in_flight.popleft()
+                yield file_path, future.result()
+
+
+_render_pool: RenderPool | None = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderPool:
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = RenderPool(
+                workers=settings.RENDER_POOL_WORKERS,
+                timeout=settings.RENDER_TIMEOUT_SECONDS,
+                max_rss_bytes=settings.RENDER_MAX_RSS_BYTES,
+                tasks_per_child=settings.RENDER_TASKS_PER_CHILD or None,
+            )
+        return _render_pool
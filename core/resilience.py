@@ -0,0 +1,102 @@
+"""Retry and circuit-breaker helpers for calls to external services."""
+import random
+import time
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+
+from django.core.cache import cache
+
+
+class ServiceUnavailable(RuntimeError):
+    """The service is degraded; retry the work after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # "Full jitter": spreads retries from many workers instead of synchronizing them.
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(headers) -> float | None:
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(dt_timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """Counts failures in the Django cache so every worker sharing it trips together.
+
+    After `threshold` failures within `window` seconds the circuit opens for
+    `reset_seconds`; then a single probe call is let through, and its success
+    closes the circuit again. With the default per-process cache each process
+    has its own breaker.
+    """
+
+    def __init__(self, name: str, threshold: int, window: float, reset_seconds: float):
+        self.name = name
+        self.threshold = threshold
+        self.window = window
+        self.reset_seconds = reset_seconds
+
+    def _key(self, suffix: str) -> str:
+        return f'circuit:{self.name}:{suffix}'
+
+    def retry_after(self, take_probe: bool = True) -> float:
+        """Seconds until a call may be attempted; 0 when the circuit is closed.
+
+        Once the open period has passed, exactly one caller gets 0 and makes the
+        probe call. With take_probe=False the check does not claim that slot, so a
+        pre-check does not lock out the call that follows it.
+        """
+        if not self.threshold:
+            return 0
+        open_until = cache.get(self._key('open_until'))
+        if open_until is None:
+            return 0
+        remaining = open_until - time.time()
+        if remaining > 0:
+            return remaining
+        if not take_probe:
+            return 0 if cache.get(self._key('probe')) is None else self.reset_seconds
+        # Half-open: exactly one caller gets to probe.
+        if cache.add(self._key('probe'), 1, timeout=self.reset_seconds):
+            return 0
+        return self.reset_seconds
+
+    def record_success(self) -> None:
+        if self.threshold:
+            cache.delete_many([self._key('failures'), self._key('open_until'), self._key('probe')])
+
+    def record_failure(self) -> None:
+        if not self.threshold:
+            return
+        key = self._key('failures')
+        cache.add(key, 0, timeout=self.window)
+        try:
+            failures = cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=self.window)
+            failures = 1
+        if failures >= self.threshold:
+            cache.set(self._key('open_until'), time.time() + self.reset_seconds, timeout=None)
+            cache.delete(self._key('probe'))
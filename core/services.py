@@ -1,16 +1,59 @@
-import base64
+import hashlib
+import json
+import math
 import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import timedelta
 from io import BytesIO
+from itertools import islice
 
 from django.conf import settings
-from django.db import transaction
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, connections as db_connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
 from django.utils import timezone
 from pydantic import BaseModel, Field
 from typing import Literal
 
-from openai import OpenAI
+from PIL import Image
+
+from . import graders, imaging, models, rendering, stats
+from .page_cache import file_digest, page_cache
+
+PDF_RENDER_SCALE = 2
+PROMPT_PREVIEW_WIDTH = 1000
+# Preview variants served by the prompt preview endpoint: size name -> maximum width.
+PROMPT_PREVIEW_SIZES = {'thumb': 240, 'full': PROMPT_PREVIEW_WIDTH}
+RUBRIC_MAX_PAGES = 5
+PROMPT_PREFIX_CACHE_SIZE = 32
+
+# Bump GRADING_PROMPT_VERSION whenever GRADING_INSTRUCTIONS change so cached
+# grading results produced by the old wording are not reused.
+GRADING_PROMPT_VERSION = 2
+GRADING_INSTRUCTIONS = (
+    'You are grading a student solution. Use the rubric to assign scores per item and a total score. '
+    'Scrutinize every part of the computation to ensure there are no issues or hidden mistakes. '
+    'For each rubric item: restate the student\'s answer, recompute it, and compare. '
+    'Then set status to correct, incorrect, or partial. '
+    'If any arithmetic error or wrong conclusion appears, status must be incorrect. '
+    'If fully correct, status must be correct and award full points. '
+    'Your feedback must be consistent with the rubric scores. '
+    'If you award full points for an item, describe it as correct. '
+    'If you deduct points, briefly describe the mistake for that item in the rubric item notes. '
+    'Total score must equal the sum of rubric item scores. '
+    'Do not exceed the rubric total.'
+)
+
+_prompt_prefix_cache: OrderedDict[tuple[int, str], list] = OrderedDict()
+_prompt_prefix_lock = threading.Lock()
 
-from . import models
 
 class RubricScore(BaseModel):
     label: str
@@ -74,40 +117,34 @@ def infer_default_rubric(
     version: int = 1,
     suggestion: str | None = None,
 ) -> models.Rubric:
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
+    grader = graders.get_grader()
+    if not grader.available():
         raise RuntimeError('OPENAI_API_KEY not set')
 
-    prompt_path = problem.prompt_pdf.path
-    images = _file_to_images(prompt_path)
-    if not images:
-        raise RuntimeError('Could not extract images from the prompt PDF')
-
     suggestion_text = suggestion.strip() if suggestion else ''
     suggestion_block = f"\nProfessor suggestion:\n{suggestion_text}" if suggestion_text else ''
 
-    content = [
+    payload = imaging.PayloadBuilder()
+    payload.add_text(
+        'You are creating a grading rubric for a math problem. '
+        'Produce 3-7 rubric items with clear labels and point values. '
+        f'The total points must sum to {problem.max_score}.'
+        f'{suggestion_block}'
+    )
+    # Only the first few pages are sent, so only those are read.
+    payload.add_images(islice(iter_prompt_page_images(problem), RUBRIC_MAX_PAGES))
+    if not payload.stats['image_count']:
+        raise RuntimeError('Could not extract images from the prompt PDF')
+
+    response = grader.parse(
         {
-            'type': 'input_text',
-            'text': (
-                'You are creating a grading rubric for a math problem. '
-                'Produce 3-7 rubric items with clear labels and point values. '
-                f'The total points must sum to {problem.max_score}.'
-                f'{suggestion_block}'
-            ),
-        }
-    ]
-    for image_bytes, mime in images[:5]:
-        b64 = base64.b64encode(image_bytes).decode('utf-8')
-        content.append({'type': 'input_image', 'image_url': f'data:{mime};base64,{b64}'})
-
-    client = OpenAI()
-    response = client.responses.parse(
-        model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini-2024-07-18'),
-        input=[{'role': 'user', 'content': content}],
-        text_format=RubricDraft,
+            'model': getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini-2024-07-18'),
+            'input': [{'role': 'user', 'content': payload.content}],
+        },
+        RubricDraft,
+        operation='rubric',
     )
-    result = response.output_parsed
+    result = response.parsed
     items = result.items if result else []
 
     if not items:
@@ -138,54 +175,250 @@ def get_active_rubric(problem: models.Problem) -> models.Rubric:
     return problem.rubrics.order_by('-version', '-id').first()
 
 
-def run_autograde_placeholder(submission: models.Submission, rubric: models.Rubric) -> None:
-    models.AutoGradeRun.objects.create(
-        submission=submission,
-        rubric=rubric,
-        model='placeholder',
-        raw_output_json={'note': 'Auto-grading not yet implemented.'},
-        score=0,
-    )
-    models.Grade.objects.create(
-        submission=submission,
-        rubric=rubric,
-        score=0,
-        feedback='Auto-grade placeholder.',
-        grader_type=models.Grade.GRADER_AUTO,
-        grader=None,
+def _iter_pdf_pages(file_path: str) -> Iterator[bytes]:
+    try:
+        import pypdfium2  # noqa: F401
+    except ImportError:
+        return
+    pool = rendering.get_render_pool()
+    max_pixels = settings.GRADING_RENDER_MAX_PIXELS
+    content_hash = file_digest(file_path)
+    cached = page_cache.document_entries(content_hash, PDF_RENDER_SCALE, 'png')
+    page_count = next(iter(cached.values())).page_count if cached else pool.page_count(file_path)
+    # Uncached pages render in the pool ahead of the consumer while cached ones are read.
+    renders = pool.render_pages(
+        file_path,
+        [page_index for page_index in range(page_count) if page_index not in cached],
+        PDF_RENDER_SCALE,
+        max_pixels,
     )
-    submission.final_score = 0
-    submission.status = models.Submission.STATUS_GRADED
-    submission.save(update_fields=['final_score', 'status'])
+    used: list[models.PageCacheEntry] = []
+    rendered = False
+    try:
+        for page_index in range(page_count):
+            entry = cached.get(page_index)
+            data = page_cache.read(entry)
+            if data is not None:
+                used.append(entry)
+                yield data
+                continue
+            if entry is None:
+                _, data = next(renders)
+            else:
+                # Stale index row whose bytes are gone.
+                rerender = pool.render_pages(file_path, [page_index], PDF_RENDER_SCALE, max_pixels)
+                try:
+                    _, data = next(rerender)
+                finally:
+                    rerender.close()
+            page_cache.put(content_hash, page_index, page_count, PDF_RENDER_SCALE, 'png', data)
+            rendered = True
+            yield data
+            del data
+    finally:
+        renders.close()
+        page_cache.touch(used)
+        page_cache.save_counts()
+        if rendered:
+            page_cache.evict()
 
 
-def _file_to_images(file_path: str) -> list[tuple[bytes, str]]:
+def prerender_submission_pages(submissions) -> int:
+    """Render the uncached PDF pages of `submissions` into the page cache ahead of bulk grading.
+
+    Documents render in parallel on the render pool; one that fails is skipped here
+    and reports its error when its own job is graded. Returns the pages rendered.
+    """
+    try:
+        import pypdfium2  # noqa: F401
+    except ImportError:
+        return 0
+    hashes: dict[str, str] = {}
+    seen: set[str] = set()
+    for submission_file in models.SubmissionFile.objects.filter(submission__in=submissions).only('file'):
+        if os.path.splitext(submission_file.file.name)[1].lower() != '.pdf':
+            continue
+        path = submission_file.file.path
+        try:
+            content_hash = file_digest(path)
+        except FileNotFoundError:
+            continue
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        if not page_cache.document_entries(content_hash, PDF_RENDER_SCALE, 'png'):
+            hashes[path] = content_hash
+    rendered = 0
+    pool = rendering.get_render_pool()
+    try:
+        for path, pages in pool.render_many(list(hashes), PDF_RENDER_SCALE, settings.GRADING_RENDER_MAX_PIXELS):
+            if isinstance(pages, rendering.RenderError):
+                continue
+            for page_index, data in enumerate(pages):
+                page_cache.put(hashes[path], page_index, len(pages), PDF_RENDER_SCALE, 'png', data)
+            rendered += len(pages)
+    finally:
+        if rendered:
+            page_cache.evict()
+    return rendered
+
+
+def _iter_file_images(file_path: str) -> Iterator[tuple[bytes, str]]:
     ext = os.path.splitext(file_path)[1].lower()
     if ext == '.pdf':
-        try:
-            import pypdfium2 as pdfium
-        except ImportError:
-            return []
-        pdf = pdfium.PdfDocument(file_path)
-        images: list[tuple[bytes, str]] = []
-        for i in range(len(pdf)):
-            page = pdf[i]
-            pil_image = page.render(scale=2).to_pil()
-            buffer = BytesIO()
-            pil_image.save(buffer, format='PNG')
-            images.append((buffer.getvalue(), 'image/png'))
-        return images
+        for data in _iter_pdf_pages(file_path):
+            yield data, 'image/png'
+        return
 
+    if ext in {'.jpg', '.jpeg'}:
+        mime = 'image/jpeg'
+    elif ext == '.webp':
+        mime = 'image/webp'
+    elif ext == '.gif':
+        mime = 'image/gif'
+    else:
+        mime = 'image/png'
     with open(file_path, 'rb') as file_obj:
-        if ext in {'.jpg', '.jpeg'}:
-            mime = 'image/jpeg'
-        elif ext == '.webp':
-            mime = 'image/webp'
-        elif ext == '.gif':
-            mime = 'image/gif'
-        else:
-            mime = 'image/png'
-        return [(file_obj.read(), mime)]
+        yield file_obj.read(), mime
+
+
+def iter_submission_images(submission: models.Submission) -> Iterator[tuple[bytes, str]]:
+    for submission_file in submission.files.all().order_by('page_number'):
+        yield from _iter_file_images(submission_file.file.path)
+
+
+def render_prompt_pages(problem: models.Problem, force: bool = False) -> list[models.ProblemPromptPage]:
+    """Rasterize the prompt PDF once and store the pages and preview on the problem.
+
+    Re-rendering only happens when the PDF content changes (or `force` is set), so
+    grading, rubric inference and the preview endpoint never need pdfium again.
+    """
+    if not problem.prompt_pdf:
+        return []
+    content_hash = file_digest(problem.prompt_pdf.path)
+    existing = list(problem.prompt_pages.all())
+    if not force and existing and problem.prompt_sha256 == content_hash and problem.prompt_preview:
+        return existing
+
+    old_hash = problem.prompt_sha256
+    for page in existing:
+        page.image.delete(save=False)
+    if problem.prompt_preview:
+        problem.prompt_preview.delete(save=False)
+
+    pages: list[models.ProblemPromptPage] = []
+    with transaction.atomic():
+        problem.prompt_pages.all().delete()
+        for page_number, (image_bytes, mime) in enumerate(_iter_file_images(problem.prompt_pdf.path), start=1):
+            with Image.open(BytesIO(image_bytes)) as pil_image:
+                width, height = pil_image.size
+                if page_number == 1:
+                    pil_image.thumbnail((PROMPT_PREVIEW_WIDTH, PROMPT_PREVIEW_WIDTH * 4))
+                    buffer = BytesIO()
+                    pil_image.save(buffer, format='PNG')
+                    problem.prompt_preview.save(
+                        f"{problem.id}-{content_hash[:12]}.png", ContentFile(buffer.getvalue()), save=False
+                    )
+            page = models.ProblemPromptPage(
+                problem=problem,
+                page_number=page_number,
+                mime_type=mime,
+                width=width,
+                height=height,
+            )
+            page.image.save(f"{problem.id}-{content_hash[:12]}-{page_number}.png", ContentFile(image_bytes), save=False)
+            pages.append(page)
+        models.ProblemPromptPage.objects.bulk_create(pages)
+        problem.prompt_sha256 = content_hash
+        problem.save(update_fields=['prompt_sha256', 'prompt_preview'])
+    if old_hash != content_hash:
+        _delete_prompt_previews(old_hash)
+    return pages
+
+
+def _iter_prompt_pages(pages) -> Iterator[tuple[bytes, str]]:
+    for page in pages:
+        with page.image.open('rb') as file_obj:
+            yield file_obj.read(), page.mime_type
+
+
+class PromptNotRendered(RuntimeError):
+    pass
+
+
+def queue_prompt_render(problem: models.Problem) -> None:
+    """Have `render_prompts` rasterize the prompt again (it re-renders problems without a hash)."""
+    models.Problem.objects.filter(id=problem.id).update(prompt_sha256='')
+    problem.prompt_sha256 = ''
+
+
+def _missing_prompt(problem: models.Problem) -> PromptNotRendered:
+    queue_prompt_render(problem)
+    return PromptNotRendered(f'Prompt pages of problem {problem.id} are missing; queued for render_prompts.')
+
+
+def iter_prompt_page_images(problem: models.Problem) -> Iterator[tuple[bytes, str]]:
+    """The stored prompt pages. Never renders: missing pages queue a re-render and raise PromptNotRendered."""
+    if not problem.prompt_pdf:
+        return
+    pages = list(problem.prompt_pages.all())
+    if not pages:
+        raise _missing_prompt(problem)
+    try:
+        yield from _iter_prompt_pages(pages)
+    except FileNotFoundError as exc:
+        # Media lost on redeploy.
+        raise _missing_prompt(problem) from exc
+
+
+def prompt_preview_name(content_hash: str, page_number: int, size: str) -> str:
+    return f"problem_prompt_previews/{content_hash}/{page_number}-{size}.png"
+
+
+def _delete_prompt_previews(content_hash: str) -> None:
+    # Variants are shared by every problem with the same prompt PDF.
+    if not content_hash or models.Problem.objects.filter(prompt_sha256=content_hash).exists():
+        return
+    directory = f"problem_prompt_previews/{content_hash}"
+    try:
+        _, names = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        default_storage.delete(f"{directory}/{name}")
+
+
+def _open_prompt_page(problem: models.Problem, page_number: int):
+    page = problem.prompt_pages.get(page_number=page_number)
+    try:
+        return page.image.open('rb')
+    except FileNotFoundError as exc:
+        # Media lost on redeploy.
+        raise _missing_prompt(problem) from exc
+
+
+def prompt_preview(problem: models.Problem, page_number: int, size: str) -> str:
+    """Storage name of a prompt page downscaled to `size`, rendered on first request.
+
+    Names are keyed by the prompt hash, so each (hash, page, size) is rendered once and a
+    new PDF never serves old images. Raises ProblemPromptPage.DoesNotExist for pages the
+    prompt does not have, and PromptNotRendered while the prompt awaits `render_prompts`.
+    """
+    if not problem.prompt_sha256:
+        raise PromptNotRendered(f'Prompt of problem {problem.id} is not rendered yet.')
+    name = prompt_preview_name(problem.prompt_sha256, page_number, size)
+    if default_storage.exists(name):
+        return name
+    width = PROMPT_PREVIEW_SIZES[size]
+    with _open_prompt_page(problem, page_number) as source, Image.open(source) as pil_image:
+        pil_image.thumbnail((width, width * 4))
+        buffer = BytesIO()
+        pil_image.save(buffer, format='PNG', optimize=True)
+    stored = default_storage.save(name, ContentFile(buffer.getvalue()))
+    if stored != name:
+        # A concurrent request stored the same variant first; keep that one.
+        default_storage.delete(stored)
+    return name
 
 
 def _normalize_rubric_scores(
@@ -217,124 +450,869 @@ def _normalize_rubric_scores(
     return normalized, total
 
 
-def run_autograde_openai(submission: models.Submission, rubric: models.Rubric) -> None:
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        run_autograde_placeholder(submission, rubric)
-        return
+def _prepared_prompt_images(problem: models.Problem) -> list[tuple[imaging.PreparedImage, int]]:
+    # Prompt pages are identical for every student of a problem, so keep their
+    # prepared form around for bulk grading (and byte-identical request prefixes).
+    key = (problem.id, problem.prompt_sha256)
+    if problem.prompt_sha256:
+        with _prompt_prefix_lock:
+            if key in _prompt_prefix_cache:
+                _prompt_prefix_cache.move_to_end(key)
+                return _prompt_prefix_cache[key]
+    prepared = [
+        (imaging.prepare_image(image_bytes, mime), len(image_bytes))
+        for image_bytes, mime in iter_prompt_page_images(problem)
+    ]
+    if problem.prompt_sha256:
+        with _prompt_prefix_lock:
+            _prompt_prefix_cache[key] = prepared
+            while len(_prompt_prefix_cache) > PROMPT_PREFIX_CACHE_SIZE:
+                _prompt_prefix_cache.popitem(last=False)
+    return prepared
 
-    images: list[tuple[bytes, str]] = []
-    # Include the problem prompt (if available) before student work.
-    if submission.problem.prompt_pdf and os.path.exists(submission.problem.prompt_pdf.path):
-        images.extend(_file_to_images(submission.problem.prompt_pdf.path))
 
-    for submission_file in submission.files.all().order_by('page_number'):
-        file_path = submission_file.file.path
-        images.extend(_file_to_images(file_path))
+def build_grading_payload(submission: models.Submission, rubric: models.Rubric) -> imaging.PayloadBuilder:
+    """Build the grading content with everything shared by a problem first.
+
+    Rubric text and problem prompt pages form a prefix that is byte-identical for
+    every student of the problem (provider-side prompt caching); the student's
+    pages come last.
+    """
+    rubric_text = '\n'.join(f"- {item.label}: {item.points} pts" for item in rubric.items.all())
+    payload = imaging.PayloadBuilder()
+    payload.add_text(f'Rubric:\n{rubric_text}')
+    prompt_images = _prepared_prompt_images(submission.problem)
+    if prompt_images:
+        payload.add_text('Problem statement:')
+        for image, source_bytes in prompt_images:
+            payload.add_prepared(image, source_bytes)
+    payload.add_text('Student solution:')
+    payload.add_images(iter_submission_images(submission))
+    return payload
+
+
+def grading_request(
+    payload: imaging.PayloadBuilder,
+    problem: models.Problem,
+    rubric: models.Rubric,
+    model_name: str,
+) -> dict:
+    return {
+        'model': model_name,
+        'input': [
+            {'role': 'developer', 'content': GRADING_INSTRUCTIONS},
+            {'role': 'user', 'content': payload.content},
+        ],
+        'temperature': 0,
+        'prompt_cache_key': f'grade-problem-{problem.id}-rubric-{rubric.id}',
+    }
+
+
+def grading_cache_key(submission: models.Submission, rubric: models.Rubric, model: str) -> str:
+    problem = submission.problem
+    prompt_hash = ''
+    if problem.prompt_pdf:
+        prompt_hash = problem.prompt_sha256
+        if not prompt_hash and os.path.exists(problem.prompt_pdf.path):
+            prompt_hash = file_digest(problem.prompt_pdf.path)
+    file_hashes = [
+        file_digest(submission_file.file.path)
+        for submission_file in submission.files.all().order_by('page_number')
+    ]
+    key_parts = {
+        'prompt': prompt_hash,
+        'files': file_hashes,
+        'rubric': [rubric.id, rubric.version],
+        'items': [[item.label, item.points] for item in rubric.items.all()],
+        'model': model,
+        'template': GRADING_PROMPT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _cached_grade_result(cache_key: str) -> tuple[GradeResult, str] | None:
+    entry = models.GradeResultCacheEntry.objects.filter(key=cache_key).first()
+    if entry is None:
+        return None
+    try:
+        result = GradeResult.model_validate(entry.result_json)
+    except ValueError:
+        entry.delete()
+        return None
+    models.GradeResultCacheEntry.objects.filter(id=entry.id).update(hits=F('hits') + 1, last_hit_at=timezone.now())
+    return result, entry.raw_text
+
+
+@dataclass
+class AutoGradeOutcome:
+    submission: models.Submission
+    rubric: models.Rubric
+    model: str
+    raw_output_json: dict
+    score: float
+    feedback: str
+    cache_key: str = ''
+    cache_hit: bool = False
+    usage: dict = field(default_factory=dict)
+    # AutoGradeRun telemetry columns (render_ms, encode_ms, api_ms, image_count, ...).
+    telemetry: dict = field(default_factory=dict)
+
+
+def _payload_telemetry(payload_stats: dict) -> dict:
+    return {
+        'render_ms': payload_stats.get('render_ms'),
+        'encode_ms': payload_stats.get('encode_ms'),
+        'image_count': payload_stats.get('image_count'),
+        'payload_bytes': payload_stats.get('payload_bytes'),
+    }
+
+
+@dataclass
+class GradingPlan:
+    """Everything needed to grade one submission, built before any API call."""
 
-    if not images:
-        models.AutoGradeRun.objects.create(
+    submission: models.Submission
+    rubric: models.Rubric
+    model: str
+    # Grader or batch backend that answers the request; anything but "openai" is a stand-in.
+    backend: str = 'openai'
+    cache_key: str = ''
+    payload: imaging.PayloadBuilder | None = None
+    # Set when no API call is needed (cache hit or an unusable payload).
+    outcome: AutoGradeOutcome | None = None
+
+    @property
+    def source(self) -> str:
+        """What produced the result: the model name, prefixed by the backend for stand-ins.
+
+        Recorded on AutoGradeRun and cache entries and hashed into the cache key, so
+        stand-in results never pass for the model's.
+        """
+        return self.model if self.backend == 'openai' else f'{self.backend}:{self.model}'
+
+    def request(self) -> dict:
+        return grading_request(self.payload, self.submission.problem, self.rubric, self.model)
+
+
+def plan_autograde(
+    submission: models.Submission,
+    rubric: models.Rubric,
+    use_cache: bool = True,
+    backend: str | None = None,
+) -> GradingPlan:
+    """Build the grading request, or the outcome when no call is needed.
+
+    `backend` names what will answer the request (default: the configured grader).
+    """
+    model_name = getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini-2024-07-18')
+    use_cache = use_cache and settings.GRADING_RESULT_CACHE
+    plan = GradingPlan(
+        submission=submission, rubric=rubric, model=model_name, backend=backend or graders.get_grader().name
+    )
+    try:
+        plan.cache_key = grading_cache_key(submission, rubric, plan.source)
+    except FileNotFoundError:
+        plan.cache_key = ''
+    cache_key = plan.cache_key
+
+    cached = _cached_grade_result(cache_key) if use_cache and cache_key else None
+    if cached is not None:
+        result, raw_text = cached
+        plan.outcome = grade_outcome(plan, result, raw_text, payload_stats=imaging.PayloadBuilder().stats, cache_hit=True)
+        return plan
+
+    error = None
+    payload = imaging.PayloadBuilder()
+    try:
+        payload = build_grading_payload(submission, rubric)
+    except imaging.PayloadTooLarge as exc:
+        error = f'{exc} Please ask your professor to grade this submission.'
+    if error is None and not payload.stats['image_count']:
+        error = 'No images available for grading.'
+    if error is not None:
+        plan.outcome = AutoGradeOutcome(
             submission=submission,
             rubric=rubric,
-            model='openai',
-            raw_output_json={'error': 'No images available for grading.'},
+            model=plan.source,
+            raw_output_json={'error': error, 'payload': payload.stats},
             score=0,
+            feedback=error,
+            telemetry=_payload_telemetry(payload.stats),
+        )
+    plan.payload = payload
+    return plan
+
+
+def store_grade_result(plan: GradingPlan, result: GradeResult | None, raw_text: str | None) -> None:
+    if result is not None and plan.cache_key:
+        models.GradeResultCacheEntry.objects.update_or_create(
+            key=plan.cache_key,
+            defaults={'model': plan.source, 'result_json': result.model_dump(), 'raw_text': raw_text or ''},
         )
-        models.Grade.objects.create(
+
+
+def grade_outcome(
+    plan: GradingPlan,
+    result: GradeResult | None,
+    raw_text: str | None,
+    payload_stats: dict | None = None,
+    cache_hit: bool = False,
+    usage: dict | None = None,
+    api_ms: int | None = None,
+    retries: int = 0,
+) -> AutoGradeOutcome:
+    parsed = result.model_dump() if result else None
+    rubric_scores = result.rubric_scores if result else []
+    normalized_scores, total_score = _normalize_rubric_scores(plan.rubric, rubric_scores)
+    if normalized_scores and any(score.notes for score in normalized_scores):
+        feedback_lines = []
+        for score in normalized_scores:
+            note = score.notes or 'No issues noted.'
+            feedback_lines.append(f"{score.label} ({score.status}): {note}")
+        feedback = "Rubric notes:\n" + "\n".join(feedback_lines)
+    else:
+        feedback = result.feedback if result else raw_text
+
+    if parsed is not None:
+        parsed['rubric_scores'] = [score.model_dump() for score in normalized_scores]
+        parsed['total_score'] = total_score
+
+    if payload_stats is None:
+        payload_stats = plan.payload.stats if plan.payload else {}
+    return AutoGradeOutcome(
+        submission=plan.submission,
+        rubric=plan.rubric,
+        model=plan.source,
+        raw_output_json={'raw_text': raw_text, 'parsed': parsed, 'payload': payload_stats},
+        score=total_score,
+        feedback=feedback,
+        cache_key=plan.cache_key,
+        cache_hit=cache_hit,
+        usage=usage or {},
+        telemetry={} if cache_hit else {**_payload_telemetry(payload_stats), 'api_ms': api_ms, 'retries': retries},
+    )
+
+
+def compute_autograde(
+    submission: models.Submission,
+    rubric: models.Rubric,
+    use_cache: bool = True,
+) -> AutoGradeOutcome:
+    """Grade a submission without writing anything; see persist_autograde_outcomes.
+
+    Raises graders.GraderUnavailable when the provider is degraded, and lets other
+    grading errors propagate so the job is retried (and eventually failed) instead
+    of recording a zero for the student.
+    """
+    grader = graders.get_grader()
+    if not grader.available():
+        return AutoGradeOutcome(
             submission=submission,
             rubric=rubric,
+            model='placeholder',
+            raw_output_json={'note': 'Auto-grading not yet implemented.'},
             score=0,
-            feedback='No images available for grading.',
-            grader_type=models.Grade.GRADER_AUTO,
-            grader=None,
+            feedback='Auto-grade placeholder.',
         )
-        submission.final_score = 0
-        submission.status = models.Submission.STATUS_GRADED
-        submission.save(update_fields=['final_score', 'status'])
+
+    # Fail fast while the provider is degraded rather than rendering pages for nothing.
+    # The half-open probe slot is left for the parse() call below.
+    grader.ensure_available(take_probe=False)
+    plan = plan_autograde(submission, rubric, use_cache=use_cache, backend=grader.name)
+    if plan.outcome is not None:
+        return plan.outcome
+    response = grader.parse(plan.request(), GradeResult, operation='grade')
+    store_grade_result(plan, response.parsed, response.text)
+    return grade_outcome(
+        plan,
+        response.parsed,
+        response.text,
+        usage=response.usage,
+        api_ms=response.elapsed_ms,
+        retries=response.retries,
+    )
+
+
+def persist_autograde_outcomes(outcomes: list[AutoGradeOutcome]) -> None:
+    if not outcomes:
         return
+    started = time.perf_counter()
+    with transaction.atomic():
+        runs = models.AutoGradeRun.objects.bulk_create(
+            [
+                models.AutoGradeRun(
+                    submission=outcome.submission,
+                    rubric=outcome.rubric,
+                    model=outcome.model,
+                    raw_output_json=outcome.raw_output_json,
+                    score=outcome.score,
+                    cache_key=outcome.cache_key,
+                    cache_hit=outcome.cache_hit,
+                    **outcome.usage,
+                    **{name: value for name, value in outcome.telemetry.items() if value is not None},
+                )
+                for outcome in outcomes
+            ]
+        )
+        models.Grade.objects.bulk_create(
+            [
+                models.Grade(
+                    submission=outcome.submission,
+                    rubric=outcome.rubric,
+                    score=outcome.score,
+                    feedback=outcome.feedback,
+                    grader_type=models.Grade.GRADER_AUTO,
+                    grader=None,
+                )
+                for outcome in outcomes
+            ]
+        )
+        for outcome, run in zip(outcomes, runs):
+            outcome.submission.latest_autograde = run
+        apply_best_grades([outcome.submission for outcome in outcomes], extra_fields=['latest_autograde'])
+    # Bulk writes are timed as a whole and attributed evenly to the runs.
+    persist_ms = round((time.perf_counter() - started) * 1000 / len(outcomes))
+    models.AutoGradeRun.objects.filter(id__in=[run.id for run in runs if run.id]).update(persist_ms=persist_ms)
 
-    rubric_items = [{'label': item.label, 'points': item.points} for item in rubric.items.all()]
-    rubric_text = '\n'.join([f"- {item['label']}: {item['points']} pts" for item in rubric_items])
 
-    content = [
-        {
-            'type': 'input_text',
-            'text': (
-                'You are grading a student solution. Use the rubric to assign scores per item and a total score. '
-                'Scrutinize every part of the computation to ensure there are no issues or hidden mistakes. '
-                'For each rubric item: restate the student\'s answer, recompute it, and compare. '
-                'Then set status to correct, incorrect, or partial. '
-                'If any arithmetic error or wrong conclusion appears, status must be incorrect. '
-                'If fully correct, status must be correct and award full points. '
-                'Your feedback must be consistent with the rubric scores. '
-                'If you award full points for an item, describe it as correct. '
-                'If you deduct points, briefly describe the mistake for that item in the rubric item notes. '
-                'Total score must equal the sum of rubric item scores. '
-                'Do not exceed the rubric total.'
-                f'\nRubric:\n{rubric_text}'
-            ),
-        }
-    ]
-    for image_bytes, mime in images:
-        b64 = base64.b64encode(image_bytes).decode('utf-8')
-        content.append({'type': 'input_image', 'image_url': f'data:{mime};base64,{b64}'})
+def best_grade_order():
+    """Grade ordering that puts a submission's best grade first: highest score, then latest."""
+    return (F('score').desc(), F('finalized_at').desc(), F('id').desc())
 
-    client = OpenAI()
-    try:
-        response = client.responses.parse(
-            model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini-2024-07-18'),
-            input=[{'role': 'user', 'content': content}],
-            text_format=GradeResult,
-            temperature=0,
+
+def apply_best_grades(submissions: list[models.Submission], extra_fields: list[str] = ()) -> None:
+    """Point each submission at its highest grade and copy the score; call inside the grade's transaction."""
+    by_id = {submission.id: submission for submission in submissions}
+    best: dict[int, models.Grade] = {}
+    grades = (
+        models.Grade.objects.filter(submission_id__in=by_id)
+        .order_by('submission_id', *best_grade_order())
+        .only('id', 'submission_id', 'score')
+    )
+    for grade in grades:
+        best.setdefault(grade.submission_id, grade)
+    before = {
+        submission_id: (problem_set_id, (status, final_score))
+        for submission_id, problem_set_id, status, final_score in models.Submission.objects.filter(
+            id__in=by_id
+        ).values_list('id', 'problem__problem_set_id', 'status', 'final_score')
+    }
+    for submission_id, grade in best.items():
+        submission = by_id[submission_id]
+        submission.best_grade = grade
+        submission.final_score = grade.score
+        submission.status = models.Submission.STATUS_GRADED
+    models.Submission.objects.bulk_update(
+        list(by_id.values()),
+        ['best_grade', 'final_score', 'status', *extra_fields],
+    )
+    # bulk_update bypasses the model signals that keep ProblemSetStats current.
+    stats.apply_deltas(
+        stats.submission_deltas(
+            (before[submission.id][0], before[submission.id][1], (submission.status, submission.final_score))
+            for submission in by_id.values()
+            if submission.id in before
         )
-        result = response.output_parsed
-        raw_text = response.output_text
-        parsed = result.model_dump() if result else None
-        rubric_scores = result.rubric_scores if result else []
-        normalized_scores, total_score = _normalize_rubric_scores(rubric, rubric_scores)
-        if normalized_scores and any(score.notes for score in normalized_scores):
-            feedback_lines = []
-            for score in normalized_scores:
-                note = score.notes or 'No issues noted.'
-                feedback_lines.append(f"{score.label} ({score.status}): {note}")
-            feedback = "Rubric notes:\n" + "\n".join(feedback_lines)
-        else:
-            feedback = result.feedback if result else raw_text
-    except Exception as exc:
-        raw_text = f'Auto-grade failed: {exc}'
-        total_score = 0
-        parsed = None
-        normalized_scores = []
-        feedback = raw_text
+    )
 
-    if parsed is not None:
-        parsed['rubric_scores'] = [score.model_dump() for score in normalized_scores]
-        parsed['total_score'] = total_score
 
-    models.AutoGradeRun.objects.create(
-        submission=submission,
-        rubric=rubric,
-        model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini-2024-07-18'),
-        raw_output_json={'raw_text': raw_text, 'parsed': parsed},
-        score=total_score,
+def save_grade(grade: models.Grade) -> None:
+    """Save a single (professor) grade and refresh the submission's best grade with it."""
+    with transaction.atomic():
+        submission = models.Submission.objects.select_for_update().get(id=grade.submission_id)
+        grade.submission = submission
+        grade.save()
+        apply_best_grades([submission])
+
+
+def enqueue_grading(
+    submission: models.Submission,
+    rubric: models.Rubric | None = None,
+    reason: str = models.GradingJob.REASON_FINALIZE,
+    use_cache: bool = True,
+) -> models.GradingJob:
+    """Queue grading for a submission, or return the job already queued or running for it.
+
+    Concurrent callers are serialized on the submission row; the partial unique
+    constraint on active jobs backs this up on databases without row locks.
+    """
+    with transaction.atomic():
+        models.Submission.objects.select_for_update().filter(id=submission.id).first()
+        existing = active_grading_jobs().filter(submission=submission).first()
+        if existing is not None:
+            return existing
+        try:
+            with transaction.atomic():
+                return models.GradingJob.objects.create(
+                    submission=submission,
+                    rubric=rubric,
+                    reason=reason,
+                    use_cache=use_cache,
+                )
+        except IntegrityError:
+            return active_grading_jobs().get(submission=submission)
+
+
+class RegradeNotAllowed(Exception):
+    pass
+
+
+def regrade_block_reason(submission: models.Submission, now=None) -> str:
+    """Why the student cannot request another regrade right now ('' if they can)."""
+    now = now or timezone.now()
+    cooldown = settings.REGRADE_COOLDOWN_SECONDS
+    if cooldown:
+        last = (
+            submission.grading_jobs.filter(reason=models.GradingJob.REASON_REGRADE)
+            .order_by('-created_at')
+            .values_list('created_at', flat=True)
+            .first()
+        )
+        if last and now - last < timedelta(seconds=cooldown):
+            wait_minutes = math.ceil((last + timedelta(seconds=cooldown) - now).total_seconds() / 60)
+            return f'You can request another regrade in {wait_minutes} minute(s).'
+    quota = settings.REGRADE_QUOTA
+    if quota:
+        window_start = now - timedelta(hours=settings.REGRADE_QUOTA_WINDOW_HOURS)
+        used = models.GradingJob.objects.filter(
+            reason=models.GradingJob.REASON_REGRADE,
+            submission__student_id=submission.student_id,
+            created_at__gte=window_start,
+        ).count()
+        if used >= quota:
+            return f'You have used all {quota} regrades for the last {settings.REGRADE_QUOTA_WINDOW_HOURS} hours.'
+    return ''
+
+
+def request_regrade(submission: models.Submission, rubric: models.Rubric) -> models.GradingJob:
+    """Queue a student-requested regrade, joining any job already in flight.
+
+    Joining does not use up quota; otherwise the per-submission cooldown and the
+    per-student quota apply. Raises RegradeNotAllowed.
+    """
+    with transaction.atomic():
+        models.Submission.objects.select_for_update().filter(id=submission.id).first()
+        existing = active_grading_jobs().filter(submission=submission).first()
+        if existing is not None:
+            return existing
+        reason = regrade_block_reason(submission)
+        if reason:
+            raise RegradeNotAllowed(reason)
+        return enqueue_grading(submission, rubric, reason=models.GradingJob.REASON_REGRADE)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _claimable_jobs(now):
+    return Q(status=models.GradingJob.STATUS_QUEUED, run_after__lte=now) | Q(
+        status=models.GradingJob.STATUS_RUNNING,
+        lease_expires_at__lt=now,
+        attempts__lt=settings.GRADING_JOB_MAX_ATTEMPTS,
     )
-    models.Grade.objects.create(
-        submission=submission,
-        rubric=rubric,
-        score=total_score,
-        feedback=feedback,
-        grader_type=models.Grade.GRADER_AUTO,
-        grader=None,
+
+
+def _abandoned_jobs(now):
+    # Leases that expired on their last attempt: the worker died or hung every time.
+    return Q(
+        status=models.GradingJob.STATUS_RUNNING,
+        lease_expires_at__lt=now,
+        attempts__gte=settings.GRADING_JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim_grading_jobs(
+    worker_id: str,
+    limit: int = 1,
+    lease_seconds: int | None = None,
+    problem_set: models.ProblemSet | None = None,
+    reasons: list[str] | None = None,
+) -> list[models.GradingJob]:
+    """Lease up to `limit` runnable jobs to `worker_id`, optionally only jobs queued for `reasons`.
+
+    Jobs whose lease expired (crashed worker) are claimable again, unless that was
+    their last attempt: those are marked failed instead. On Postgres the candidate
+    rows are locked with SKIP LOCKED so parallel workers never block each other;
+    SQLite has no row locks, so each candidate is claimed with a conditional
+    UPDATE and only the worker whose UPDATE matched gets it.
+    """
+    if lease_seconds is None:
+        lease_seconds = settings.GRADING_JOB_LEASE_SECONDS
+    now = timezone.now()
+    claimable = _claimable_jobs(now)
+    abandoned = _abandoned_jobs(now)
+    if problem_set is not None:
+        claimable &= Q(submission__problem__problem_set=problem_set)
+        abandoned &= Q(submission__problem__problem_set=problem_set)
+    if reasons is not None:
+        claimable &= Q(reason__in=reasons)
+        abandoned &= Q(reason__in=reasons)
+    models.GradingJob.objects.filter(abandoned).update(
+        status=models.GradingJob.STATUS_FAILED,
+        lease_expires_at=None,
+        last_error='Lease expired on the final attempt (worker crashed or hung).',
+        finished_at=now,
+    )
+    claim = {
+        'status': models.GradingJob.STATUS_RUNNING,
+        'leased_by': worker_id,
+        'lease_expires_at': now + timedelta(seconds=lease_seconds),
+        'attempts': F('attempts') + 1,
+        'started_at': now,
+    }
+    candidates = models.GradingJob.objects.filter(claimable).order_by('run_after', 'id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                candidates.select_for_update(skip_locked=True, of=('self',)).values_list('id', flat=True)[:limit]
+            )
+            models.GradingJob.objects.filter(id__in=ids).update(**claim)
+    else:
+        ids = []
+        for job_id in candidates.values_list('id', flat=True)[: limit * 4]:
+            if models.GradingJob.objects.filter(claimable, id=job_id).update(**claim):
+                ids.append(job_id)
+            if len(ids) >= limit:
+                break
+
+    return list(
+        models.GradingJob.objects.filter(id__in=ids, leased_by=worker_id)
+        .select_related('submission__problem', 'rubric')
+        .order_by('run_after', 'id')
+    )
+
+
+def fail_grading_job(job: models.GradingJob, exc: Exception) -> None:
+    owned = models.GradingJob.objects.filter(id=job.id, leased_by=job.leased_by)
+    if job.attempts < settings.GRADING_JOB_MAX_ATTEMPTS:
+        owned.update(
+            status=models.GradingJob.STATUS_QUEUED,
+            run_after=timezone.now() + timedelta(seconds=settings.GRADING_JOB_RETRY_DELAY_SECONDS * job.attempts),
+            lease_expires_at=None,
+            last_error=str(exc),
+        )
+    else:
+        owned.update(
+            status=models.GradingJob.STATUS_FAILED,
+            lease_expires_at=None,
+            last_error=str(exc),
+            finished_at=timezone.now(),
+        )
+
+
+def defer_grading_job(job: models.GradingJob, exc: graders.GraderUnavailable) -> None:
+    # Provider outages do not count against the job's attempts.
+    models.GradingJob.objects.filter(id=job.id, leased_by=job.leased_by).update(
+        status=models.GradingJob.STATUS_QUEUED,
+        run_after=timezone.now() + timedelta(seconds=max(exc.retry_after, 1)),
+        attempts=F('attempts') - 1,
+        lease_expires_at=None,
+        last_error=str(exc),
+    )
+
+
+def renew_grading_leases(jobs: list[models.GradingJob], lease_seconds: int) -> None:
+    """Extend the leases of jobs still being worked on, so long runs are not reclaimed."""
+    by_owner: dict[str, list[int]] = {}
+    for job in jobs:
+        by_owner.setdefault(job.leased_by, []).append(job.id)
+    lease_expires_at = timezone.now() + timedelta(seconds=lease_seconds)
+    for owner, ids in by_owner.items():
+        models.GradingJob.objects.filter(
+            id__in=ids, leased_by=owner, status=models.GradingJob.STATUS_RUNNING
+        ).update(lease_expires_at=lease_expires_at)
+
+
+def complete_grading_jobs(jobs: list[models.GradingJob]) -> None:
+    by_owner: dict[str, list[int]] = {}
+    for job in jobs:
+        by_owner.setdefault(job.leased_by, []).append(job.id)
+    for owner, ids in by_owner.items():
+        models.GradingJob.objects.filter(id__in=ids, leased_by=owner).update(
+            status=models.GradingJob.STATUS_DONE,
+            lease_expires_at=None,
+            finished_at=timezone.now(),
+        )
+
+
+def _compute_job(job: models.GradingJob) -> AutoGradeOutcome | None:
+    rubric = job.rubric or get_active_rubric(job.submission.problem)
+    if rubric is None:
+        return None
+    return compute_autograde(job.submission, rubric, use_cache=job.use_cache)
+
+
+def _compute_job_in_thread(job: models.GradingJob) -> AutoGradeOutcome | None:
+    try:
+        return _compute_job(job)
+    finally:
+        # Worker threads open their own DB connections; don't leak them.
+        db_connections.close_all()
+
+
+def run_grading_jobs(
+    worker_id: str,
+    concurrency: int | None = None,
+    problem_set: models.ProblemSet | None = None,
+    lease_seconds: int | None = None,
+    persist_batch_size: int = 25,
+    max_jobs: int = 0,
+    progress: Callable[[int, int], None] | None = None,
+) -> tuple[int, int]:
+    """Claim and grade jobs with at most `concurrency` API requests in flight.
+
+    Grading (rendering and the API call) runs in worker threads; results are
+    written from this thread in bulk batches. Returns (done, failed) counts;
+    jobs deferred because the provider is unavailable count as neither.
+    Anything claimed but not yet written when the process dies is picked up
+    again once its lease expires, so runs can simply be restarted. While jobs
+    are in flight their leases are renewed every third of the lease period, so a
+    slow job is not handed to a second worker while this one still runs it.
+    """
+    concurrency = concurrency or settings.GRADING_BULK_CONCURRENCY
+    if lease_seconds is None:
+        lease_seconds = settings.GRADING_JOB_LEASE_SECONDS
+    heartbeat = lease_seconds / 3
+    renewed_at = time.monotonic()
+    done = failed = claimed = 0
+    in_flight: dict = {}
+    finished: list[tuple[models.GradingJob, AutoGradeOutcome | None]] = []
+
+    def flush():
+        nonlocal done
+        if not finished:
+            return
+        persist_autograde_outcomes([outcome for _, outcome in finished if outcome is not None])
+        complete_grading_jobs([job for job, _ in finished])
+        done += len(finished)
+        finished.clear()
+        if progress:
+            progress(done, failed)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        exhausted = False
+        while True:
+            room = concurrency - len(in_flight)
+            if max_jobs:
+                room = min(room, max_jobs - claimed)
+            if room > 0 and not exhausted:
+                jobs = claim_grading_jobs(
+                    worker_id,
+                    limit=room,
+                    lease_seconds=lease_seconds,
+                    problem_set=problem_set,
+                )
+                exhausted = len(jobs) < room
+                claimed += len(jobs)
+                for job in jobs:
+                    in_flight[executor.submit(_compute_job_in_thread, job)] = job
+            if not in_flight:
+                break
+            completed, _ = wait(in_flight, timeout=heartbeat, return_when=FIRST_COMPLETED)
+            if time.monotonic() - renewed_at >= heartbeat:
+                renew_grading_leases([*in_flight.values(), *(job for job, _ in finished)], lease_seconds)
+                renewed_at = time.monotonic()
+            for future in completed:
+                job = in_flight.pop(future)
+                try:
+                    finished.append((job, future.result()))
+                except graders.GraderUnavailable as exc:
+                    # Stop claiming; in-flight jobs finish or are deferred too.
+                    defer_grading_job(job, exc)
+                    exhausted = True
+                except Exception as exc:
+                    fail_grading_job(job, exc)
+                    failed += 1
+                    if progress:
+                        progress(done, failed)
+            if len(finished) >= persist_batch_size or not in_flight:
+                flush()
+    flush()
+    return done, failed
+
+
+def active_grading_jobs():
+    return models.GradingJob.objects.filter(
+        status__in=[models.GradingJob.STATUS_QUEUED, models.GradingJob.STATUS_RUNNING]
     )
-    submission.final_score = total_score
-    submission.status = models.Submission.STATUS_GRADED
-    submission.save(update_fields=['final_score', 'status'])
 
 
-def finalize_submission(submission: models.Submission) -> None:
+def enqueue_problem_set_grading(problem_set: models.ProblemSet, use_cache: bool = True) -> int:
+    """Queue a bulk grading job for every finalized submission in the problem set.
+
+    Submissions that already have a queued or running job are skipped, so calling
+    this twice does not double the work.
+    """
+    rubrics: dict[int, models.Rubric] = {}
+    for rubric in models.Rubric.objects.filter(problem__problem_set=problem_set).order_by(
+        'problem_id', '-version', '-id'
+    ):
+        rubrics.setdefault(rubric.problem_id, rubric)
+    busy = active_grading_jobs().filter(submission__problem__problem_set=problem_set).values('submission_id')
+    submissions = (
+        models.Submission.objects.filter(problem__problem_set=problem_set, problem_id__in=rubrics)
+        .exclude(status=models.Submission.STATUS_DRAFT)
+        .exclude(id__in=busy)
+        .only('id', 'problem_id')
+    )
+    jobs = [
+        models.GradingJob(
+            submission=submission,
+            rubric=rubrics[submission.problem_id],
+            reason=models.GradingJob.REASON_BULK,
+            use_cache=use_cache,
+        )
+        for submission in submissions
+    ]
+    # A job enqueued concurrently for the same submission wins; ours is dropped.
+    models.GradingJob.objects.bulk_create(jobs, batch_size=500, ignore_conflicts=True)
+    return len(jobs)
+
+
+def finalize_submission(submission: models.Submission) -> bool:
+    """Submit a draft and queue its grading; False if it was already finalized.
+
+    The submission row is locked so double-clicks and parallel tabs finalize
+    (and grade) it once.
+    """
     rubric = get_active_rubric(submission.problem)
-    submission.submitted_at = timezone.now()
-    submission.status = models.Submission.STATUS_SUBMITTED
-    submission.save(update_fields=['submitted_at', 'status'])
-    if rubric is not None:
-        run_autograde_openai(submission, rubric)
+    with transaction.atomic():
+        locked = models.Submission.objects.select_for_update().filter(id=submission.id).first()
+        if locked is None or locked.status != models.Submission.STATUS_DRAFT:
+            return False
+        submission.submitted_at = timezone.now()
+        submission.status = models.Submission.STATUS_SUBMITTED
+        submission.save(update_fields=['submitted_at', 'status'])
+        if rubric is not None:
+            enqueue_grading(submission, rubric)
+    return True
+
+
+def overdue_drafts(now=None):
+    """Draft submissions with at least one file whose problem set is past due."""
+    now = now or timezone.now()
+    return models.Submission.objects.filter(
+        Exists(models.SubmissionFile.objects.filter(submission=OuterRef('pk'))),
+        status=models.Submission.STATUS_DRAFT,
+        problem__problem_set__due_at__lte=now,
+    )
+
+
+def sweep_overdue_drafts(now=None, batch_size: int = 500) -> int:
+    """Finalize every overdue draft and queue its grading; returns how many were finalized.
+
+    Works in batches, one transaction each. On Postgres the batch is locked with
+    SKIP LOCKED so concurrent sweepers split the work; elsewhere the conditional
+    UPDATE keeps a draft from being finalized twice.
+    """
+    now = now or timezone.now()
+    finalized = 0
+    while True:
+        with transaction.atomic():
+            candidates = overdue_drafts(now).order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True, of=('self',))
+            rows = list(
+                candidates.values_list('id', 'problem_id', 'problem__problem_set_id', 'final_score')[:batch_size]
+            )
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            updated = models.Submission.objects.filter(id__in=ids, status=models.Submission.STATUS_DRAFT).update(
+                status=models.Submission.STATUS_SUBMITTED,
+                submitted_at=now,
+            )
+            rubrics: dict[int, models.Rubric] = {}
+            for rubric in models.Rubric.objects.filter(problem_id__in={row[1] for row in rows}).order_by(
+                'problem_id', '-version', '-id'
+            ):
+                rubrics.setdefault(rubric.problem_id, rubric)
+            jobs = [
+                models.GradingJob(submission_id=submission_id, rubric=rubrics[problem_id])
+                for submission_id, problem_id, _, _ in rows
+                if problem_id in rubrics
+            ]
+            # A job enqueued concurrently for the same submission wins; ours is dropped.
+            models.GradingJob.objects.bulk_create(jobs, batch_size=500, ignore_conflicts=True)
+            if updated == len(rows):
+                stats.apply_deltas(
+                    stats.submission_deltas(
+                        (problem_set_id, (models.Submission.STATUS_DRAFT, score), (models.Submission.STATUS_SUBMITTED, score))
+                        for _, _, problem_set_id, score in rows
+                    )
+                )
+            else:
+                # Some drafts were finalized (and counted) elsewhere between the read and the
+                # UPDATE; which ones is not known here, so recount these problem sets instead.
+                stats.refresh_problem_set_stats({problem_set_id for _, _, problem_set_id, _ in rows})
+        finalized += updated
+        if len(rows) < batch_size:
+            break
+    return finalized
+
+
+GRADING_TELEMETRY_METRICS = (
+    'render_ms',
+    'encode_ms',
+    'api_ms',
+    'persist_ms',
+    'input_tokens',
+    'cached_input_tokens',
+    'output_tokens',
+    'image_count',
+    'payload_bytes',
+    'retries',
+)
+
+
+def _percentile(values: list, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def grading_telemetry(runs, days: int = 30) -> dict:
+    """p50/p95 of each grading stage and usage metric, per problem and per model.
+
+    Cache hits count towards the run totals but not the stage percentiles, since
+    they skip rendering and the API entirely.
+    """
+    since = timezone.now() - timedelta(days=days)
+    rows = (
+        runs.filter(created_at__gte=since)
+        .values_list('submission__problem_id', 'submission__problem__title', 'model', 'cache_hit', *GRADING_TELEMETRY_METRICS)
+        .iterator(chunk_size=2000)
+    )
+    groups = {'problems': {}, 'models': {}}
+    for problem_id, problem_title, model_name, cache_hit, *metrics in rows:
+        for kind, key, label in (('problems', problem_id, problem_title), ('models', model_name, model_name)):
+            group = groups[kind].get(key)
+            if group is None:
+                group = groups[kind][key] = {
+                    'label': label,
+                    'runs': 0,
+                    'cache_hits': 0,
+                    'values': {name: [] for name in GRADING_TELEMETRY_METRICS},
+                }
+            group['runs'] += 1
+            if cache_hit:
+                group['cache_hits'] += 1
+                continue
+            for name, value in zip(GRADING_TELEMETRY_METRICS, metrics):
+                if value is not None:
+                    group['values'][name].append(value)
+
+    result = {}
+    for kind, by_key in groups.items():
+        result[kind] = []
+        for group in sorted(by_key.values(), key=lambda item: -item['runs']):
+            values = group.pop('values')
+            group['metrics'] = [
+                {'name': name, 'p50': _percentile(values[name], 0.5), 'p95': _percentile(values[name], 0.95)}
+                for name in GRADING_TELEMETRY_METRICS
+            ]
+            result[kind].append(group)
+    return result
@@ -0,0 +1,151 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import models, stats
+
+SUBMISSION_STAT_FIELDS = {'status', 'final_score'}
+
+
+def _deleted_model(origin):
+    """The model whose delete() started a cascade (`origin` is an instance or a queryset)."""
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _stats_deleted(origin) -> bool:
+    # Deleting a problem set (or its course) drops its stats row; there is nothing left to adjust.
+    return issubclass(_deleted_model(origin), (models.ProblemSet, models.Class))
+
+
+def _problems_deleted(origin) -> bool:
+    return issubclass(_deleted_model(origin), models.Problem)
+
+
+@receiver(post_save, sender=models.ProblemSet)
+def problem_set_created(sender, instance, created, **kwargs):
+    if created:
+        stats.refresh_problem_set_stats([instance.id])
+
+
+@receiver(post_save, sender=models.Problem)
+def problem_created(sender, instance, created, **kwargs):
+    if created:
+        stats.apply_deltas({instance.problem_set_id: {'problem_count': 1}})
+
+
+@receiver(post_delete, sender=models.Problem)
+def problem_deleted(sender, instance, origin=None, **kwargs):
+    if _stats_deleted(origin):
+        return
+    # The first problem of the delete also applies its cascade's submission deltas.
+    deltas = getattr(origin, '_stats_cascade_deltas', None) or {}
+    if deltas:
+        origin._stats_cascade_deltas = {}
+    delta = deltas.setdefault(instance.problem_set_id, {})
+    delta['problem_count'] = delta.get('problem_count', 0) - 1
+    stats.apply_deltas(deltas)
+
+
+def _enrollment_figures(enrollment) -> dict[str, float]:
+    return {'enrollment_count': 1} if enrollment.status == models.Enrollment.STATUS_ACTIVE else {}
+
+
+@receiver(post_save, sender=models.Enrollment)
+def enrollment_created(sender, instance, created, **kwargs):
+    # Enrollments have a single status, so only creation and deletion change the counts.
+    if created:
+        stats.apply_course_delta(instance.course_id, _enrollment_figures(instance))
+
+
+@receiver(post_delete, sender=models.Enrollment)
+def enrollment_deleted(sender, instance, origin=None, **kwargs):
+    if _stats_deleted(origin):
+        return
+    stats.apply_course_delta(instance.course_id, stats.figures_delta(_enrollment_figures(instance), {}))
+
+
+@receiver(pre_save, sender=models.Submission)
+def submission_saving(sender, instance, update_fields=None, **kwargs):
+    """Remember the submission's problem set and stored figures; post_save applies the difference."""
+    instance._stats_before = None
+    if update_fields is not None and not SUBMISSION_STAT_FIELDS & set(update_fields):
+        return
+    before = None
+    if not instance._state.adding:
+        before = (
+            models.Submission.objects.filter(id=instance.id)
+            .values_list('problem__problem_set_id', 'status', 'final_score')
+            .first()
+        )
+    if before is None:
+        problem_set_id = models.Problem.objects.filter(id=instance.problem_id).values_list('problem_set_id', flat=True).first()
+        instance._stats_before = (problem_set_id, {})
+    else:
+        instance._stats_before = (before[0], stats.submission_figures(before[1], before[2]))
+
+
+@receiver(post_save, sender=models.Submission)
+def submission_saved(sender, instance, **kwargs):
+    if instance._stats_before is None:
+        return
+    problem_set_id, before = instance._stats_before
+    after = stats.submission_figures(instance.status, instance.final_score)
+    stats.apply_deltas({problem_set_id: stats.figures_delta(before, after)})
+
+
+@receiver(pre_delete, sender=models.Submission)
+def submission_deleting(sender, instance, origin=None, **kwargs):
+    instance._stats_before = None
+    if _stats_deleted(origin):
+        return
+    if _problems_deleted(origin):
+        # One aggregated snapshot for the whole cascade; problem_deleted applies it.
+        if not hasattr(origin, '_stats_cascade_deltas'):
+            problems = origin if isinstance(origin, QuerySet) else [origin]
+            origin._stats_cascade_deltas = stats.removal_deltas(models.Submission.objects.filter(problem__in=problems))
+        return
+    # The stored row, not the instance, is what the stats counted.
+    instance._stats_before = (
+        models.Submission.objects.filter(id=instance.id)
+        .values_list('problem__problem_set_id', 'status', 'final_score')
+        .first()
+    )
+
+
+@receiver(post_delete, sender=models.Submission)
+def submission_deleted(sender, instance, **kwargs):
+    if instance._stats_before is not None:
+        problem_set_id, status, final_score = instance._stats_before
+        stats.apply_deltas({problem_set_id: stats.figures_delta(stats.submission_figures(status, final_score), {})})
+
+
+def _appeal_figures(status: str) -> dict[str, float]:
+    return {'open_appeals': 1} if status == models.Appeal.STATUS_OPEN else {}
+
+
+def _appeal_problem_set_id(appeal) -> int | None:
+    return (
+        models.Submission.objects.filter(id=appeal.submission_id).values_list('problem__problem_set_id', flat=True).first()
+    )
+
+
+@receiver(pre_save, sender=models.Appeal)
+def appeal_saving(sender, instance, **kwargs):
+    before = None if instance._state.adding else models.Appeal.objects.filter(id=instance.id).values_list('status', flat=True).first()
+    instance._stats_before = _appeal_figures(before)
+
+
+@receiver(post_save, sender=models.Appeal)
+def appeal_saved(sender, instance, **kwargs):
+    delta = stats.figures_delta(instance._stats_before, _appeal_figures(instance.status))
+    if delta:
+        stats.apply_deltas({_appeal_problem_set_id(instance): delta})
+
+
+@receiver(post_delete, sender=models.Appeal)
+def appeal_deleted(sender, instance, origin=None, **kwargs):
+    if _stats_deleted(origin) or _problems_deleted(origin):
+        return
+    delta = stats.figures_delta(_appeal_figures(instance.status), {})
+    if delta:
+        stats.apply_deltas({_appeal_problem_set_id(instance): delta})
@@ -0,0 +1,246 @@
+"""Materialized ProblemSetStats rows.
+
+Writes apply their change to the affected rows as F() deltas in the same
+transaction: signals for ordinary saves and deletes, explicit calls after bulk
+writes. Each write costs one small UPDATE, whatever the size of the problem set.
+Scores are kept as a count, a sum and a sum of squares, so mean and stddev
+derive from them. The median cannot be maintained that way; a score change
+marks it stale and it is recomputed the next time it is displayed (or by
+`rebuild_stats`, which recomputes every figure from scratch).
+"""
+import statistics
+from collections import defaultdict
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from . import models
+
+STAT_FIELDS = [
+    'problem_count',
+    'enrollment_count',
+    'submission_count',
+    'graded_count',
+    'score_count',
+    'score_sum',
+    'score_sum_squares',
+    'median_score',
+    'median_stale',
+    'open_appeals',
+    'updated_at',
+]
+SCORE_FIELDS = {'score_count', 'score_sum', 'score_sum_squares'}
+
+
+def submission_figures(status: str, final_score) -> dict[str, float]:
+    """What one submission in this state contributes to its problem set's stats."""
+    if status == models.Submission.STATUS_DRAFT:
+        return {}
+    figures = {'submission_count': 1}
+    if status == models.Submission.STATUS_GRADED:
+        figures['graded_count'] = 1
+    if final_score is not None:
+        score = float(final_score)
+        figures.update(score_count=1, score_sum=score, score_sum_squares=score * score)
+    return figures
+
+
+def figures_delta(before: dict[str, float], after: dict[str, float]) -> dict[str, float]:
+    delta = {field: after.get(field, 0) - before.get(field, 0) for field in before.keys() | after.keys()}
+    return {field: value for field, value in delta.items() if value}
+
+
+def submission_deltas(changes) -> dict[int, dict[str, float]]:
+    """Per-problem-set deltas for (problem set id, (status, score) before, (status, score) after) tuples."""
+    deltas = defaultdict(dict)
+    for problem_set_id, before, after in changes:
+        delta = deltas[problem_set_id]
+        for field, value in figures_delta(submission_figures(*before), submission_figures(*after)).items():
+            delta[field] = delta.get(field, 0) + value
+    return deltas
+
+
+def removal_deltas(submissions) -> dict[int, dict[str, float]]:
+    """Per-problem-set deltas for deleting `submissions` (a queryset) and their appeals.
+
+    Summed in the database, so a cascade costs two queries however many rows it removes.
+    """
+    deltas = defaultdict(dict)
+
+    def subtract(problem_set_id, field, value):
+        if value:
+            deltas[problem_set_id][field] = deltas[problem_set_id].get(field, 0) - value
+
+    rows = (
+        submissions.exclude(status=models.Submission.STATUS_DRAFT)
+        .order_by()
+        .values_list('problem__problem_set_id', 'status')
+        .annotate(
+            count=Count('id'),
+            score_count=Count('final_score'),
+            score_sum=Sum('final_score'),
+            score_sum_squares=Sum(F('final_score') * F('final_score')),
+        )
+    )
+    for problem_set_id, status, count, score_count, score_sum, score_sum_squares in rows:
+        subtract(problem_set_id, 'submission_count', count)
+        if status == models.Submission.STATUS_GRADED:
+            subtract(problem_set_id, 'graded_count', count)
+        subtract(problem_set_id, 'score_count', score_count)
+        subtract(problem_set_id, 'score_sum', float(score_sum or 0))
+        subtract(problem_set_id, 'score_sum_squares', float(score_sum_squares or 0))
+    appeals = (
+        models.Appeal.objects.filter(submission__in=submissions, status=models.Appeal.STATUS_OPEN)
+        .order_by()
+        .values_list('submission__problem__problem_set_id')
+        .annotate(count=Count('id'))
+    )
+    for problem_set_id, count in appeals:
+        subtract(problem_set_id, 'open_appeals', count)
+    return deltas
+
+
+def apply_deltas(deltas: dict[int, dict[str, float]]) -> None:
+    """Add `deltas` ({problem set id: {field: change}}) to the stats rows; one UPDATE per problem set."""
+    now = timezone.now()
+    for problem_set_id, delta in deltas.items():
+        if problem_set_id and delta:
+            _update(models.ProblemSetStats.objects.filter(problem_set_id=problem_set_id), delta, now)
+
+
+def apply_course_delta(course_id: int, delta: dict[str, float]) -> None:
+    """Add `delta` to the stats row of every problem set in the course (enrollment changes)."""
+    if delta:
+        _update(models.ProblemSetStats.objects.filter(problem_set__course_id=course_id), delta, timezone.now())
+
+
+def refresh_course_enrollment(course_id: int) -> None:
+    """Recount the course's active enrollments into its stats rows, for bulk writes that may skip rows."""
+    count = models.Enrollment.objects.filter(course_id=course_id, status=models.Enrollment.STATUS_ACTIVE).count()
+    models.ProblemSetStats.objects.filter(problem_set__course_id=course_id).update(
+        enrollment_count=count, updated_at=timezone.now()
+    )
+
+
+def _update(rows, delta, now) -> None:
+    changes = {field: F(field) + value for field, value in delta.items()}
+    if SCORE_FIELDS & delta.keys():
+        changes['median_stale'] = True
+    # Rows not created yet are filled in from scratch by stats_for.
+    rows.update(**changes, updated_at=now)
+
+
+def refresh_problem_set_stats(problem_set_ids) -> None:
+    """Recompute every figure of the given problem sets from scratch."""
+    problem_set_ids = list(problem_set_ids)
+    problem_sets = models.ProblemSet.objects.filter(id__in=problem_set_ids).annotate(
+        problem_count=Count('problems', distinct=True),
+    )
+    enrollments = dict(
+        models.Enrollment.objects.filter(course__problem_sets__id__in=problem_set_ids, status=models.Enrollment.STATUS_ACTIVE)
+        .values_list('course__problem_sets__id')
+        .annotate(count=Count('id'))
+    )
+    appeals = dict(
+        models.Appeal.objects.filter(
+            submission__problem__problem_set_id__in=problem_set_ids,
+            status=models.Appeal.STATUS_OPEN,
+        )
+        .values_list('submission__problem__problem_set_id')
+        .annotate(count=Count('id'))
+    )
+    totals = defaultdict(dict)
+    scores = defaultdict(list)
+    rows = (
+        models.Submission.objects.filter(problem__problem_set_id__in=problem_set_ids)
+        .exclude(status=models.Submission.STATUS_DRAFT)
+        .values_list('problem__problem_set_id', 'status', 'final_score')
+        .iterator(chunk_size=5000)
+    )
+    for problem_set_id, status, final_score in rows:
+        entry = totals[problem_set_id]
+        for field, value in submission_figures(status, final_score).items():
+            entry[field] = entry.get(field, 0) + value
+        if final_score is not None:
+            scores[problem_set_id].append(float(final_score))
+
+    now = timezone.now()
+    existing = {
+        row.problem_set_id: row for row in models.ProblemSetStats.objects.filter(problem_set_id__in=problem_set_ids)
+    }
+    to_create, to_update = [], []
+    for problem_set in problem_sets:
+        entry = totals[problem_set.id]
+        row = existing.get(problem_set.id)
+        if row is None:
+            row = models.ProblemSetStats(problem_set=problem_set)
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        row.problem_count = problem_set.problem_count
+        row.enrollment_count = enrollments.get(problem_set.id, 0)
+        row.submission_count = entry.get('submission_count', 0)
+        row.graded_count = entry.get('graded_count', 0)
+        row.score_count = entry.get('score_count', 0)
+        row.score_sum = entry.get('score_sum', 0)
+        row.score_sum_squares = entry.get('score_sum_squares', 0)
+        row.median_score = statistics.median(scores[problem_set.id]) if scores[problem_set.id] else None
+        row.median_stale = False
+        row.open_appeals = appeals.get(problem_set.id, 0)
+        row.updated_at = now
+    if to_create:
+        # A concurrent refresh may have inserted the row first; its figures are as fresh as ours.
+        models.ProblemSetStats.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_update:
+        models.ProblemSetStats.objects.bulk_update(to_update, STAT_FIELDS)
+
+
+def refresh_medians(rows: list[models.ProblemSetStats]) -> None:
+    """Recompute the median of stale rows in place (one query for all of them)."""
+    stale = {row.problem_set_id: row for row in rows if row.median_stale}
+    if not stale:
+        return
+    scores = defaultdict(list)
+    for problem_set_id, final_score in (
+        models.Submission.objects.filter(problem__problem_set_id__in=stale, final_score__isnull=False)
+        .exclude(status=models.Submission.STATUS_DRAFT)
+        .values_list('problem__problem_set_id', 'final_score')
+        .iterator(chunk_size=5000)
+    ):
+        scores[problem_set_id].append(float(final_score))
+    for problem_set_id, row in stale.items():
+        row.median_score = statistics.median(scores[problem_set_id]) if scores[problem_set_id] else None
+        row.median_stale = False
+        # Only clear the flag if no score changed since the row was read; otherwise it stays stale.
+        models.ProblemSetStats.objects.filter(
+            id=row.id, score_count=row.score_count, score_sum=row.score_sum
+        ).update(median_score=row.median_score, median_stale=False)
+
+
+def stats_for(problem_sets, median: bool = False) -> dict[int, models.ProblemSetStats]:
+    """Stats rows for already-fetched problem sets (select_related('stats')), filling in any missing.
+
+    Pass median=True where the median is displayed, to bring stale medians up to date.
+    """
+    found, missing = {}, []
+    for problem_set in problem_sets:
+        try:
+            found[problem_set.id] = problem_set.stats
+        except ObjectDoesNotExist:
+            missing.append(problem_set.id)
+    if missing:
+        refresh_problem_set_stats(missing)
+        found.update(
+            (row.problem_set_id, row) for row in models.ProblemSetStats.objects.filter(problem_set_id__in=missing)
+        )
+    if median:
+        refresh_medians(list(found.values()))
+    return found
+
+
+def rebuild_all(batch_size: int = 200) -> int:
+    ids = list(models.ProblemSet.objects.values_list('id', flat=True).order_by('id'))
+    for start in range(0, len(ids), batch_size):
+        refresh_problem_set_stats(ids[start:start + batch_size])
+    return len(ids)
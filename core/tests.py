@@ -1,3 +1,1566 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import batch, gradebook, graders, imaging, models, rendering, resilience, roster, services, stats, urls
+from .page_cache import PageImageCache
+
+BASE_DIR = str(settings.BASE_DIR)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ProfessorDashboardTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        self.other_professor = User.objects.create_user('other', 'other@example.edu', 'pw', is_staff=True)
+        self.students = [
+            User.objects.create_user(f'student{idx}', f'student{idx}@example.edu', 'pw') for idx in range(3)
+        ]
+        self.client.force_login(self.professor)
+
+    def make_class(self, professor, problem_sets=2, problems=2):
+        course = models.Class.objects.create(title='Calculus', professor=professor)
+        for student in self.students:
+            models.Enrollment.objects.create(course=course, user=student)
+        for ps_idx in range(problem_sets):
+            problem_set = models.ProblemSet.objects.create(course=course, title=f'PS {ps_idx}')
+            for problem_idx in range(problems):
+                problem = models.Problem.objects.create(problem_set=problem_set, title=f'P {problem_idx}')
+                for score, student in enumerate(self.students[:2], start=4):
+                    models.Submission.objects.create(
+                        problem=problem,
+                        student=student,
+                        status=models.Submission.STATUS_GRADED,
+                        final_score=score,
+                    )
+        return course
+
+    def count_dashboard_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_classes(self):
+        self.make_class(self.professor)
+        queries = self.count_dashboard_queries()
+        for _ in range(4):
+            self.make_class(self.professor, problem_sets=3, problems=3)
+        self.assertEqual(self.count_dashboard_queries(), queries)
+        # Session, user, classes and problem sets joined to their stats.
+        self.assertLessEqual(queries, 4)
+
+    def test_stats_and_appeal_scope(self):
+        self.make_class(self.professor, problem_sets=1, problems=2)
+        other_course = self.make_class(self.other_professor, problem_sets=1, problems=1)
+        other_submission = models.Submission.objects.filter(problem__problem_set__course=other_course).first()
+        models.Appeal.objects.create(submission=other_submission, student=other_submission.student, reason='x')
+
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.context['appeals_open'], 0)
+        [card] = response.context['class_cards']
+        [stats] = card['problem_sets']
+        # 2 problems x 3 students expected, 4 submitted.
+        self.assertEqual(stats['percent'], 66.7)
+        self.assertEqual(float(stats['avg_score']), 4.5)
+
+
+def query_call_site() -> str:
+    """Innermost template line or app frame that issued the current query."""
+    frame = sys._getframe(1)
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        node = frame.f_locals.get('self') if code.co_name == 'render_annotated' else None
+        if node is not None and getattr(node, 'origin', None) is not None and getattr(node, 'token', None):
+            return f'{node.origin.template_name}:{node.token.lineno}'
+        filename = code.co_filename
+        if filename.startswith(APP_DIR) and filename != __file__:
+            return f'{os.path.relpath(filename, BASE_DIR)}:{frame.f_lineno} ({code.co_name})'
+        if fallback is None and f'{os.sep}django{os.sep}' in filename and f'{os.sep}django{os.sep}db{os.sep}' not in filename:
+            fallback = f'{filename.split(os.sep + "django" + os.sep, 1)[1]}:{frame.f_lineno} ({code.co_name})'
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+def png_bytes(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (255, 255, 255)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries: list[tuple[str, str]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((query_call_site(), sql))
+        return execute(sql, params, many, context)
+
+    def report(self) -> str:
+        by_site = defaultdict(list)
+        for site, sql in self.queries:
+            by_site[site].append(sql)
+        lines = []
+        for site, statements in sorted(by_site.items(), key=lambda item: -len(item[1])):
+            lines.append(f'  {len(statements):>3} x {site}')
+            for sql in dict.fromkeys(statements):
+                lines.append(f'          {sql[:300]}')
+        return '\n'.join(lines)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='dydx-test-media-'))
+class QueryBudgetTests(TestCase):
+    """Every named route renders in a fixed number of queries, however many rows the page shows.
+
+    The fixture has several students, problems, files, grades, appeals and messages
+    per parent row, so a per-row query anywhere blows the budget.
+    """
+
+    STUDENTS = 6
+    PROBLEMS = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        cls.students = [
+            User.objects.create_user(f'student{idx}', f'student{idx}@example.edu', 'pw') for idx in range(cls.STUDENTS)
+        ]
+        cls.student = cls.students[0]
+        cls.course = models.Class.objects.create(title='Calculus', professor=cls.professor)
+        now = timezone.now()
+        cls.past_set = models.ProblemSet.objects.create(course=cls.course, title='PS 1', due_at=now - timedelta(days=1))
+        cls.open_set = models.ProblemSet.objects.create(course=cls.course, title='PS 2', due_at=now + timedelta(days=7))
+        cls.problems = {}
+        for problem_set in (cls.past_set, cls.open_set):
+            for idx in range(cls.PROBLEMS):
+                problem = models.Problem(problem_set=problem_set, title=f'P{idx}', order=idx)
+                problem.prompt_pdf.save(f'p{idx}.pdf', ContentFile(b'%PDF-1.4'), save=False)
+                problem.prompt_sha256 = f'{problem_set.id:032x}{idx:032x}'
+                problem.save()
+                for page_number in (1, 2):
+                    page = models.ProblemPromptPage(problem=problem, page_number=page_number, width=60, height=80)
+                    page.image.save(f'p{idx}-{page_number}.png', ContentFile(png_bytes(60, 80)), save=False)
+                    page.save()
+                services.prompt_preview(problem, 1, 'full')
+                rubric = models.Rubric.objects.create(problem=problem)
+                models.RubricItem.objects.bulk_create(
+                    models.RubricItem(rubric=rubric, label=f'Item {item}', points=3, order=item) for item in range(3)
+                )
+                cls.problems.setdefault(problem_set.id, []).append(problem)
+        for student in cls.students:
+            cls.add_student(student)
+        cls.graded = models.Submission.objects.filter(student=cls.student, problem__problem_set=cls.past_set).first()
+        cls.draft = models.Submission.objects.filter(student=cls.student, problem__problem_set=cls.open_set).first()
+        cls.appeal = cls.graded.appeals.first()
+        stats.rebuild_all()
+
+    @classmethod
+    def add_student(cls, student):
+        """Enroll `student` with files, grades, autograde runs and an appeal thread on every problem."""
+        models.Enrollment.objects.create(course=cls.course, user=student)
+        for problem_set in (cls.past_set, cls.open_set):
+            graded = problem_set == cls.past_set
+            for problem in cls.problems[problem_set.id]:
+                rubric = services.get_active_rubric(problem)
+                submission = models.Submission.objects.create(
+                    problem=problem,
+                    student=student,
+                    status=models.Submission.STATUS_SUBMITTED if graded else models.Submission.STATUS_DRAFT,
+                )
+                for page in range(1, 3):
+                    models.SubmissionFile.objects.create(
+                        submission=submission, file=f'submissions/s{submission.id}-{page}.png', page_number=page
+                    )
+                if not graded:
+                    continue
+                for score in (5, 7):
+                    models.AutoGradeRun.objects.create(
+                        submission=submission,
+                        rubric=rubric,
+                        model='test',
+                        raw_output_json={'parsed': {'rubric_scores': [{'label': 'Item 0', 'score': 3}]}},
+                        score=score,
+                    )
+                    models.Grade.objects.create(
+                        submission=submission, rubric=rubric, score=score, grader_type=models.Grade.GRADER_AUTO
+                    )
+                services.apply_best_grades([submission])
+                appeal = models.Appeal.objects.create(submission=submission, student=student, reason='Please check.')
+                for author in (student, cls.professor, student):
+                    models.AppealMessage.objects.create(appeal=appeal, author=author, message='...')
+
+    def routes(self):
+        """(url name, kwargs, user, query budget) for every named route in core.urls."""
+        past_problem = self.problems[self.past_set.id][0]
+        open_problem = self.problems[self.open_set.id][0]
+        professor, student = self.professor, self.student
+        return [
+            ('dashboard', {}, professor, 4),
+            ('dashboard', {}, student, 5),
+            ('login', {}, None, 0),
+            ('signup', {}, None, 0),
+            ('logout', {}, student, 4),
+            ('admin_password_reset', {}, professor, 2),
+            ('class_list', {}, professor, 3),
+            ('class_create', {}, professor, 2),
+            ('class_detail', {'class_id': self.course.id}, professor, 5),
+            ('enrollment_add', {'class_id': self.course.id}, professor, 3),
+            ('gradebook_export', {'class_id': self.course.id}, professor, 6),
+            ('roster_upload', {'class_id': self.course.id}, professor, 3),
+            ('problem_set_create', {'class_id': self.course.id}, professor, 3),
+            ('problem_set_detail', {'problem_set_id': self.past_set.id}, professor, 5),
+            ('problem_create', {'problem_set_id': self.past_set.id}, professor, 4),
+            ('submission_list', {'problem_set_id': self.past_set.id}, professor, 7),
+            ('submission_grade_all', {'problem_set_id': self.past_set.id}, professor, 3),
+            ('problem_detail', {'problem_id': past_problem.id}, professor, 8),
+            ('problem_delete', {'problem_id': past_problem.id}, professor, 3),
+            ('problem_prompt_preview', {'problem_id': past_problem.id}, student, 4),
+            ('rubric_edit', {'problem_id': past_problem.id}, professor, 5),
+            ('rubric_regenerate', {'problem_id': past_problem.id}, professor, 3),
+            ('submission_detail', {'submission_id': self.graded.id}, professor, 7),
+            ('appeals_list', {}, professor, 3),
+            ('grading_stats', {}, professor, 3),
+            ('appeal_detail', {'appeal_id': self.appeal.id}, professor, 4),
+            ('student_class_list', {}, student, 3),
+            ('student_class_detail', {'class_id': self.course.id}, student, 5),
+            ('student_problem_set_detail', {'problem_set_id': self.past_set.id}, student, 5),
+            ('student_problem_detail', {'problem_id': past_problem.id}, student, 11),
+            ('submission_upload', {'problem_id': open_problem.id}, student, 5),
+            ('student_regrade', {'submission_id': self.graded.id}, student, 3),
+            ('submission_finalize', {'submission_id': self.draft.id}, student, 20),
+            ('submission_delete_draft', {'submission_id': self.draft.id}, student, 4),
+            ('appeal_create', {'submission_id': self.graded.id}, student, 3),
+            ('student_password_change', {}, student, 2),
+        ]
+
+    def test_every_route_is_covered(self):
+        covered = {name for name, *_ in self.routes()}
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns} - covered, set())
+
+    def get_logged(self, name, kwargs, user) -> QueryLog:
+        """GET the route as `user`, rolling back anything it writes, and return its queries."""
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        log = QueryLog()
+        savepoint = transaction.savepoint()
+        try:
+            with connection.execute_wrapper(log):
+                response = self.client.get(reverse(name, kwargs=kwargs))
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        finally:
+            transaction.savepoint_rollback(savepoint)
+        self.assertLess(response.status_code, 400, name)
+        return log
+
+    def test_query_budgets(self):
+        for name, kwargs, user, budget in self.routes():
+            with self.subTest(route=name, user=user and user.username):
+                log = self.get_logged(name, kwargs, user)
+                self.assertLessEqual(
+                    len(log.queries),
+                    budget,
+                    f'{name} ran {len(log.queries)} queries (budget {budget}), by call site:\n{log.report()}',
+                )
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        before = {(name, user): len(self.get_logged(name, kwargs, user).queries) for name, kwargs, user, _ in self.routes()}
+        self.add_student(get_user_model().objects.create_user('late', 'late@example.edu', 'pw'))
+        stats.rebuild_all()
+        for name, kwargs, user, _ in self.routes():
+            with self.subTest(route=name, user=user and user.username):
+                log = self.get_logged(name, kwargs, user)
+                self.assertEqual(
+                    len(log.queries),
+                    before[(name, user)],
+                    f'{name} query count changed with one more student, by call site:\n{log.report()}',
+                )
+
+
+class GradebookExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        cls.course = models.Class.objects.create(title='Linear Algebra', professor=cls.professor)
+        problem_set = models.ProblemSet.objects.create(course=cls.course, title='PS 1')
+        problems = [
+            models.Problem.objects.create(problem_set=problem_set, title=f'P{idx}', order=idx, prompt_pdf='p.pdf')
+            for idx in range(2)
+        ]
+        rubric = models.Rubric.objects.create(problem=problems[0], total_points=10)
+        cls.students = [User.objects.create_user(f's{idx}', f's{idx}@example.edu', 'pw') for idx in range(3)]
+        # The last student has a submission but is not enrolled; they stay out of the export.
+        for student in cls.students[:2]:
+            models.Enrollment.objects.create(course=cls.course, user=student)
+        for student in cls.students:
+            submission = models.Submission.objects.create(
+                problem=problems[0], student=student, status=models.Submission.STATUS_SUBMITTED, submitted_at=timezone.now()
+            )
+            services.save_grade(
+                models.Grade(submission=submission, rubric=rubric, score=8, grader_type=models.Grade.GRADER_AUTO)
+            )
+        cls.appealed = models.Submission.objects.get(problem=problems[0], student=cls.students[0])
+        models.Appeal.objects.create(submission=cls.appealed, student=cls.students[0], reason='Recount.')
+
+    def test_csv_export_streams_every_student_and_problem(self):
+        self.client.force_login(self.professor)
+        response = self.client.get(reverse('gradebook_export', kwargs={'class_id': self.course.id}))
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['student_email'] for row in rows}, {'s0@example.edu', 's1@example.edu'})
+        first = rows[0]
+        self.assertEqual((first['problem'], first['final_score'], first['grader_type']), ('P0', '8.00', 'auto'))
+        self.assertEqual(first['appeal_status'], models.Appeal.STATUS_OPEN)
+        self.assertEqual(rows[1]['status'], gradebook.STATUS_MISSING)
+
+    def test_xlsx_export_command(self):
+        path = os.path.join(tempfile.mkdtemp(prefix='dydx-test-gradebook-'), 'gradebook.xlsx')
+        call_command('export_gradebook', self.course.id, format='xlsx', output=path, chunk_size=1, stdout=io.StringIO())
+        with zipfile.ZipFile(path) as archive:
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        rows = sheet.findall(f'{namespace}sheetData/{namespace}row')
+        self.assertEqual(len(rows), 5)
+        header = [cell.findtext(f'{namespace}is/{namespace}t') for cell in rows[0]]
+        self.assertEqual(header, gradebook.COLUMNS)
+
+
+class RosterImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        cls.course = models.Class.objects.create(title='Topology', professor=cls.professor)
+        models.ProblemSet.objects.create(course=cls.course, title='PS 1')
+        cls.enrolled = User.objects.create_user('enrolled', 'Enrolled@Example.edu', 'pw')
+        cls.known = User.objects.create_user('known', 'known@example.edu', 'pw')
+        models.Enrollment.objects.create(course=cls.course, user=cls.enrolled)
+
+    def roster_csv(self, emails) -> str:
+        return 'Email,First name,Last name\n' + ''.join(f'{email},Ada,Lovelace\n' for email in emails)
+
+    def test_import_reports_each_row(self):
+        text = self.roster_csv(
+            ['known@example.edu', 'enrolled@example.edu', 'nobody@example.edu', 'not-an-email', 'KNOWN@example.edu', 'prof@example.edu']
+        )
+        report = roster.import_roster_csv(self.course, text)
+        self.assertEqual(report.added, ['known@example.edu'])
+        self.assertEqual(report.unknown, ['nobody@example.edu'])
+        self.assertEqual(
+            [(line, reason) for line, _, reason in report.skipped],
+            [(5, 'invalid email'), (6, 'duplicate row'), (3, 'already enrolled'), (7, 'staff account')],
+        )
+        self.assertEqual(self.course.enrollments.count(), 2)
+        problem_set = self.course.problem_sets.get()
+        self.assertEqual(problem_set.stats.enrollment_count, 2)
+
+    def test_query_count_does_not_depend_on_roster_size(self):
+        counts = []
+        for size in (3, 30):
+            emails = [f'new{size}-{idx}@example.edu' for idx in range(size)] + ['known@example.edu']
+            with CaptureQueriesContext(connection) as queries:
+                report = roster.import_roster_csv(self.course, self.roster_csv(emails), create_missing=True)
+            self.assertEqual(len(report.created), size)
+            counts.append(len(queries))
+            models.Enrollment.objects.filter(user=self.known).delete()
+        self.assertEqual(counts[0], counts[1])
+
+    def test_concurrent_enrollments_are_not_counted_twice(self):
+        bulk_create = models.Enrollment.objects.bulk_create
+
+        def enroll_concurrently(objs, **kwargs):
+            # Another import enrolls the student between the read and the insert; its signal counts it.
+            models.Enrollment.objects.create(course=self.course, user=self.known)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(models.Enrollment.objects, 'bulk_create', side_effect=enroll_concurrently):
+            report = roster.import_roster_csv(self.course, self.roster_csv(['known@example.edu']))
+        self.assertEqual(report.added, ['known@example.edu'])
+        self.assertEqual(self.course.problem_sets.get().stats.enrollment_count, 2)
+
+    def test_resync_command_creates_and_drops(self):
+        path = os.path.join(tempfile.mkdtemp(prefix='dydx-test-roster-'), 'roster.csv')
+        with open(path, 'w') as handle:
+            handle.write('known@example.edu\nfresh@example.edu\n')
+        out = io.StringIO()
+        call_command('import_roster', self.course.id, path, create_missing=True, drop_unlisted=True, stdout=out)
+        self.assertIn('2 added (1 created), 0 skipped, 0 unknown, 1 dropped', out.getvalue())
+        self.assertEqual(
+            set(self.course.enrollments.values_list('user__email', flat=True)), {'known@example.edu', 'fresh@example.edu'}
+        )
+        self.assertFalse(get_user_model().objects.get(email='fresh@example.edu').has_usable_password())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='dydx-test-media-'))
+class PromptPreviewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        cls.student = User.objects.create_user('student', 'student@example.edu', 'pw')
+        course = models.Class.objects.create(title='Analysis', professor=cls.professor)
+        models.Enrollment.objects.create(course=course, user=cls.student)
+        problem_set = models.ProblemSet.objects.create(course=course, title='PS 1')
+        cls.problem = models.Problem.objects.create(
+            problem_set=problem_set, title='P1', prompt_pdf='p.pdf', prompt_sha256='ab' * 32
+        )
+        for page_number in (1, 2):
+            page = models.ProblemPromptPage(problem=cls.problem, page_number=page_number, width=1200, height=1600)
+            page.image.save(f'prompt-{page_number}.png', ContentFile(png_bytes(1200, 1600)), save=False)
+            page.save()
+        cls.url = reverse('problem_prompt_preview', kwargs={'problem_id': cls.problem.id})
+
+    def setUp(self):
+        self.client.force_login(self.student)
+
+    def test_variants_are_rendered_once_and_sized(self):
+        response = self.client.get(self.url, {'page': 2, 'size': 'thumb'})
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.width, services.PROMPT_PREVIEW_SIZES['thumb'])
+        name = services.prompt_preview_name(self.problem.prompt_sha256, 2, 'thumb')
+        rendered_at = default_storage.get_modified_time(name)
+        self.assertEqual(services.prompt_preview(self.problem, 2, 'thumb'), name)
+        self.assertEqual(default_storage.get_modified_time(name), rendered_at)
+        self.assertEqual(self.client.get(self.url, {'page': 3}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'size': 'huge'}).status_code, 404)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url, {'v': self.problem.prompt_sha256[:12]})
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(self.url)['Cache-Control'], 'private, no-cache')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(any('promptpage' in query['sql'] for query in queries.captured_queries))
+
+        response = self.client.get(self.url, headers={'if-modified-since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(self.url, {'page': 2}, headers={'if-none-match': etag}).status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='dydx-test-media-'))
+class PromptRenderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        course = models.Class.objects.create(title='Geometry', professor=cls.professor)
+        problem_set = models.ProblemSet.objects.create(course=course, title='PS 1')
+        cls.problem = models.Problem.objects.create(problem_set=problem_set, title='P1')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='dydx-test-prompts-')
+        pool = rendering.RenderPool(workers=0, timeout=30, max_rss_bytes=0)
+        page_cache = PageImageCache(storage=FileSystemStorage(location=self.directory))
+        for patcher in (
+            mock.patch.object(rendering, 'get_render_pool', return_value=pool),
+            mock.patch.object(services, 'page_cache', page_cache),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, pages):
+        with open(write_pdf(self.directory, 'prompt.pdf', pages), 'rb') as pdf:
+            self.problem.prompt_pdf.save('prompt.pdf', ContentFile(pdf.read()))
+
+    def test_pages_render_once_per_upload(self):
+        self.upload(2)
+        pages = services.render_prompt_pages(self.problem)
+        self.assertEqual([page.page_number for page in pages], [1, 2])
+        first_hash = self.problem.prompt_sha256
+        self.assertTrue(first_hash and self.problem.prompt_preview)
+        # Same content: the stored pages are reused without touching pdfium.
+        with mock.patch.object(services, '_iter_file_images') as render:
+            self.assertEqual(services.render_prompt_pages(self.problem), pages)
+        render.assert_not_called()
+
+        self.upload(3)
+        pages = services.render_prompt_pages(self.problem)
+        self.assertNotEqual(self.problem.prompt_sha256, first_hash)
+        self.assertEqual(self.problem.prompt_pages.count(), 3)
+        self.assertEqual(len(list(services.iter_prompt_page_images(self.problem))), 3)
+
+    def test_missing_pages_are_queued_instead_of_rendered_inline(self):
+        self.upload(1)
+        [page] = services.render_prompt_pages(self.problem)
+        page.image.storage.delete(page.image.name)
+        url = reverse('problem_prompt_preview', kwargs={'problem_id': self.problem.id})
+        self.client.force_login(self.professor)
+        with mock.patch.object(services, 'render_prompt_pages') as render:
+            with self.assertRaises(services.PromptNotRendered):
+                list(services.iter_prompt_page_images(self.problem))
+            self.assertEqual(self.client.get(url).status_code, 404)
+        render.assert_not_called()
+        self.problem.refresh_from_db()
+        self.assertEqual(self.problem.prompt_sha256, '')
+
+        call_command('render_prompts', stdout=io.StringIO(), stderr=io.StringIO())
+        self.problem.refresh_from_db()
+        self.assertTrue(self.problem.prompt_sha256)
+        self.assertEqual(len(list(services.iter_prompt_page_images(self.problem))), 1)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+def image_bytes(width: int, height: int, noise: bool = False, image_format: str = 'PNG') -> bytes:
+    if noise:
+        rnd = random.Random(width * height)
+        image = Image.frombytes('RGB', (width, height), bytes(rnd.randrange(256) for _ in range(width * height * 3)))
+    else:
+        # A mostly white page with a few strokes, like a scanned document.
+        image = Image.new('RGB', (width, height), (255, 255, 255))
+        for y in range(10, height, 40):
+            image.paste((0, 0, 0), (10, y, width - 10, y + 2))
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class ImagingTests(TestCase):
+    @override_settings(GRADING_IMAGE_MAX_PIXELS=100_000)
+    def test_pages_over_the_pixel_budget_are_downscaled(self):
+        image = imaging.prepare_image(image_bytes(800, 400), 'image/png')
+        self.assertLessEqual(image.width * image.height, 100_000)
+        self.assertEqual((image.width, image.height), (447, 223))
+        with Image.open(io.BytesIO(image.data)) as encoded:
+            self.assertEqual(encoded.size, (image.width, image.height))
+        small = imaging.prepare_image(image_bytes(200, 100), 'image/png')
+        self.assertEqual((small.width, small.height), (200, 100))
+
+    @override_settings(GRADING_IMAGE_FORMATS=['jpeg', 'png'])
+    def test_the_smallest_configured_format_wins(self):
+        self.assertEqual(imaging.prepare_image(image_bytes(300, 300), 'image/png').mime, 'image/png')
+        self.assertEqual(imaging.prepare_image(image_bytes(300, 300, noise=True), 'image/png').mime, 'image/jpeg')
+        with override_settings(GRADING_IMAGE_FORMATS=['webp']):
+            self.assertEqual(imaging.prepare_image(image_bytes(300, 300), 'image/png').mime, 'image/webp')
+
+    @override_settings(GRADING_IMAGE_FORMATS=['jpeg'], GRADING_IMAGE_QUALITY=95)
+    def test_photos_use_the_photo_quality(self):
+        photo = image_bytes(200, 200, noise=True)
+        with override_settings(GRADING_IMAGE_PHOTO_QUALITY=20):
+            low = imaging.prepare_image(photo, 'image/png')
+        with override_settings(GRADING_IMAGE_PHOTO_QUALITY=90):
+            high = imaging.prepare_image(photo, 'image/png')
+        self.assertLess(len(low.data), len(high.data))
+
+    def test_detail_and_token_estimates(self):
+        small = imaging.prepare_image(image_bytes(300, 400), 'image/png')
+        large = imaging.prepare_image(image_bytes(1024, 1024, image_format='JPEG'), 'image/jpeg')
+        self.assertEqual((small.detail, small.estimated_tokens), ('low', 85))
+        # 1024x1024 scales to 768x768: four 512px tiles.
+        self.assertEqual((large.detail, large.estimated_tokens), ('high', 4 * 170 + 85))
+        with override_settings(GRADING_IMAGE_DETAIL='high'):
+            self.assertEqual(imaging.prepare_image(image_bytes(300, 400), 'image/png').detail, 'high')
+        # 4096x1024 fits in 2048x512, already short enough: four tiles in a row.
+        self.assertEqual(imaging.estimate_image_tokens(4096, 1024, 'high'), 4 * 170 + 85)
+
+    def test_payload_stats_and_limit(self):
+        pages = [(image_bytes(300, 400), 'image/png'), (image_bytes(200, 200, noise=True), 'image/png')]
+        payload = imaging.PayloadBuilder()
+        payload.add_text('Rubric:')
+        payload.add_images(iter(pages))
+        prepared = [imaging.prepare_image(*page) for page in pages]
+        self.assertEqual(payload.stats['image_count'], 2)
+        self.assertEqual(payload.stats['source_bytes'], sum(len(data) for data, _ in pages))
+        self.assertEqual(payload.stats['payload_bytes'], sum(len(image.data) for image in prepared))
+        self.assertEqual(payload.stats['estimated_image_tokens'], sum(image.estimated_tokens for image in prepared))
+        self.assertEqual([item['type'] for item in payload.content], ['input_text', 'input_image', 'input_image'])
+        self.assertTrue(payload.content[1]['image_url'].startswith(f'data:{prepared[0].mime};base64,'))
+
+        with self.assertRaisesMessage(imaging.PayloadTooLarge, 'after 1 page(s)'):
+            imaging.PayloadBuilder(max_bytes=len(payload.content[1]['image_url']) + 10).add_images(iter(pages))
+
+
+def openai_error(status_code: int):
+    import httpx
+    import openai
+
+    response = httpx.Response(status_code, request=httpx.Request('POST', 'https://api.openai.test/v1/responses'))
+    return openai.APIStatusError(f'Error code: {status_code}', response=response, body=None)
+
+
+class FakeOpenAIClient:
+    """Stands in for the OpenAI client: raises or returns the queued outcomes in order."""
+
+    def __init__(self, *outcomes, usage=None):
+        self.outcomes = list(outcomes)
+        self.usage = usage
+        self.requests = []
+        self.calls = 0
+        self.responses = self
+
+    def with_options(self, **kwargs):
+        return self
+
+    def parse(self, text_format=None, **request):
+        self.calls += 1
+        self.requests.append(request)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        parsed = text_format.model_validate(outcome)
+        return mock.Mock(output_parsed=parsed, output_text=parsed.model_dump_json(), usage=self.usage)
+
+
+@override_settings(
+    GRADER_CIRCUIT_THRESHOLD=2,
+    GRADER_CIRCUIT_WINDOW_SECONDS=60,
+    GRADER_CIRCUIT_RESET_SECONDS=30,
+    GRADER_GRADE_MAX_RETRIES=0,
+)
+class CircuitBreakerTests(TestCase):
+    GRADE = {'total_score': 4, 'rubric_scores': [{'label': 'Setup', 'score': 4, 'status': 'correct'}], 'feedback': 'ok'}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.breaker = resilience.CircuitBreaker('test', threshold=2, window=60, reset_seconds=30)
+
+    def trip(self, breaker):
+        breaker.record_failure()
+        breaker.record_failure()
+
+    def test_states(self):
+        self.assertEqual(self.breaker.retry_after(), 0)  # closed
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.retry_after(), 0)  # one failure stays below the threshold
+
+        self.trip(self.breaker)
+        self.assertGreater(self.breaker.retry_after(), 25)  # open
+
+        with mock.patch('core.resilience.time.time', return_value=time.time() + 31):
+            # Half-open: a pre-check does not take the probe slot, then exactly one caller probes.
+            self.assertEqual(self.breaker.retry_after(take_probe=False), 0)
+            self.assertEqual(self.breaker.retry_after(), 0)
+            self.assertEqual(self.breaker.retry_after(), 30)
+            self.assertEqual(self.breaker.retry_after(take_probe=False), 30)
+            self.breaker.record_success()
+            self.assertEqual(self.breaker.retry_after(), 0)  # recovered
+            self.assertEqual(self.breaker.retry_after(), 0)
+
+    def test_failed_probe_reopens(self):
+        self.trip(self.breaker)
+        with mock.patch('core.resilience.time.time', return_value=time.time() + 31):
+            self.assertEqual(self.breaker.retry_after(), 0)
+            self.trip(self.breaker)
+            self.assertGreater(self.breaker.retry_after(), 25)
+
+    def grade(self, client):
+        grader = graders.OpenAIGrader()
+        plan = services.GradingPlan(submission=mock.Mock(), rubric=mock.Mock(), model='test-model')
+        with mock.patch.object(graders, 'openai_client', return_value=client), \
+                mock.patch.object(graders, 'get_grader', return_value=grader), \
+                mock.patch.object(services, 'plan_autograde', return_value=plan), \
+                mock.patch.object(services, 'grade_outcome', side_effect=lambda plan, result, *args, **kwargs: result), \
+                mock.patch.object(services.GradingPlan, 'request', return_value={'model': 'test-model', 'input': []}), \
+                mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'test'}):
+            return services.compute_autograde(plan.submission, plan.rubric, use_cache=False), grader
+
+    def test_half_open_probe_goes_through_compute_autograde(self):
+        client = FakeOpenAIClient(openai_error(503), openai_error(503), self.GRADE)
+        for _ in range(2):
+            with self.assertRaises(graders.GraderUnavailable):
+                self.grade(client)
+        with self.assertRaisesMessage(graders.GraderUnavailable, 'circuit open'):
+            self.grade(client)
+        self.assertEqual(client.calls, 2)
+
+        with mock.patch('core.resilience.time.time', return_value=time.time() + 31):
+            result, grader = self.grade(client)
+            self.assertEqual(result.total_score, 4)
+            self.assertEqual(client.calls, 3)
+            self.assertEqual(grader.breaker.retry_after(), 0)
+
+    def test_rejected_credentials_defer_instead_of_grading_zero(self):
+        client = FakeOpenAIClient(openai_error(401))
+        with self.assertRaisesMessage(graders.GraderUnavailable, 'rejected the request') as raised:
+            self.grade(client)
+        self.assertEqual(raised.exception.retry_after, 30)
+
+    def test_other_errors_propagate_to_the_job(self):
+        client = FakeOpenAIClient(openai_error(400))
+        with self.assertRaises(Exception) as raised:
+            self.grade(client)
+        self.assertNotIsInstance(raised.exception, graders.GraderUnavailable)
+
+
+class GradingQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        cls.course = models.Class.objects.create(title='Probability', professor=cls.professor)
+        cls.problem_set = models.ProblemSet.objects.create(course=cls.course, title='PS 1')
+        cls.problem = models.Problem.objects.create(problem_set=cls.problem_set, title='P1')
+        cls.rubric = models.Rubric.objects.create(problem=cls.problem)
+        cls.students = [User.objects.create_user(f's{idx}', f's{idx}@example.edu', 'pw') for idx in range(3)]
+        cls.submissions = []
+        for student in cls.students:
+            models.Enrollment.objects.create(course=cls.course, user=student)
+            cls.submissions.append(
+                models.Submission.objects.create(
+                    problem=cls.problem,
+                    student=student,
+                    status=models.Submission.STATUS_SUBMITTED,
+                    submitted_at=timezone.now(),
+                )
+            )
+
+    def test_bulk_run_queues_around_jobs_already_active(self):
+        finalize_job = services.enqueue_grading(self.submissions[0], self.rubric)
+        out = io.StringIO()
+        with mock.patch.object(services, 'run_grading_jobs', return_value=(3, 0)) as run:
+            call_command('grade_problem_set', self.problem_set.id, stdout=out)
+        run.assert_called_once()
+        self.assertIn('Resuming 1 outstanding job(s)', out.getvalue())
+        self.assertIn('Queued 2 submission(s)', out.getvalue())
+        jobs = services.active_grading_jobs()
+        self.assertEqual(jobs.count(), 3)
+        self.assertEqual(jobs.filter(reason=models.GradingJob.REASON_BULK).count(), 2)
+        self.assertTrue(jobs.filter(id=finalize_job.id).exists())
+
+        # A re-run with every submission already queued resumes them instead of doubling the work.
+        out = io.StringIO()
+        with mock.patch.object(services, 'run_grading_jobs', return_value=(0, 0)):
+            call_command('grade_problem_set', self.problem_set.id, stdout=out)
+        self.assertIn('Resuming 3 outstanding job(s)', out.getvalue())
+        self.assertIn('Queued 0 submission(s)', out.getvalue())
+        self.assertEqual(services.active_grading_jobs().count(), 3)
+
+    def test_stand_in_results_are_labeled_and_cached_apart(self):
+        submission = self.submissions[0]
+        real = services.plan_autograde(submission, self.rubric, backend='openai')
+        fake = services.plan_autograde(submission, self.rubric, backend='fake')
+        self.assertEqual(real.source, settings.OPENAI_MODEL)
+        self.assertEqual(fake.source, f'fake:{settings.OPENAI_MODEL}')
+        self.assertEqual(real.cache_key, services.grading_cache_key(submission, self.rubric, settings.OPENAI_MODEL))
+        self.assertNotEqual(real.cache_key, fake.cache_key)
+
+        result = services.GradeResult(total_score=10, rubric_scores=[], feedback='Stand-in.')
+        services.store_grade_result(fake, result, result.model_dump_json())
+        self.assertEqual(models.GradeResultCacheEntry.objects.get(key=fake.cache_key).model, fake.source)
+        cached = services.plan_autograde(submission, self.rubric, backend='fake').outcome
+        self.assertTrue(cached.cache_hit)
+        self.assertEqual(cached.model, fake.source)
+        # The real model does not pick up the stand-in's answer.
+        outcome = services.plan_autograde(submission, self.rubric, backend='openai').outcome
+        self.assertFalse(outcome.cache_hit)
+        self.assertEqual(outcome.model, settings.OPENAI_MODEL)
+
+    def enqueue_all(self):
+        return [services.enqueue_grading(submission, self.rubric) for submission in self.submissions]
+
+    def expire_leases(self, **filters):
+        models.GradingJob.objects.filter(**filters).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claims_lease_jobs_once_and_reclaim_expired_leases(self):
+        self.enqueue_all()
+        first = services.claim_grading_jobs('worker-a', limit=2)
+        second = services.claim_grading_jobs('worker-b', limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(services.claim_grading_jobs('worker-c', limit=2), [])
+        self.assertEqual({job.attempts for job in first + second}, {1})
+
+        # worker-a stalls: its leases expire and another worker takes the jobs over.
+        self.expire_leases(leased_by='worker-a')
+        taken = services.claim_grading_jobs('worker-c', limit=5)
+        self.assertEqual({job.id for job in taken}, {job.id for job in first})
+        self.assertEqual({job.attempts for job in taken}, {2})
+        # The stalled worker can no longer complete (or fail) jobs it lost.
+        services.complete_grading_jobs(first)
+        self.assertFalse(models.GradingJob.objects.filter(status=models.GradingJob.STATUS_DONE).exists())
+        services.complete_grading_jobs(taken)
+        self.assertEqual(models.GradingJob.objects.filter(status=models.GradingJob.STATUS_DONE).count(), 2)
+
+    @override_settings(GRADING_JOB_MAX_ATTEMPTS=2)
+    def test_expired_lease_on_the_last_attempt_fails_the_job(self):
+        [job, *_] = self.enqueue_all()
+        models.GradingJob.objects.exclude(id=job.id).delete()
+        for attempt in (1, 2):
+            self.assertEqual([claimed.attempts for claimed in services.claim_grading_jobs('worker')], [attempt])
+            self.expire_leases(id=job.id)
+        self.assertEqual(services.claim_grading_jobs('worker'), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.GradingJob.STATUS_FAILED)
+        self.assertIn('Lease expired', job.last_error)
+
+    def test_deferred_jobs_do_not_use_up_attempts(self):
+        [job, *_] = self.enqueue_all()
+        [claimed] = [claimed for claimed in services.claim_grading_jobs('worker', limit=3) if claimed.id == job.id]
+        services.defer_grading_job(claimed, graders.GraderUnavailable('down', retry_after=30))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (models.GradingJob.STATUS_QUEUED, 0))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=25))
+
+    def test_leases_are_renewed_while_jobs_run(self):
+        self.enqueue_all()
+
+        def slow_job(job):
+            time.sleep(0.4)
+            return None
+
+        with mock.patch.object(services, '_compute_job', side_effect=slow_job), \
+                mock.patch.object(services, 'renew_grading_leases', wraps=services.renew_grading_leases) as renew:
+            done, failed = services.run_grading_jobs('worker', concurrency=3, lease_seconds=0.3)
+        self.assertEqual((done, failed), (3, 0))
+        self.assertTrue(renew.called)
+        self.assertEqual({job.leased_by for job in renew.call_args.args[0]}, {'worker'})
+
+        job = models.GradingJob.objects.create(submission=self.submissions[0], rubric=self.rubric)
+        [claimed] = services.claim_grading_jobs('worker', lease_seconds=1)
+        services.renew_grading_leases([claimed], lease_seconds=3600)
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(minutes=59))
+        claimed.leased_by = 'someone-else'
+        services.renew_grading_leases([claimed], lease_seconds=7200)
+        job.refresh_from_db()
+        self.assertLess(job.lease_expires_at, timezone.now() + timedelta(minutes=61))
+
+    def autograde(self, submission, score):
+        outcome = services.AutoGradeOutcome(
+            submission=submission, rubric=self.rubric, model='test', raw_output_json={}, score=score, feedback='Auto.'
+        )
+        services.persist_autograde_outcomes([outcome])
+        submission.refresh_from_db()
+        return submission
+
+    def test_best_grade_is_authoritative(self):
+        submission = self.autograde(self.submissions[0], 7)
+        # A lower regrade does not lower the score the student sees.
+        submission = self.autograde(submission, 4)
+        self.assertEqual(float(submission.final_score), 7)
+        self.assertEqual(submission.latest_autograde.score, 4)
+
+        services.save_grade(
+            models.Grade(submission=submission, score=9, grader_type=models.Grade.GRADER_PROFESSOR, grader=self.professor)
+        )
+        submission.refresh_from_db()
+        self.assertEqual(float(submission.final_score), 9)
+        self.assertEqual(submission.best_grade.grader_type, models.Grade.GRADER_PROFESSOR)
+        # Ties go to the latest grade.
+        submission = self.autograde(submission, 9)
+        self.assertEqual(submission.best_grade.grader_type, models.Grade.GRADER_AUTO)
+
+        self.client.force_login(self.students[0])
+        response = self.client.get(reverse('student_problem_detail', kwargs={'problem_id': self.problem.id}))
+        self.assertEqual(response.context['grade'].id, submission.best_grade_id)
+        self.assertContains(response, 'Score: 9.00')
+
+    def test_identical_inputs_reuse_the_cached_result(self):
+        submission = self.submissions[0]
+        plan = services.plan_autograde(submission, self.rubric, backend='openai')
+        self.assertFalse(plan.outcome.cache_hit)
+        result = services.GradeResult(total_score=6, rubric_scores=[], feedback='Cached feedback.')
+        services.store_grade_result(plan, result, result.model_dump_json())
+
+        cached = services.plan_autograde(submission, self.rubric, backend='openai').outcome
+        self.assertTrue(cached.cache_hit)
+        self.assertEqual(cached.cache_key, plan.cache_key)
+        self.assertEqual(cached.raw_output_json['raw_text'], result.model_dump_json())
+        self.assertFalse(services.plan_autograde(submission, self.rubric, use_cache=False, backend='openai').outcome.cache_hit)
+        with override_settings(GRADING_RESULT_CACHE=False):
+            self.assertFalse(services.plan_autograde(submission, self.rubric, backend='openai').outcome.cache_hit)
+
+        # Any change to the grading inputs (here the rubric) is a different key.
+        models.RubricItem.objects.create(rubric=self.rubric, label='Setup', points=4)
+        changed = services.plan_autograde(submission, self.rubric, backend='openai')
+        self.assertNotEqual(changed.cache_key, plan.cache_key)
+        self.assertFalse(changed.outcome.cache_hit)
+
+    def finish(self, job):
+        models.GradingJob.objects.filter(id=job.id).update(status=models.GradingJob.STATUS_DONE)
+
+    def test_finalize_and_enqueue_are_deduplicated(self):
+        draft = self.submissions[0]
+        models.Submission.objects.filter(id=draft.id).update(status=models.Submission.STATUS_DRAFT, submitted_at=None)
+        draft.refresh_from_db()
+        self.assertTrue(services.finalize_submission(draft))
+        self.assertFalse(services.finalize_submission(models.Submission.objects.get(id=draft.id)))
+        job = services.active_grading_jobs().get(submission=draft)
+        self.assertEqual(services.enqueue_grading(draft, self.rubric).id, job.id)
+        # A regrade requested while grading is in flight joins it.
+        self.assertEqual(services.request_regrade(draft, self.rubric).id, job.id)
+        self.assertEqual(draft.grading_jobs.count(), 1)
+
+    @override_settings(REGRADE_COOLDOWN_SECONDS=600, REGRADE_QUOTA=0)
+    def test_regrade_cooldown(self):
+        submission = self.submissions[0]
+        self.finish(services.request_regrade(submission, self.rubric))
+        with self.assertRaisesMessage(services.RegradeNotAllowed, 'another regrade in 10 minute(s)'):
+            services.request_regrade(submission, self.rubric)
+        later = timezone.now() + timedelta(minutes=11)
+        self.assertEqual(services.regrade_block_reason(submission, now=later), '')
+
+    @override_settings(REGRADE_COOLDOWN_SECONDS=0, REGRADE_QUOTA=2, REGRADE_QUOTA_WINDOW_HOURS=24)
+    def test_regrade_quota_is_per_student(self):
+        problem = models.Problem.objects.create(problem_set=self.problem_set, title='P2', prompt_pdf='p.pdf')
+        submissions = [self.submissions[0]] + [
+            models.Submission.objects.create(problem=problem, student=self.students[0], status=models.Submission.STATUS_SUBMITTED)
+        ]
+        for submission in submissions:
+            self.finish(services.request_regrade(submission, self.rubric))
+        with self.assertRaisesMessage(services.RegradeNotAllowed, 'used all 2 regrades'):
+            services.request_regrade(submissions[0], self.rubric)
+        # Other students have their own quota, and old regrades fall out of the window.
+        self.assertIsNotNone(services.request_regrade(self.submissions[1], self.rubric))
+        later = timezone.now() + timedelta(hours=25)
+        self.assertEqual(services.regrade_block_reason(submissions[0], now=later), '')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='dydx-test-media-'))
+class PromptedProblemTestCase(TestCase):
+    """A problem with a rendered prompt page, a two-item rubric and three image submissions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        course = models.Class.objects.create(title='Topology', professor=professor)
+        cls.problem_set = models.ProblemSet.objects.create(course=course, title='PS 1')
+        cls.problem = models.Problem.objects.create(
+            problem_set=cls.problem_set, title='P1', prompt_pdf='p.pdf', prompt_sha256='cd' * 32
+        )
+        prompt_page = models.ProblemPromptPage(problem=cls.problem, page_number=1, width=60, height=80)
+        prompt_page.image.save('prompt-1.png', ContentFile(png_bytes(60, 80)), save=False)
+        prompt_page.save()
+        cls.rubric = models.Rubric.objects.create(problem=cls.problem)
+        models.RubricItem.objects.create(rubric=cls.rubric, label='Setup', points=4, order=1)
+        models.RubricItem.objects.create(rubric=cls.rubric, label='Answer', points=6, order=2)
+        cls.submissions = []
+        for idx in range(3):
+            student = User.objects.create_user(f's{idx}', f's{idx}@example.edu', 'pw')
+            submission = models.Submission.objects.create(
+                problem=cls.problem, student=student, status=models.Submission.STATUS_SUBMITTED, submitted_at=timezone.now()
+            )
+            buffer = io.BytesIO()
+            Image.new('RGB', (40, 40), (255, 255 - idx, 255)).save(buffer, format='PNG')
+            page = models.SubmissionFile(submission=submission, mime_type='image/png')
+            page.file.save(f'work-{idx}.png', ContentFile(buffer.getvalue()))
+            cls.submissions.append(submission)
+
+
+class GradingRequestTests(PromptedProblemTestCase):
+    GRADE = {
+        'total_score': 10,
+        'rubric_scores': [
+            {'label': 'Setup', 'score': 4, 'status': 'correct'},
+            {'label': 'Answer', 'score': 6, 'status': 'correct'},
+        ],
+        'feedback': 'ok',
+    }
+
+    def setUp(self):
+        with services._prompt_prefix_lock:
+            services._prompt_prefix_cache.clear()
+
+    def test_shared_prefix_is_identical_across_students(self):
+        usage = SimpleNamespace(input_tokens=1400, output_tokens=60, input_tokens_details=SimpleNamespace(cached_tokens=1024))
+        client = FakeOpenAIClient(self.GRADE, self.GRADE, usage=usage)
+        grader = graders.OpenAIGrader()
+        with mock.patch.object(graders, 'openai_client', return_value=client), \
+                mock.patch.object(graders, 'get_grader', return_value=grader), \
+                mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'test'}):
+            outcomes = [
+                services.compute_autograde(submission, self.rubric, use_cache=False)
+                for submission in self.submissions[:2]
+            ]
+        services.persist_autograde_outcomes(outcomes)
+
+        self.assertEqual(len(client.requests), 2)
+        prefixes = []
+        for request in client.requests:
+            self.assertEqual(request['prompt_cache_key'], f'grade-problem-{self.problem.id}-rubric-{self.rubric.id}')
+            developer, user = request['input']
+            self.assertEqual(developer, {'role': 'developer', 'content': services.GRADING_INSTRUCTIONS})
+            content = user['content']
+            split = content.index({'type': 'input_text', 'text': 'Student solution:'})
+            # Instructions, rubric and problem pages come first; the student's pages last.
+            self.assertEqual(
+                [item['type'] for item in content],
+                ['input_text', 'input_text', 'input_image', 'input_text', 'input_image'],
+            )
+            self.assertEqual(content[0]['text'], 'Rubric:\n- Setup: 4 pts\n- Answer: 6 pts')
+            prefixes.append(json.dumps([request['model'], developer, content[:split + 1]]).encode())
+        self.assertEqual(prefixes[0], prefixes[1])
+
+        for submission in self.submissions[:2]:
+            run = submission.autograde_runs.get()
+            self.assertEqual((run.input_tokens, run.cached_input_tokens, run.output_tokens), (1400, 1024, 60))
+
+
+@override_settings(GRADING_BATCH_ROOT=tempfile.mkdtemp(prefix='dydx-test-batches-'))
+class BatchGradingTests(PromptedProblemTestCase):
+    def setUp(self):
+        self.backend = batch.LocalBatchBackend(root=tempfile.mkdtemp(prefix='dydx-test-local-batches-'))
+
+    def submit(self):
+        services.enqueue_problem_set_grading(self.problem_set)
+        return batch.submit_grading_batch(self.backend)
+
+    def test_bulk_jobs_are_submitted_polled_and_applied(self):
+        finalize_job = services.enqueue_grading(self.submissions[0], self.rubric)
+        submitted = self.submit()
+        self.assertEqual((submitted.status, submitted.request_count), (models.GradingBatch.STATUS_SUBMITTED, 2))
+        # The student's own grading stays with the regular workers.
+        finalize_job.refresh_from_db()
+        self.assertEqual((finalize_job.status, finalize_job.batch_id), (models.GradingJob.STATUS_QUEUED, None))
+        self.assertEqual(batch.submit_grading_batch(self.backend), None)
+
+        finished, pending = batch.poll_grading_batches(self.backend)
+        self.assertEqual(([item.id for item in finished], pending), ([submitted.id], []))
+        submitted.refresh_from_db()
+        self.assertEqual(
+            (submitted.status, submitted.graded_count, submitted.failed_count), (models.GradingBatch.STATUS_COMPLETED, 2, 0)
+        )
+        for submission in self.submissions[1:]:
+            submission.refresh_from_db()
+            # The stand-in awards full points per rubric item, under its own label.
+            self.assertEqual(float(submission.final_score), 10)
+            self.assertEqual(submission.latest_autograde.model, f'local:{settings.OPENAI_MODEL}')
+        self.assertEqual(submitted.jobs.filter(status=models.GradingJob.STATUS_DONE).count(), 2)
+        self.assertFalse(self.submissions[0].grades.exists())
+
+    def test_unusable_and_missing_lines_are_retried_without_a_grade(self):
+        submitted = self.submit()
+        jobs = list(submitted.jobs.order_by('id'))
+        self.assertEqual(len(jobs), 3)
+        bad_line = {
+            'custom_id': f'job-{jobs[0].id}',
+            'response': {'status_code': 200, 'body': {'output_text': '{"total_score": "lots"}'}},
+            'error': None,
+        }
+        good_line = {
+            'custom_id': f'job-{jobs[1].id}',
+            'response': {'status_code': 200, 'body': batch.canned_response(services.GradingPlan(
+                submission=jobs[1].submission, rubric=self.rubric, model=settings.OPENAI_MODEL,
+                payload=services.build_grading_payload(jobs[1].submission, self.rubric),
+            ).request())},
+            'error': None,
+        }
+        # jobs[2] is missing from the output.
+        batch.apply_batch_results(submitted, batch.BatchState('completed', [json.dumps(bad_line), json.dumps(good_line)]))
+        submitted.refresh_from_db()
+        self.assertEqual((submitted.graded_count, submitted.failed_count), (1, 2))
+        for job, error in ((jobs[0], 'Unusable batch response'), (jobs[2], 'Missing from batch output')):
+            job.refresh_from_db()
+            self.assertEqual(job.status, models.GradingJob.STATUS_QUEUED)
+            self.assertIn(error, job.last_error)
+            self.assertFalse(job.submission.grades.exists())
+            self.assertFalse(job.submission.autograde_runs.exists())
+            self.assertIsNone(models.Submission.objects.get(id=job.submission_id).final_score)
+        self.assertEqual(float(models.Submission.objects.get(id=jobs[1].submission_id).final_score), 10)
+
+    def test_pdf_pages_are_rendered_before_requests_are_built(self):
+        directory = tempfile.mkdtemp(prefix='dydx-test-render-')
+        with open(write_pdf(directory, 'work.pdf', 2), 'rb') as pdf:
+            page = models.SubmissionFile(submission=self.submissions[0], mime_type='application/pdf', page_number=2)
+            page.file.save('work.pdf', ContentFile(pdf.read()))
+        page_cache = PageImageCache(storage=FileSystemStorage(location=directory))
+        pool = rendering.RenderPool(workers=0, timeout=30, max_rss_bytes=0)
+        with mock.patch.object(services, 'page_cache', page_cache), \
+                mock.patch.object(rendering, 'get_render_pool', return_value=pool), \
+                mock.patch.object(pool, 'render_many', wraps=pool.render_many) as render_many:
+            self.submit()
+        render_many.assert_called_once_with([page.file.path], services.PDF_RENDER_SCALE, settings.GRADING_RENDER_MAX_PIXELS)
+        entries = page_cache.document_entries(services.file_digest(page.file.path), services.PDF_RENDER_SCALE, 'png')
+        self.assertEqual(set(entries), {0, 1})
+        # Building the request then read both pages from the cache.
+        self.assertEqual(page_cache.stats()['hits'], 2)
+
+    def test_cache_hits_are_graded_without_being_sent(self):
+        cached = self.submissions[0]
+        plan = services.plan_autograde(cached, self.rubric, backend=self.backend.name)
+        result = services.GradeResult(total_score=7, rubric_scores=[], feedback='From cache.')
+        services.store_grade_result(plan, result, result.model_dump_json())
+
+        submitted = self.submit()
+        self.assertEqual((submitted.request_count, submitted.graded_count), (2, 1))
+        job = submitted.jobs.get(submission=cached)
+        self.assertNotIn(str(job.id), submitted.manifest)
+        self.assertEqual(job.status, models.GradingJob.STATUS_DONE)
+        cached.refresh_from_db()
+        self.assertTrue(cached.latest_autograde.cache_hit)
+        input_lines = (self.backend.root / str(submitted.id) / 'input.jsonl').read_text().splitlines()
+        self.assertEqual(len(input_lines), 2)
+        self.assertNotIn(f'job-{job.id}', ''.join(input_lines))
+
+
+class ProblemSetStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        cls.course = models.Class.objects.create(title='Number Theory', professor=cls.professor)
+        cls.problem_set = models.ProblemSet.objects.create(course=cls.course, title='PS 1')
+        cls.problems = [
+            models.Problem.objects.create(problem_set=cls.problem_set, title=f'P{idx}', prompt_pdf='p.pdf') for idx in range(2)
+        ]
+        cls.students = [User.objects.create_user(f's{idx}', f's{idx}@example.edu', 'pw') for idx in range(4)]
+        for student in cls.students:
+            models.Enrollment.objects.create(course=cls.course, user=student)
+
+    def figures(self):
+        row = models.ProblemSetStats.objects.get(problem_set=self.problem_set)
+        stats.refresh_medians([row])
+        return {
+            'problem_count': row.problem_count,
+            'enrollment_count': row.enrollment_count,
+            'submission_count': row.submission_count,
+            'graded_count': row.graded_count,
+            'completion_percent': row.completion_percent,
+            'mean_score': round(row.mean_score, 6) if row.mean_score is not None else None,
+            'median_score': row.median_score,
+            'stddev_score': round(row.stddev_score, 6) if row.stddev_score is not None else None,
+            'open_appeals': row.open_appeals,
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.figures()
+        stats.refresh_problem_set_stats([self.problem_set.id])
+        self.assertEqual(incremental, self.figures())
+        return incremental
+
+    def submit(self, student, problem, score=None):
+        submission = models.Submission.objects.create(problem=problem, student=student)
+        submission.status = models.Submission.STATUS_SUBMITTED
+        submission.submitted_at = timezone.now()
+        submission.save(update_fields=['status', 'submitted_at'])
+        if score is not None:
+            services.save_grade(models.Grade(submission=submission, score=score, grader=self.professor))
+        return submission
+
+    def test_incremental_figures_match_a_rebuild(self):
+        self.assertEqual(self.assert_matches_rebuild()['enrollment_count'], 4)
+        submissions = [self.submit(student, self.problems[0], score) for student, score in zip(self.students, (4, 6, 9))]
+        self.submit(self.students[3], self.problems[1])
+        models.Submission.objects.create(problem=self.problems[1], student=self.students[0])  # a draft counts for nothing
+        figures = self.assert_matches_rebuild()
+        self.assertEqual(figures['submission_count'], 4)
+        self.assertEqual(figures['graded_count'], 3)
+        self.assertEqual(figures['mean_score'], round(19 / 3, 6))
+        self.assertEqual(figures['median_score'], 6)
+
+        appeal = models.Appeal.objects.create(submission=submissions[0], student=self.students[0], reason='Recount.')
+        self.assertEqual(self.assert_matches_rebuild()['open_appeals'], 1)
+        appeal.status = models.Appeal.STATUS_CLOSED
+        appeal.save()
+        self.assertEqual(self.assert_matches_rebuild()['open_appeals'], 0)
+
+        services.save_grade(models.Grade(submission=submissions[0], score=8, grader=self.professor))
+        submissions[1].delete()
+        models.Problem.objects.create(problem_set=self.problem_set, title='P2', prompt_pdf='p.pdf')
+        models.Enrollment.objects.filter(user=self.students[3]).delete()
+        figures = self.assert_matches_rebuild()
+        self.assertEqual((figures['problem_count'], figures['enrollment_count'], figures['submission_count']), (3, 3, 3))
+
+    def test_score_change_is_a_constant_number_of_queries(self):
+        for student in self.students:
+            self.submit(student, self.problems[0], 5)
+        submission = models.Submission.objects.filter(problem=self.problems[0]).first()
+        submission.final_score = 7
+        # The previous figures, the submission itself and one delta UPDATE on the stats row.
+        with self.assertNumQueries(3):
+            submission.save(update_fields=['final_score'])
+        row = models.ProblemSetStats.objects.get(problem_set=self.problem_set)
+        self.assertTrue(row.median_stale)
+        self.assertEqual(row.mean_score, 5.5)
+        stats.stats_for([models.ProblemSet.objects.select_related('stats').get(id=self.problem_set.id)], median=True)
+        row.refresh_from_db()
+        self.assertEqual((row.median_score, row.median_stale), (5, False))
+
+    def test_deleting_problems_applies_one_delta_per_problem_set(self):
+        small, large = self.problems
+        submissions = [self.submit(self.students[0], small, 3)]
+        submissions += [self.submit(student, large, score) for student, score in zip(self.students, (4, 6, 9, None))]
+        for submission in submissions[::2]:
+            models.Appeal.objects.create(submission=submission, student=submission.student, reason='Recount.')
+
+        def delete_queries(problem):
+            with CaptureQueriesContext(connection) as queries:
+                problem.delete()
+            return len(queries)
+
+        # The cascade's submissions and appeals cost the same queries whatever their number.
+        self.assertEqual(delete_queries(large), delete_queries(small))
+        figures = self.assert_matches_rebuild()
+        self.assertEqual((figures['problem_count'], figures['submission_count'], figures['open_appeals']), (0, 0, 0))
+
+        problems = [models.Problem.objects.create(problem_set=self.problem_set, title=f'Q{idx}') for idx in range(3)]
+        for problem, student in zip(problems, self.students):
+            self.submit(student, problem, 5)
+        models.Problem.objects.filter(id__in=[problem.id for problem in problems[:2]]).delete()
+        figures = self.assert_matches_rebuild()
+        self.assertEqual((figures['problem_count'], figures['submission_count']), (1, 1))
+
+
+def write_pdf(directory, name, pages):
+    path = os.path.join(directory, name)
+    images = [Image.new('RGB', (60, 80), (255, 255, 255)) for _ in range(pages)]
+    images[0].save(path, format='PDF', save_all=True, append_images=images[1:])
+    return path
+
+
+class RenderPoolTests(TestCase):
+    def test_timeout_kills_only_the_worker_running_that_task(self):
+        pool = rendering.RenderPool(workers=2, timeout=0.5, max_rss_bytes=0)
+        self.addCleanup(pool.shutdown)
+        slow_worker, other_worker = pool._checkout(), pool._checkout()
+        slow = pool._submit(slow_worker, 'slow task', time.sleep, 30)
+        other = pool._submit(other_worker, 'other task', time.sleep, 0.1)
+        self.assertIsNone(pool._result(other))
+        with self.assertRaisesMessage(rendering.RenderTimeout, 'slow task took longer than 0.5s'):
+            pool._result(slow)
+        self.assertFalse(slow_worker.process.is_alive())
+        self.assertTrue(other_worker.process.is_alive())
+        self.assertEqual((pool._started, pool._idle), (1, [other_worker]))
+
+    def test_read_ahead_is_held_to_its_limits_while_waiting(self):
+        pool = rendering.RenderPool(workers=2, timeout=30, max_rss_bytes=1000)
+        self.addCleanup(pool.shutdown)
+        head = pool._submit(pool._checkout(), 'head task', time.sleep, 0.6)
+        ahead = pool._submit(pool._checkout(), 'read-ahead task', time.sleep, 30)
+        with mock.patch.object(
+            rendering, '_process_rss', side_effect=lambda pid: 10 ** 9 if pid == ahead.worker.process.pid else 0
+        ):
+            self.assertIsNone(pool._result(head, [ahead]))
+        # The read-ahead worker was killed while the head task was still running.
+        self.assertFalse(ahead.worker.process.is_alive())
+        with self.assertRaisesMessage(rendering.RenderMemoryExceeded, 'read-ahead task exceeded 1000 bytes'):
+            pool._result(ahead)
+        self.assertEqual(pool._idle, [head.worker])
+
+    def test_task_errors_propagate_and_keep_the_worker(self):
+        pool = rendering.RenderPool(workers=1, timeout=30, max_rss_bytes=0)
+        self.addCleanup(pool.shutdown)
+        with self.assertRaises(FileNotFoundError):
+            pool.page_count(os.path.join(tempfile.gettempdir(), 'dydx-missing.pdf'))
+        self.assertEqual(len(pool._idle), 1)
+
+    def test_render_many_reports_failures_per_document(self):
+        directory = tempfile.mkdtemp(prefix='dydx-test-render-')
+        paths = [write_pdf(directory, 'a.pdf', 2), os.path.join(directory, 'missing.pdf'), write_pdf(directory, 'b.pdf', 1)]
+        for workers in (2, 0):
+            pool = rendering.RenderPool(workers=workers, timeout=30, max_rss_bytes=0)
+            self.addCleanup(pool.shutdown)
+            results = list(pool.render_many(paths, 1, 10 ** 6))
+            self.assertEqual([path for path, _ in results], paths)
+            self.assertEqual([len(results[0][1]), len(results[2][1])], [2, 1])
+            self.assertIsInstance(results[1][1], rendering.RenderError)
+            self.assertTrue(results[0][1][0].startswith(b'\x89PNG'))
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix='dydx-test-page-cache-')
+        self.cache = PageImageCache(storage=FileSystemStorage(location=root), max_bytes=12)
+
+    def test_lookups_and_eviction(self):
+        self.cache.put('abc', 0, 2, 2.0, 'png', b'page-0')
+        self.cache.put('abc', 1, 2, 2.0, 'png', b'page-1')
+        entries = self.cache.document_entries('abc', 2.0, 'png')
+        self.assertEqual(self.cache.read(entries[0]), b'page-0')
+        self.assertIsNone(self.cache.read(entries.get(2)))
+        # Bytes deleted behind the index's back are a miss, and the stale row goes.
+        self.cache._storage().delete(entries[1].storage_name)
+        self.assertIsNone(self.cache.read(entries[1]))
+        self.assertEqual(set(self.cache.document_entries('abc', 2.0, 'png')), {0})
+
+        self.cache.put('def', 0, 1, 2.0, 'png', b'another-page')
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(set(models.PageCacheEntry.objects.values_list('content_hash', flat=True)), {'def'})
+
+    def test_hits_and_misses_are_shared_across_processes(self):
+        self.cache.put('abc', 0, 1, 2.0, 'png', b'page-0')
+        entry = self.cache.document_entries('abc', 2.0, 'png')[0]
+        self.cache.read(entry)
+        self.cache.read(None)
+        self.cache.save_counts()
+        # Another process has its own in-memory counts but adds to the same totals.
+        other = PageImageCache(storage=self.cache.storage)
+        other.read(entry)
+        stats = other.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 0))
+        self.assertEqual((stats['total_hits'], stats['total_misses']), (2, 1))
+
+        out = io.StringIO()
+        with mock.patch('core.management.commands.page_cache.page_cache', self.cache):
+            call_command('page_cache', stdout=out)
+        self.assertIn('Page hits: 2, misses: 1 (hit rate 66.7%)', out.getvalue())
+        with mock.patch('core.management.commands.page_cache.page_cache', self.cache):
+            call_command('page_cache', '--reset-counts', stdout=io.StringIO())
+        self.assertEqual(self.cache.stats()['total_hits'], 0)
+
+    def test_stale_entry_is_rendered_again(self):
+        path = os.path.join(tempfile.mkdtemp(prefix='dydx-test-pdf-'), 'work.pdf')
+        with open(path, 'wb') as handle:
+            handle.write(b'%PDF-1.4 stand-in')
+        content_hash = services.file_digest(path)
+        for page_index in range(2):
+            self.cache.put(content_hash, page_index, 2, services.PDF_RENDER_SCALE, 'png', f'page-{page_index}'.encode())
+        entry = self.cache.document_entries(content_hash, services.PDF_RENDER_SCALE, 'png')[1]
+        self.cache._storage().delete(entry.storage_name)
+        closed = []
+
+        def render_pages(file_path, page_indexes, scale, max_pixels):
+            try:
+                for page_index in page_indexes:
+                    yield page_index, b'rendered'
+            finally:
+                closed.append(list(page_indexes))
+
+        pool = mock.Mock(render_pages=render_pages)
+        with mock.patch.object(services, 'page_cache', self.cache), \
+                mock.patch.object(rendering, 'get_render_pool', return_value=pool):
+            self.assertEqual(list(services._iter_pdf_pages(path)), [b'page-0', b'rendered'])
+        # Every page was cached, so only the one-page re-render started, and it was closed.
+        self.assertEqual(closed, [[1]])
+
+
+class GradingTelemetryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        other_professor = User.objects.create_user('other', 'other@example.edu', 'pw', is_staff=True)
+        student = User.objects.create_user('student', 'student@example.edu', 'pw')
+        submissions = {}
+        for professor, title in ((cls.professor, 'Integrals'), (cls.professor, 'Limits'), (other_professor, 'Other')):
+            course = models.Class.objects.get_or_create(title=f'{professor.username} course', professor=professor)[0]
+            problem_set = models.ProblemSet.objects.get_or_create(course=course, title='PS 1')[0]
+            problem = models.Problem.objects.create(problem_set=problem_set, title=title)
+            submissions[title] = models.Submission.objects.create(problem=problem, student=student)
+
+        def run(title, model, api_ms, cache_hit=False, age=timedelta(0)):
+            return models.AutoGradeRun(
+                submission=submissions[title],
+                model=model,
+                raw_output_json={},
+                score=0,
+                cache_hit=cache_hit,
+                api_ms=api_ms,
+                input_tokens=None if cache_hit else 1000,
+                created_at=timezone.now() - age,
+            )
+
+        models.AutoGradeRun.objects.bulk_create(
+            [run('Integrals', 'model-a', api_ms) for api_ms in range(1, 21)]
+            + [run('Limits', 'model-b', api_ms) for api_ms in (100, 200, 300)]
+            # Cache hits count as runs but never skew the stage percentiles.
+            + [run('Integrals', 'model-a', 9999, cache_hit=True), run('Limits', 'model-a', 9999, cache_hit=True)]
+            + [run('Limits', 'model-b', 5000, age=timedelta(days=40))]
+            + [run('Other', 'model-a', 7000)]
+        )
+
+    def metrics(self, group):
+        return {metric['name']: (metric['p50'], metric['p95']) for metric in group['metrics']}
+
+    def test_percentiles_per_problem_and_model(self):
+        runs = models.AutoGradeRun.objects.filter(submission__problem__problem_set__course__professor=self.professor)
+        telemetry = services.grading_telemetry(runs, days=30)
+
+        problems = {group['label']: group for group in telemetry['problems']}
+        self.assertEqual(list(problems), ['Integrals', 'Limits'])  # busiest first; other professors excluded
+        self.assertEqual((problems['Integrals']['runs'], problems['Integrals']['cache_hits']), (21, 1))
+        self.assertEqual(self.metrics(problems['Integrals'])['api_ms'], (10, 19))
+        # The 40-day-old run is outside the window.
+        self.assertEqual((problems['Limits']['runs'], problems['Limits']['cache_hits']), (4, 1))
+        self.assertEqual(self.metrics(problems['Limits'])['api_ms'], (200, 300))
+        self.assertEqual(self.metrics(problems['Limits'])['input_tokens'], (1000, 1000))
+        self.assertEqual(self.metrics(problems['Limits'])['render_ms'], (None, None))
+
+        models_ = {group['label']: group for group in telemetry['models']}
+        self.assertEqual((models_['model-a']['runs'], models_['model-a']['cache_hits']), (22, 2))
+        self.assertEqual(self.metrics(models_['model-a'])['api_ms'], (10, 19))
+        self.assertEqual((models_['model-b']['runs'], models_['model-b']['cache_hits']), (3, 0))
+        self.assertEqual(self.metrics(models_['model-b'])['api_ms'], (200, 300))
+
+    def test_view_scopes_runs_to_the_professor_and_window(self):
+        self.client.force_login(self.professor)
+        response = self.client.get(reverse('grading_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([group['label'] for group in response.context['problems']], ['Integrals', 'Limits'])
+        self.assertContains(response, 'model-b')
+
+        response = self.client.get(reverse('grading_stats'), {'days': 60})
+        [limits] = [group for group in response.context['problems'] if group['label'] == 'Limits']
+        self.assertEqual(limits['runs'], 5)
+        self.assertEqual(self.metrics(limits)['api_ms'], (200, 5000))
+
+
+class DeadlineSweepTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        course = models.Class.objects.create(title='Geometry', professor=professor)
+        now = timezone.now()
+        cls.past_set = models.ProblemSet.objects.create(course=course, title='Past', due_at=now - timedelta(hours=1))
+        cls.open_set = models.ProblemSet.objects.create(course=course, title='Open', due_at=now + timedelta(days=1))
+        cls.drafts = {}
+        for problem_set in (cls.past_set, cls.open_set):
+            problem = models.Problem.objects.create(problem_set=problem_set, title='P1', prompt_pdf='p.pdf')
+            models.Rubric.objects.create(problem=problem)
+            for idx, with_file in enumerate((True, True, False)):
+                student = User.objects.create_user(f'{problem_set.title}{idx}', f'{problem_set.title}{idx}@example.edu', 'pw')
+                models.Enrollment.objects.get_or_create(course=course, user=student)
+                draft = models.Submission.objects.create(problem=problem, student=student)
+                if with_file:
+                    models.SubmissionFile.objects.create(submission=draft, file='submissions/page.png')
+                cls.drafts[problem_set.title, idx] = draft
+
+    def test_sweep_finalizes_overdue_drafts_with_files_once(self):
+        self.assertEqual(services.sweep_overdue_drafts(batch_size=1), 2)
+        statuses = dict(
+            models.Submission.objects.filter(id__in=[draft.id for draft in self.drafts.values()]).values_list('id', 'status')
+        )
+        self.assertEqual(
+            {key: statuses[draft.id] for key, draft in self.drafts.items()},
+            {
+                ('Past', 0): models.Submission.STATUS_SUBMITTED,
+                ('Past', 1): models.Submission.STATUS_SUBMITTED,
+                ('Past', 2): models.Submission.STATUS_DRAFT,  # nothing uploaded
+                ('Open', 0): models.Submission.STATUS_DRAFT,
+                ('Open', 1): models.Submission.STATUS_DRAFT,
+                ('Open', 2): models.Submission.STATUS_DRAFT,
+            },
+        )
+        self.assertEqual(
+            set(services.active_grading_jobs().values_list('submission_id', flat=True)),
+            {self.drafts['Past', 0].id, self.drafts['Past', 1].id},
+        )
+        self.assertEqual(models.ProblemSetStats.objects.get(problem_set=self.past_set).submission_count, 2)
+
+        out = io.StringIO()
+        call_command('sweep_deadlines', '--once', stdout=out)
+        self.assertIn('Finalized 0 overdue draft(s).', out.getvalue())
+        self.assertEqual(services.active_grading_jobs().count(), 2)
+
+    def test_draft_finalized_during_the_sweep_is_counted_once(self):
+        overdue_drafts = services.overdue_drafts
+
+        def stale_read(now):
+            ids = list(overdue_drafts(now).values_list('id', flat=True))
+            # The student finalizes between the sweeper's read and its UPDATE.
+            self.assertTrue(services.finalize_submission(self.drafts['Past', 0]))
+            return models.Submission.objects.filter(id__in=ids)
+
+        with mock.patch.object(services, 'overdue_drafts', side_effect=stale_read):
+            self.assertEqual(services.sweep_overdue_drafts(), 1)
+        self.assertEqual(models.ProblemSetStats.objects.get(problem_set=self.past_set).submission_count, 2)
+        self.assertEqual(
+            set(services.active_grading_jobs().values_list('submission_id', flat=True)),
+            {self.drafts['Past', 0].id, self.drafts['Past', 1].id},
+        )
+
+
+class BenchQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        professor = User.objects.create_user('prof', 'prof@example.edu', 'pw', is_staff=True)
+        course = models.Class.objects.create(title='Statistics', professor=professor)
+        problem_set = models.ProblemSet.objects.create(course=course, title='PS 1', due_at=timezone.now())
+        students = [User.objects.create_user(f's{idx}', f's{idx}@example.edu', 'pw') for idx in range(6)]
+        for problem_idx in range(10):
+            problem = models.Problem.objects.create(problem_set=problem_set, title=f'P{problem_idx}', prompt_pdf='p.pdf')
+            for student in students:
+                submission = models.Submission.objects.create(problem=problem, student=student)
+                models.Grade.objects.bulk_create(
+                    models.Grade(submission=submission, score=score, grader_type=models.Grade.GRADER_AUTO) for score in (4, 8)
+                )
+
+    def test_sample_covers_fifty_distinct_submissions(self):
+        from core.management.commands import bench_queries
+
+        queries = bench_queries.hot_queries()
+        self.assertEqual(len({grade.submission_id for grade in queries['best_grades']}), 50)
+        out = io.StringIO()
+        call_command('bench_queries', '--repeat', '1', '--no-plan', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), len(queries))
+
+    def test_compare_plans_each_query_without_its_index(self):
+        out = io.StringIO()
+        call_command('bench_queries', 'best_grades', '--repeat', '1', '--compare', stdout=out)
+        output = out.getvalue()
+        self.assertIn('without indexes: median', output)
+        without, with_indexes = output.split('plan without indexes:')[1].split('plan with indexes:')
+        self.assertNotIn('grade_best_idx', without)
+        self.assertIn('grade_best_idx', with_indexes)
+        # The dropped indexes were restored by the rollback.
+        out = io.StringIO()
+        call_command('bench_queries', 'best_grades', '--repeat', '1', stdout=out)
+        self.assertIn('grade_best_idx', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='dydx-test-media-'))
+class SeedScaleTests(TestCase):
+    def seed(self, prefix):
+        call_command(
+            'seed_scale', '--prefix', prefix, '--professors', '1', '--classes-per-professor', '1',
+            '--problem-sets-per-class', '2', '--problems-per-set', '2', '--students', '6',
+            '--students-per-class', '6', '--pool-size', '3', stdout=io.StringIO(),
+        )
+        submissions = models.Submission.objects.filter(student__username__startswith=f'{prefix}-').order_by('id')
+        files = models.SubmissionFile.objects.filter(submission__in=submissions).order_by('id')
+        return {
+            'problem_sets': list(
+                models.ProblemSet.objects.filter(course__professor__username__startswith=f'{prefix}-')
+                .order_by('id').values_list('release_at', 'due_at')
+            ),
+            'prompts': list(
+                models.Problem.objects.filter(problem_set__course__professor__username__startswith=f'{prefix}-')
+                .order_by('id').values_list('prompt_sha256', flat=True)
+            ),
+            'submissions': [
+                (username.split('-', 1)[1], status, final_score, submitted_at)
+                for username, status, final_score, submitted_at in submissions.values_list(
+                    'student__username', 'status', 'final_score', 'submitted_at'
+                )
+            ],
+            # The storage suffixes names it has seen before; the pool entry is the part before it.
+            'files': [re.sub(r'_\w{7}\.png$', '.png', name) for name in files.values_list('file', flat=True)],
+        }
+
+    def test_same_options_seed_the_same_rows(self):
+        first = self.seed('a')
+        second = self.seed('b')
+        self.assertTrue(first['submissions'])
+        self.assertEqual(first, second)
+        self.assertEqual(first['problem_sets'][0][1].date().isoformat(), '2025-12-29')
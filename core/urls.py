@@ -15,10 +15,13 @@ urlpatterns = [
     path('prof/classes/new/', views.class_create, name='class_create'),
     path('prof/classes/<int:class_id>/', views.class_detail, name='class_detail'),
     path('prof/classes/<int:class_id>/enroll/', views.enrollment_add, name='enrollment_add'),
+    path('prof/classes/<int:class_id>/roster/', views.roster_upload, name='roster_upload'),
+    path('prof/classes/<int:class_id>/gradebook/', views.gradebook_export, name='gradebook_export'),
     path('prof/classes/<int:class_id>/problem-sets/new/', views.problem_set_create, name='problem_set_create'),
     path('prof/problem-sets/<int:problem_set_id>/', views.problem_set_detail, name='problem_set_detail'),
     path('prof/problem-sets/<int:problem_set_id>/problems/new/', views.problem_create, name='problem_create'),
     path('prof/problem-sets/<int:problem_set_id>/submissions/', views.submission_list, name='submission_list'),
+    path('prof/problem-sets/<int:problem_set_id>/submissions/grade-all/', views.submission_grade_all, name='submission_grade_all'),
     path('prof/problems/<int:problem_id>/', views.problem_detail, name='problem_detail'),
     path('prof/problems/<int:problem_id>/delete/', views.problem_delete, name='problem_delete'),
     path('prof/problems/<int:problem_id>/prompt-preview/', views.problem_prompt_preview, name='problem_prompt_preview'),
@@ -26,6 +29,7 @@ urlpatterns = [
     path('prof/problems/<int:problem_id>/rubric/regenerate/', views.rubric_regenerate, name='rubric_regenerate'),
     path('prof/submissions/<int:submission_id>/', views.submission_detail, name='submission_detail'),
     path('prof/appeals/', views.appeals_list, name='appeals_list'),
+    path('prof/grading-stats/', views.grading_stats, name='grading_stats'),
     path('prof/appeals/<int:appeal_id>/', views.appeal_detail, name='appeal_detail'),
 
     # Student routes
@@ -1,14 +1,15 @@
-from io import BytesIO
-
 from django.contrib.auth import get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Avg
-from django.http import Http404, HttpResponse
+from django.db.models import Count, Prefetch
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.core.files.storage import default_storage
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
-from . import forms, models, services
+from . import forms, gradebook, models, roster, services, stats
 from .decorators import professor_required, student_required
 from django.contrib.auth.forms import PasswordChangeForm
 
@@ -23,31 +24,28 @@ def dashboard(request):
 @professor_required
 def professor_dashboard(request):
     classes = models.Class.objects.filter(professor=request.user)
+    problem_sets = list(models.ProblemSet.objects.filter(course__professor=request.user).select_related('stats'))
+    ps_stats_by_id = stats.stats_for(problem_sets)
+    ps_by_course = {}
+    for ps in problem_sets:
+        ps_by_course.setdefault(ps.course_id, []).append(ps)
+
     class_cards = []
     for course in classes:
-        enrollments = course.enrollments.count()
-        problem_sets = course.problem_sets.prefetch_related('problems')
         ps_stats = []
-        for ps in problem_sets:
-            problem_count = ps.problems.count()
-            expected = enrollments * problem_count if problem_count else 0
-            submitted = models.Submission.objects.filter(problem__problem_set=ps).count()
-            percent = round((submitted / expected) * 100, 1) if expected else 0
-            avg_score = models.Submission.objects.filter(problem__problem_set=ps).aggregate(
-                avg=Avg('final_score')
-            )['avg']
+        for ps in ps_by_course.get(course.id, []):
             ps_stats.append(
                 {
                     'id': ps.id,
                     'title': ps.title,
                     'due_at': ps.due_at,
-                    'percent': percent,
-                    'avg_score': avg_score,
+                    'percent': ps_stats_by_id[ps.id].completion_percent,
+                    'avg_score': ps_stats_by_id[ps.id].mean_score,
                 }
             )
         class_cards.append({'course': course, 'problem_sets': ps_stats})
 
-    appeals_open = models.Appeal.objects.filter(status=models.Appeal.STATUS_OPEN).count()
+    appeals_open = sum(row.open_appeals for row in ps_stats_by_id.values())
 
     context = {
         'class_cards': class_cards,
@@ -189,6 +187,49 @@ def enrollment_add(request, class_id: int):
     return render(request, 'professor/enrollment_add.html', {'course': course})
 
 
+@professor_required
+def roster_upload(request, class_id: int):
+    course = get_object_or_404(models.Class, id=class_id, professor=request.user)
+    report = None
+    error = None
+    if request.method == 'POST':
+        form = forms.RosterUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                text = form.cleaned_data['roster'].read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                text = None
+                error = 'The roster must be a UTF-8 CSV file.'
+            if text is not None:
+                try:
+                    report = roster.import_roster_csv(
+                        course,
+                        text,
+                        create_missing=form.cleaned_data['create_missing'],
+                        drop_unlisted=form.cleaned_data['drop_unlisted'],
+                    )
+                except roster.RosterError as exc:
+                    error = str(exc)
+    else:
+        form = forms.RosterUploadForm()
+    return render(
+        request,
+        'professor/roster_upload.html',
+        {'course': course, 'form': form, 'report': report, 'error': error},
+    )
+
+
+@professor_required
+def gradebook_export(request, class_id: int):
+    course = get_object_or_404(models.Class, id=class_id, professor=request.user)
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in gradebook.FORMATS:
+        raise Http404('Unknown export format')
+    response = StreamingHttpResponse(gradebook.stream(course, fmt), content_type=gradebook.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{gradebook.filename(course, fmt)}"'
+    return response
+
+
 @professor_required
 def problem_set_create(request, class_id: int):
     course = get_object_or_404(models.Class, id=class_id, professor=request.user)
@@ -222,6 +263,7 @@ def problem_create(request, problem_set_id: int):
             problem.problem_set = ps
             problem.save()
             try:
+                services.render_prompt_pages(problem)
                 services.infer_default_rubric(problem, version=1)
                 return redirect('problem_detail', problem_id=problem.id)
             except Exception as exc:
@@ -233,7 +275,11 @@ def problem_create(request, problem_set_id: int):
 
 @professor_required
 def problem_detail(request, problem_id: int):
-    problem = get_object_or_404(models.Problem, id=problem_id, problem_set__course__professor=request.user)
+    problem = get_object_or_404(
+        models.Problem.objects.select_related('problem_set__course'),
+        id=problem_id,
+        problem_set__course__professor=request.user,
+    )
     rubric = services.get_active_rubric(problem)
     submissions = (
         models.Submission.objects.filter(problem=problem)
@@ -250,36 +296,62 @@ def problem_detail(request, problem_id: int):
 
 @login_required
 def problem_prompt_preview(request, problem_id: int):
-    problem = get_object_or_404(models.Problem, id=problem_id)
+    problem = get_object_or_404(models.Problem.objects.select_related('problem_set__course'), id=problem_id)
     if request.user.is_staff:
         if problem.problem_set.course.professor_id != request.user.id:
             raise Http404('Not found')
     else:
-        if not models.Enrollment.objects.filter(course=problem.problem_set.course, user=request.user).exists():
+        if not models.Enrollment.objects.filter(course_id=problem.problem_set.course_id, user=request.user).exists():
             raise Http404('Not found')
     if not problem.prompt_pdf:
         raise Http404('No prompt PDF')
+    size = request.GET.get('size', 'full')
     try:
-        import pypdfium2 as pdfium
-    except ImportError as exc:
-        raise Http404('PDF preview unavailable') from exc
-
-    try:
-        pdf = pdfium.PdfDocument(problem.prompt_pdf.path)
-    except FileNotFoundError:
-        raise Http404('Prompt PDF not found on server')
-    if len(pdf) < 1:
-        raise Http404('PDF has no pages')
-    page = pdf[0]
-    image = page.render(scale=2).to_pil()
-    buffer = BytesIO()
-    image.save(buffer, format='PNG')
-    return HttpResponse(buffer.getvalue(), content_type='image/png')
+        page_number = int(request.GET.get('page', '1'))
+    except ValueError:
+        raise Http404('Unknown page')
+    if page_number < 1 or size not in services.PROMPT_PREVIEW_SIZES:
+        raise Http404('Unknown preview')
+    if not problem.prompt_sha256:
+        # Rendering belongs to the upload and `render_prompts`, never to a page view.
+        raise Http404('Prompt not rendered yet')
+
+    # Links carry ?v=<hash prefix>, so a matching URL can never change content; other
+    # requests may be stored but are revalidated, which the ETag answers without storage I/O.
+    etag = f'"{problem.prompt_sha256[:16]}-{page_number}-{size}"'
+    versioned = request.GET.get('v') == problem.prompt_sha256[:12]
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'private, max-age=31536000, immutable' if versioned else 'private, no-cache',
+    }
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            name = services.prompt_preview(problem, page_number, size)
+        except models.ProblemPromptPage.DoesNotExist:
+            raise Http404('No such page')
+        except services.PromptNotRendered:
+            raise Http404('Prompt not rendered yet')
+        try:
+            modified = int(default_storage.get_modified_time(name).timestamp())
+            headers['Last-Modified'] = http_date(modified)
+        except NotImplementedError:
+            modified = None
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = FileResponse(default_storage.open(name, 'rb'), content_type='image/png')
+    for header, value in headers.items():
+        response[header] = value
+    return response
 
 
 @professor_required
 def problem_delete(request, problem_id: int):
-    problem = get_object_or_404(models.Problem, id=problem_id, problem_set__course__professor=request.user)
+    problem = get_object_or_404(
+        models.Problem.objects.select_related('problem_set__course'),
+        id=problem_id,
+        problem_set__course__professor=request.user,
+    )
     if request.method == 'POST':
         problem_set_id = problem.problem_set_id
         problem.delete()
@@ -289,7 +361,11 @@ def problem_delete(request, problem_id: int):
 
 @professor_required
 def rubric_regenerate(request, problem_id: int):
-    problem = get_object_or_404(models.Problem, id=problem_id, problem_set__course__professor=request.user)
+    problem = get_object_or_404(
+        models.Problem.objects.select_related('problem_set__course'),
+        id=problem_id,
+        problem_set__course__professor=request.user,
+    )
     if request.method != 'POST':
         return redirect('problem_detail', problem_id=problem.id)
 
@@ -312,7 +388,11 @@ def rubric_regenerate(request, problem_id: int):
 
 @professor_required
 def rubric_edit(request, problem_id: int):
-    problem = get_object_or_404(models.Problem, id=problem_id, problem_set__course__professor=request.user)
+    problem = get_object_or_404(
+        models.Problem.objects.select_related('problem_set__course'),
+        id=problem_id,
+        problem_set__course__professor=request.user,
+    )
     rubric = services.get_active_rubric(problem)
     if rubric is None:
         raise Http404('Rubric not found')
@@ -349,25 +429,19 @@ def student_class_detail(request, class_id: int):
 
 @student_required
 def student_problem_set_detail(request, problem_set_id: int):
-    ps = get_object_or_404(models.ProblemSet, id=problem_set_id, course__enrollments__user=request.user)
+    ps = get_object_or_404(
+        models.ProblemSet.objects.select_related('course'),
+        id=problem_set_id,
+        course__enrollments__user=request.user,
+    )
     problems = ps.problems.all()
     submissions = {
         s.problem_id: s
         for s in models.Submission.objects.filter(student=request.user, problem__problem_set=ps)
     }
-    if ps.due_at and timezone.now() > ps.due_at:
-        for submission in submissions.values():
-            if submission.status == models.Submission.STATUS_DRAFT and submission.files.exists():
-                services.finalize_submission(submission)
     rows = []
     for problem in problems:
         submission = submissions.get(problem.id)
-        if submission:
-            latest_grade = submission.grades.order_by('-score', '-finalized_at', '-id').first()
-            if latest_grade:
-                submission.final_score = latest_grade.score
-                submission.status = models.Submission.STATUS_GRADED
-                submission.save(update_fields=['final_score', 'status'])
         rows.append(
             {
                 'problem': problem,
@@ -384,18 +458,33 @@ def student_problem_set_detail(request, problem_set_id: int):
 
 @student_required
 def student_problem_detail(request, problem_id: int):
-    problem = get_object_or_404(models.Problem, id=problem_id, problem_set__course__enrollments__user=request.user)
-    submission = models.Submission.objects.filter(problem=problem, student=request.user).first()
+    problem = get_object_or_404(
+        models.Problem.objects.select_related('problem_set__course'),
+        id=problem_id,
+        problem_set__course__enrollments__user=request.user,
+    )
+    submission = (
+        models.Submission.objects.filter(problem=problem, student=request.user)
+        .select_related('best_grade', 'latest_autograde')
+        .first()
+    )
     rubric = None
     if submission and submission.status != models.Submission.STATUS_DRAFT:
         rubric = services.get_active_rubric(problem)
     grade = None
     rubric_breakdown = None
+    grading_pending = False
+    regrade_blocked = ''
     if submission:
-        grade = submission.grades.order_by('-finalized_at', '-id').first()
-        autograde = submission.autograde_runs.order_by('-created_at', '-id').first()
+        grading_pending = submission.grading_jobs.filter(
+            status__in=[models.GradingJob.STATUS_QUEUED, models.GradingJob.STATUS_RUNNING]
+        ).exists()
+        if not grading_pending:
+            regrade_blocked = services.regrade_block_reason(submission)
+        grade = submission.best_grade
+        autograde = submission.latest_autograde
         if autograde:
-            rubric_breakdown = (autograde.raw_output_json or {}).get('parsed', {}).get('rubric_scores')
+            rubric_breakdown = ((autograde.raw_output_json or {}).get('parsed') or {}).get('rubric_scores')
     return render(
         request,
         'student/problem_detail.html',
@@ -406,6 +495,8 @@ def student_problem_detail(request, problem_id: int):
             'files': submission.files.all() if submission else [],
             'grade': grade,
             'rubric_breakdown': rubric_breakdown,
+            'grading_pending': grading_pending,
+            'regrade_blocked': regrade_blocked,
             'can_edit': submission is None or submission.status == models.Submission.STATUS_DRAFT,
         },
     )
@@ -422,23 +513,24 @@ def student_regrade(request, submission_id: int):
     if rubric is None:
         return redirect('student_problem_detail', problem_id=submission.problem_id)
 
-    services.run_autograde_openai(submission, rubric)
-    best = submission.grades.order_by('-score', '-finalized_at', '-id').first()
-    if best:
-        submission.final_score = best.score
-        submission.status = models.Submission.STATUS_GRADED
-        submission.save(update_fields=['final_score', 'status'])
+    try:
+        services.request_regrade(submission, rubric)
+    except services.RegradeNotAllowed:
+        # The detail page explains why the regrade button is unavailable.
+        pass
     return redirect('student_problem_detail', problem_id=submission.problem_id)
 
 
 @student_required
 def submission_upload(request, problem_id: int):
-    problem = get_object_or_404(models.Problem, id=problem_id, problem_set__course__enrollments__user=request.user)
+    problem = get_object_or_404(
+        models.Problem.objects.select_related('problem_set__course'),
+        id=problem_id,
+        problem_set__course__enrollments__user=request.user,
+    )
     due_at = problem.problem_set.due_at
     if due_at and timezone.now() > due_at:
-        submission = models.Submission.objects.filter(problem=problem, student=request.user).first()
-        if submission and submission.status == models.Submission.STATUS_DRAFT and submission.files.exists():
-            services.finalize_submission(submission)
+        # Drafts left at the deadline are finalized by `manage.py sweep_deadlines`.
         return render(request, 'student/submission_closed.html', {'problem': problem})
 
     submission, _ = models.Submission.objects.get_or_create(problem=problem, student=request.user)
@@ -479,8 +571,6 @@ def submission_finalize(request, submission_id: int):
     submission = get_object_or_404(models.Submission, id=submission_id, student=request.user)
     due_at = submission.problem.problem_set.due_at
     if due_at and timezone.now() > due_at:
-        if submission.status == models.Submission.STATUS_DRAFT and submission.files.exists():
-            services.finalize_submission(submission)
         return redirect('student_problem_set_detail', problem_set_id=submission.problem.problem_set_id)
 
     if submission.status != models.Submission.STATUS_DRAFT:
@@ -513,13 +603,53 @@ def submission_list(request, problem_set_id: int):
         .select_related('problem', 'student')
         .order_by('problem__order', 'student__email')
     )
-    return render(request, 'professor/submission_list.html', {'problem_set': ps, 'submissions': submissions})
+    job_counts = dict(
+        models.GradingJob.objects.filter(submission__problem__problem_set=ps)
+        .exclude(status=models.GradingJob.STATUS_DONE)
+        .values_list('status')
+        .annotate(count=Count('id'))
+    )
+    return render(
+        request,
+        'professor/submission_list.html',
+        {
+            'problem_set': ps,
+            'stats': stats.stats_for([ps], median=True)[ps.id],
+            'submissions': submissions,
+            'jobs_queued': job_counts.get(models.GradingJob.STATUS_QUEUED, 0),
+            'jobs_running': job_counts.get(models.GradingJob.STATUS_RUNNING, 0),
+            'jobs_failed': job_counts.get(models.GradingJob.STATUS_FAILED, 0),
+        },
+    )
+
+
+@professor_required
+def grading_stats(request):
+    try:
+        days = max(1, int(request.GET.get('days', 30)))
+    except ValueError:
+        days = 30
+    runs = models.AutoGradeRun.objects.filter(submission__problem__problem_set__course__professor=request.user)
+    telemetry = services.grading_telemetry(runs, days=days)
+    return render(
+        request,
+        'professor/grading_stats.html',
+        {'days': days, 'metric_names': services.GRADING_TELEMETRY_METRICS, **telemetry},
+    )
+
+
+@professor_required
+def submission_grade_all(request, problem_set_id: int):
+    ps = get_object_or_404(models.ProblemSet, id=problem_set_id, course__professor=request.user)
+    if request.method == 'POST':
+        services.enqueue_problem_set_grading(ps, use_cache=not request.POST.get('fresh'))
+    return redirect('submission_list', problem_set_id=ps.id)
 
 
 @professor_required
 def submission_detail(request, submission_id: int):
     submission = get_object_or_404(
-        models.Submission,
+        models.Submission.objects.select_related('problem__problem_set__course', 'student'),
         id=submission_id,
         problem__problem_set__course__professor=request.user,
     )
@@ -535,10 +665,7 @@ def submission_detail(request, submission_id: int):
             grade.rubric = rubric
             grade.grader_type = models.Grade.GRADER_PROFESSOR
             grade.grader = request.user
-            grade.save()
-            submission.final_score = grade.score
-            submission.status = models.Submission.STATUS_GRADED
-            submission.save(update_fields=['final_score', 'status'])
+            services.save_grade(grade)
             return redirect('submission_detail', submission_id=submission.id)
 
     return render(
@@ -555,7 +682,11 @@ def submission_detail(request, submission_id: int):
 
 @student_required
 def appeal_create(request, submission_id: int):
-    submission = get_object_or_404(models.Submission, id=submission_id, student=request.user)
+    submission = get_object_or_404(
+        models.Submission.objects.select_related('problem__problem_set__course'),
+        id=submission_id,
+        student=request.user,
+    )
     if request.method == 'POST':
         form = forms.AppealForm(request.POST)
         if form.is_valid():
@@ -571,14 +702,20 @@ def appeal_create(request, submission_id: int):
 
 @professor_required
 def appeals_list(request):
-    appeals = models.Appeal.objects.filter(submission__problem__problem_set__course__professor=request.user).order_by('-created_at')
+    appeals = (
+        models.Appeal.objects.filter(submission__problem__problem_set__course__professor=request.user)
+        .select_related('submission__problem', 'student')
+        .order_by('-created_at')
+    )
     return render(request, 'professor/appeals_list.html', {'appeals': appeals})
 
 
 @professor_required
 def appeal_detail(request, appeal_id: int):
     appeal = get_object_or_404(
-        models.Appeal,
+        models.Appeal.objects.select_related('submission__problem', 'student').prefetch_related(
+            Prefetch('messages', queryset=models.AppealMessage.objects.select_related('author'))
+        ),
         id=appeal_id,
         submission__problem__problem_set__course__professor=request.user,
     )